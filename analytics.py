@@ -0,0 +1,335 @@
+"""
+Per-device health analytics over the logs table.
+
+    python analytics.py [--device Weighing] [--window-days 30]
+
+Measured values are folded, ANALYTICS_CHUNK_ROWS at a time and fully
+vectorized, into daily sums per device (analytics_buckets) and per check
+weight (analytics_checks). analytics_state remembers the last logs.id
+folded in, so a run only reads rows added since the previous one; the
+reports themselves only touch the daily sums.
+
+Drift, outliers and repeatability are judged on check-weight readings
+only (their deviation from the nominal), since the mix of items measured
+shifts the plain readings without anything being wrong with the
+instrument. Mean and stddev over all readings are informational.
+"""
+import time
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+
+from config import (DBFILE, ANALYTICS_INTERVAL_S, ANALYTICS_CHUNK_ROWS, ANALYTICS_WINDOW_DAYS,
+                    ANALYTICS_ROLLING_DAYS, ANALYTICS_MIN_ROWS, ANALYTICS_Z_LIMIT, ANALYTICS_LIMITS,
+                    ANALYTICS_CHECK_WEIGHTS)
+from db import DB_WRITE_LOCK
+from tracing import traced
+
+DAY_S = 86400.0
+LEVELS = ("unknown", "ok", "warn", "alert")
+
+UPSERT_BUCKET_SQL = """
+    INSERT INTO analytics_buckets (device, day, n, s1, s2) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(device, day) DO UPDATE SET
+        n = n + excluded.n, s1 = s1 + excluded.s1, s2 = s2 + excluded.s2
+"""
+UPSERT_CHECK_SQL = """
+    INSERT INTO analytics_checks (device, nominal, day, n, s1, s2, st, stt, stv, outliers)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(device, nominal, day) DO UPDATE SET
+        n = n + excluded.n, s1 = s1 + excluded.s1, s2 = s2 + excluded.s2, st = st + excluded.st,
+        stt = stt + excluded.stt, stv = stv + excluded.stv, outliers = outliers + excluded.outliers
+"""
+SET_STATE_SQL = "INSERT OR REPLACE INTO analytics_state (key, value) VALUES (?, ?)"
+
+def _grouped(keys, *columns):
+    """(unique keys, per-key count, per-key sum of each column), all vectorized."""
+    uniq, inv = np.unique(keys, return_inverse=True)
+    return uniq, np.bincount(inv), [np.bincount(inv, weights=c, minlength=len(uniq)) for c in columns]
+
+def _std(n, s1, s2):
+    m = s1 / n
+    return float(np.sqrt(max(s2 / n - m * m, 0.0) * n / (n - 1)))
+
+def _level(value, limits):
+    if value is None or limits is None:
+        return "ok"
+    warn, alert = limits
+    return "alert" if value > alert else "warn" if value > warn else "ok"
+
+class DeviceHealth:
+    """
+    One device's report over the analysis window; `status` is one of LEVELS.
+    Drift, outliers and repeatability come from check-weight readings; the
+    all-readings mean/std are for information and never set the status.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.n = 0                      # all readings
+        self.mean = None
+        self.std = None
+        self.rolling_mean = None        # over the last ANALYTICS_ROLLING_DAYS
+        self.rolling_std = None
+        self.checks = 0                 # check-weight readings
+        self.drift_per_day = None       # of the check weight drifting most
+        self.drift_sigma = None
+        self.drift_nominal = None
+        self.outlier_rate = None
+        self.repeatability = {}         # nominal -> stddev
+        self.status = "unknown"
+        self.reason = None              # metric behind a warn/alert
+
+    def summary(self):
+        info = f"all readings n={self.n}" + (f" mean={self.mean:.6g} sd={self.std:.3g}" if self.std is not None else "")
+        if self.status == "unknown":
+            return f"{self.device}: not enough check-weight readings ({self.checks}); {info}"
+        text = (f"{self.device}: {self.status.upper()} checks={self.checks}"
+                f" drift={self.drift_per_day:+.3g}/day at {self.drift_nominal:g} ({self.drift_sigma:.2f} sd)"
+                f" outliers={self.outlier_rate:.2%}")
+        for nominal, sd in sorted(self.repeatability.items()):
+            text += f" check {nominal:g}: sd={sd:.3g}"
+        return f"{text}; {info}"
+
+class HealthAnalytics:
+    def __init__(self, path=DBFILE, chunk_rows=ANALYTICS_CHUNK_ROWS, window_days=ANALYTICS_WINDOW_DAYS,
+                 check_weights=ANALYTICS_CHECK_WEIGHTS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.window_days = window_days
+        self.check_weights = check_weights
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _baseline(self, conn, device, nominal, first_day):
+        """(mean, std) of a check weight's deviations over the window before first_day."""
+        n, s1, s2 = conn.execute(
+            "SELECT SUM(n), SUM(s1), SUM(s2) FROM analytics_checks WHERE device = ? AND nominal = ?"
+            " AND day >= ? AND day < ?", (device, nominal, first_day - self.window_days, first_day)).fetchone()
+        if not n or n < ANALYTICS_MIN_ROWS:
+            return None
+        std = _std(n, s1, s2)
+        return (s1 / n, std) if std > 0 else None
+
+    def _fold(self, conn, refs, rows):
+        buckets, checks, new_refs = [], [], []
+        chunk = np.array(rows, dtype=[("device", object), ("ts", float), ("value", float)])
+        # Small integer codes instead of sorting device names as Python objects
+        names = {}
+        codes = np.fromiter((names.setdefault(d, len(names)) for d in chunk["device"]), np.int64, len(chunk))
+        for device, code in names.items():
+            mask = codes == code
+            v, t = chunk["value"][mask], chunk["ts"][mask]
+            ref = refs.get(device)
+            if ref is None:
+                # Sums are kept relative to a per-device reference value, so that
+                # variance stays accurate on instruments reading far from zero
+                ref = refs[device] = float(v[0])
+                new_refs.append((f"ref:{device}", ref))
+            x = v - ref
+            day = np.floor(t / DAY_S).astype(np.int64)
+            days, n, (s1, s2) = _grouped(day, x, x * x)
+            buckets += zip([device] * len(days), days.tolist(), n.tolist(), s1.tolist(), s2.tolist())
+            cfg = self.check_weights.get(device)
+            if not cfg:
+                continue
+            nominals = np.asarray(cfg["nominals"], float)
+            nearest = np.abs(v[:, None] - nominals[None, :]).argmin(axis=1)
+            hit = np.abs(v - nominals[nearest]) <= cfg["tolerance"] * nominals[nearest]
+            if not hit.any():
+                continue
+            nearest, day, t = nearest[hit], day[hit], t[hit]
+            dev = v[hit] - nominals[nearest]
+            dt = t / DAY_S - day
+            outlier = np.zeros(len(dev), bool)
+            for i in np.unique(nearest):
+                base = self._baseline(conn, device, float(nominals[i]), int(day.min()))
+                if base:
+                    mask = nearest == i
+                    outlier[mask] = np.abs(dev[mask] - base[0]) > ANALYTICS_Z_LIMIT * base[1]
+            key = nearest * (1 << 32) + day
+            keys, n, (s1, s2, st, stt, stv, out) = _grouped(key, dev, dev * dev, dt, dt * dt, dt * dev, outlier)
+            checks += zip([device] * len(keys), nominals[keys >> 32].tolist(), (keys & 0xFFFFFFFF).tolist(),
+                          n.tolist(), s1.tolist(), s2.tolist(), st.tolist(), stt.tolist(), stv.tolist(),
+                          out.astype(np.int64).tolist())
+        return buckets, checks, new_refs
+
+    @traced("analytics.update", "analytics")
+    def update(self, progress=None):
+        """Fold logs rows added since the last run into the daily sums; returns the number of rows read."""
+        conn = self._connect()
+        try:
+            state = dict(conn.execute("SELECT key, value FROM analytics_state"))
+            last_id = int(state.get("last_id", 0))
+            refs = {k[4:]: v for k, v in state.items() if k.startswith("ref:")}
+            max_id = conn.execute("SELECT MAX(id) FROM logs").fetchone()[0] or 0
+            total = 0
+            # Walk rowid ranges rather than LIMIT pages: no id column to fetch, no sort
+            while last_id < max_id:
+                upper = min(last_id + self.chunk_rows, max_id)
+                rows = conn.execute(
+                    "SELECT device, ts, value FROM logs WHERE id > ? AND id <= ? AND value IS NOT NULL"
+                    " AND ts IS NOT NULL AND error IS NULL", (last_id, upper)).fetchall()
+                buckets, checks, new_refs = self._fold(conn, refs, rows) if rows else ([], [], [])
+                last_id = upper
+                with DB_WRITE_LOCK:
+                    conn.executemany(UPSERT_BUCKET_SQL, buckets)
+                    conn.executemany(UPSERT_CHECK_SQL, checks)
+                    conn.executemany(SET_STATE_SQL, new_refs + [("last_id", last_id)])
+                    conn.commit()
+                total += len(rows)
+                if progress:
+                    progress(total)
+            return total
+        finally:
+            conn.close()
+
+    def health(self, conn, device, now=None):
+        """DeviceHealth for `device` over the window ending at `now`."""
+        h = DeviceHealth(device)
+        last_day = int((now or time.time()) // DAY_S)
+        first_day = last_day - self.window_days + 1
+        rows = conn.execute("SELECT day, n, s1, s2 FROM analytics_buckets"
+                            " WHERE device = ? AND day >= ? AND day <= ? ORDER BY day",
+                            (device, first_day, last_day)).fetchall()
+        if rows:
+            day, n, s1, s2 = np.array(rows, float).T
+            h.n = N = int(n.sum())
+            ref = conn.execute("SELECT value FROM analytics_state WHERE key = ?", (f"ref:{device}",)).fetchone()[0]
+            if N > 1:
+                h.mean = ref + s1.sum() / N
+                h.std = _std(N, s1.sum(), s2.sum())
+            # Rolling mean/stddev over the last ANALYTICS_ROLLING_DAYS of daily sums
+            recent = day > last_day - ANALYTICS_ROLLING_DAYS
+            rn = n[recent].sum()
+            if rn > 1:
+                h.rolling_mean = ref + s1[recent].sum() / rn
+                h.rolling_std = _std(rn, s1[recent].sum(), s2[recent].sum())
+
+        cfg = self.check_weights.get(device)
+        if not cfg:
+            return h
+        rows = conn.execute("SELECT nominal, day, n, s1, s2, st, stt, stv, outliers FROM analytics_checks"
+                            " WHERE device = ? AND day >= ? AND day <= ?", (device, first_day, last_day)).fetchall()
+        if not rows:
+            return h
+        nominal, day, n, s1, s2, st, stt, stv, out = np.array(rows, float).T
+        h.checks = int(n.sum())
+        if h.checks < ANALYTICS_MIN_ROWS:
+            return h
+        h.outlier_rate = float(out.sum() / h.checks)
+        h.drift_per_day, h.drift_sigma = 0.0, 0.0
+        for nom in np.unique(nominal):
+            m = nominal == nom
+            cn = n[m].sum()
+            if cn < 2:
+                continue
+            sd = h.repeatability[float(nom)] = _std(cn, s1[m].sum(), s2[m].sum())
+            # Least-squares drift of the deviation over time: times are day offsets
+            # from the window start, rebuilt from each bucket's within-day sums
+            d = day[m] - first_day
+            T1 = (n[m] * d + st[m]).sum()
+            T2 = (n[m] * d * d + 2 * d * st[m] + stt[m]).sum()
+            TV = (d * s1[m] + stv[m]).sum()
+            sxx = T2 - T1 * T1 / cn
+            if sxx <= 0 or sd <= 0:
+                continue
+            slope = float((TV - T1 * s1[m].sum() / cn) / sxx)
+            sigma = abs(slope) * (day[m].max() - day[m].min() + 1) / sd
+            if h.drift_nominal is None or sigma > h.drift_sigma:
+                h.drift_per_day, h.drift_sigma, h.drift_nominal = slope, sigma, float(nom)
+        if h.drift_nominal is None:
+            h.drift_nominal = float(nominal[0])
+
+        levels = {"drift": _level(h.drift_sigma, ANALYTICS_LIMITS.get("drift_sigma")),
+                  "outliers": _level(h.outlier_rate, ANALYTICS_LIMITS.get("outlier_rate"))}
+        if h.repeatability:
+            levels["repeatability"] = _level(max(h.repeatability.values()), cfg.get("repeatability"))
+        h.reason = max(levels, key=lambda k: LEVELS.index(levels[k]))
+        h.status = levels[h.reason]
+        if h.status == "ok":
+            h.reason = None
+        return h
+
+    @traced("analytics.report", "analytics")
+    def report(self, devices=None, now=None):
+        """{device: DeviceHealth} for `devices` (default: every device with data)."""
+        conn = self._connect()
+        try:
+            if devices is None:
+                devices = [r[0] for r in conn.execute("SELECT DISTINCT device FROM analytics_buckets")]
+            return {device: self.health(conn, device, now) for device in devices}
+        finally:
+            conn.close()
+
+class AnalyticsWorker(threading.Thread):
+    """Runs update() + report() every interval_s; listeners get the {device: DeviceHealth} dict."""
+    def __init__(self, analytics=None, interval_s=ANALYTICS_INTERVAL_S):
+        super().__init__(daemon=True, name="Analytics")
+        self.analytics = analytics or HealthAnalytics()
+        self.interval_s = interval_s
+        self.stopped = threading.Event()
+        self.listeners = []
+        self.latest = {}
+
+    def stop(self, timeout=5):
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run_once(self):
+        self.analytics.update()
+        self.latest = self.analytics.report()
+        for listener in list(self.listeners):
+            try:
+                listener(self.latest)
+            except Exception as e:
+                print(f"[ANALYTICS] Listener error: {e}")
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[ANALYTICS] Pass failed: {e}")
+            self.stopped.wait(self.interval_s)
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+def get_analytics():
+    """Return the process-wide AnalyticsWorker, starting it on first use."""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None or not _analytics.is_alive():
+            _analytics = AnalyticsWorker()
+            _analytics.start()
+        return _analytics
+
+def stop_analytics(timeout=5):
+    global _analytics
+    with _analytics_lock:
+        worker, _analytics = _analytics, None
+    if worker is not None:
+        worker.stop(timeout)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drift, repeatability and outlier report per device.")
+    parser.add_argument("--device", action="append", help="only these devices (repeatable)")
+    parser.add_argument("--window-days", type=int, default=ANALYTICS_WINDOW_DAYS)
+    args = parser.parse_args(argv)
+    analytics = HealthAnalytics(window_days=args.window_days)
+    t0 = time.monotonic()
+    rows = analytics.update()
+    t1 = time.monotonic()
+    report = analytics.report(args.device)
+    print(f"[ANALYTICS] {rows:,} new rows folded in {t1 - t0:.2f} s, report in {time.monotonic() - t1:.3f} s")
+    for h in report.values():
+        print(h.summary())
+
+if __name__ == "__main__":
+    main()
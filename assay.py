@@ -0,0 +1,192 @@
+import json
+import time
+import queue
+import datetime
+import itertools
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from config import ASSAY_STAGES, ASSAY_PERSIST_TIMEOUT_S
+from db import get_writer, log_result
+from uploader import enqueue_upload
+
+UPSERT_ASSAY_SQL = """
+    INSERT INTO assays (item_id, created, finished, status, record) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(item_id) DO UPDATE SET
+        finished = excluded.finished,
+        status = excluded.status,
+        record = excluded.record
+"""
+
+class AssayItem:
+    """One gold item and its consolidated readings, stage by stage."""
+    def __init__(self, item_id):
+        self.item_id = item_id
+        self.created = time.time()
+        self.finished = None
+        self.status = "queued"      # queued -> running -> done | failed
+        self.stage = None           # device name of the stage it is in (or waiting for)
+        self.stages = {}            # device -> {"command", "result", "error", "attempts", "started", "finished"}
+
+    def record(self):
+        return {
+            "item_id": self.item_id,
+            "created": datetime.datetime.fromtimestamp(self.created).isoformat(),
+            "finished": datetime.datetime.fromtimestamp(self.finished).isoformat() if self.finished else None,
+            "status": self.status,
+            "stages": self.stages,
+        }
+
+class AssayStage(threading.Thread):
+    """
+    Worker for one instrument. Takes items from its queue one at a time,
+    measures them with retries under a per-attempt deadline and hands
+    them to the next stage, so every instrument works on a different item.
+    """
+    def __init__(self, pipeline, index, device, command="S", timeout_s=3.0, retries=1):
+        super().__init__(daemon=True, name=f"Assay-{device.name}")
+        self.pipeline = pipeline
+        self.index = index
+        self.device = device
+        self.command = command
+        self.timeout_s = timeout_s
+        self.retries = retries
+        self.queue = queue.Queue()
+        self.current = None
+        self.busy_s = 0.0
+
+    def _measure(self, item):
+        entry = {"command": self.command, "result": None, "error": None, "attempts": 0,
+                 "started": time.time(), "finished": None}
+        item.stages[self.device.name] = entry
+        for _ in range(1 + self.retries):
+            entry["attempts"] += 1
+            try:
+                result = self.device.send_command(self.command, deadline_s=self.timeout_s).result(self.timeout_s)
+            except FutureTimeout:
+                result = {"error": f"no result within {self.timeout_s} s"}
+            if isinstance(result, dict) and "error" not in result:
+                entry["result"], entry["error"] = result, None
+                break
+            entry["result"] = result
+            entry["error"] = result.get("error") if isinstance(result, dict) else str(result)
+        entry["finished"] = time.time()
+        self.busy_s += entry["finished"] - entry["started"]
+        return entry["error"] is None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.current = item
+            item.status = "running"
+            self.pipeline._changed(item)
+            ok = self._measure(item)
+            self.current = None
+            self.pipeline._advance(item, self.index, ok)
+
+class AssayPipeline:
+    """
+    Runs items through ASSAY_STAGES (Weighing -> Conductivity -> ... ) as
+    a pipeline: item k+1 can be on the balance while item k is in XRF,
+    so throughput is bounded by the slowest stage, not the sum of stages.
+    Each item's consolidated record is upserted into the assays table
+    after every stage and uploaded once when it finishes.
+    """
+    def __init__(self, devices, stages=ASSAY_STAGES, on_update=None):
+        by_name = {dev.name: dev for dev in devices}
+        self.stages = []
+        for cfg in stages:
+            dev = by_name.get(cfg["device"])
+            if dev is None:
+                print(f"[ASSAY] No device named '{cfg['device']}', stage skipped")
+                continue
+            self.stages.append(AssayStage(self, len(self.stages), dev, cfg.get("command", "S"),
+                                          cfg.get("timeout_s", 3.0), cfg.get("retries", 1)))
+        self.on_update = on_update
+        self.items = {}
+        self.done = 0
+        self.failed = 0
+        self.not_uploaded = 0       # finished items the uploader refused
+        self.unsaved = 0            # record upserts the log writer refused
+        self.started_at = None
+        self._seq = itertools.count(1)
+        self.lock = threading.Lock()
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, item_id=None):
+        """Start a new item through the first stage; returns its AssayItem."""
+        if not self.stages:
+            raise RuntimeError("No assay stages are configured")
+        with self.lock:
+            if item_id is None:
+                item_id = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{next(self._seq):04d}"
+            if item_id in self.items:
+                raise ValueError(f"Item {item_id} is already in the pipeline")
+            item = AssayItem(item_id)
+            self.items[item_id] = item
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+        item.stage = self.stages[0].device.name
+        self._persist(item)
+        self.stages[0].queue.put(item)
+        self._changed(item)
+        return item
+
+    def _advance(self, item, index, ok):
+        if ok and index + 1 < len(self.stages):
+            nxt = self.stages[index + 1]
+            item.stage = nxt.device.name
+            item.status = "queued"
+            self._persist(item)
+            nxt.queue.put(item)
+        else:
+            self._finish(item, "done" if ok else "failed")
+        self._changed(item)
+
+    def _finish(self, item, status):
+        item.status = status
+        item.stage = None
+        item.finished = time.time()
+        with self.lock:
+            self.items.pop(item.item_id, None)
+            if status == "done":
+                self.done += 1
+            else:
+                self.failed += 1
+        self._persist(item)
+        log_result("Assay", item.item_id, item.record(), None if status == "done" else "assay failed")
+        try:
+            enqueue_upload({"type": "assay", **item.record()})
+        except RuntimeError as e:
+            # Keep the stage thread alive; the record is still in the assays table
+            self.not_uploaded += 1
+            print(f"[ASSAY] Item {item.item_id} not queued for upload: {e}")
+
+    def _persist(self, item):
+        row = (item.item_id, item.created, item.finished, item.status, json.dumps(item.record(), default=str))
+        if not get_writer().enqueue(row, sql=UPSERT_ASSAY_SQL, timeout=ASSAY_PERSIST_TIMEOUT_S):
+            self.unsaved += 1
+            print(f"[ASSAY] Record of item {item.item_id} ({item.status}) not saved: log writer queue full")
+
+    def _changed(self, item):
+        if self.on_update:
+            try:
+                self.on_update(item)
+            except Exception as e:
+                print(f"[ASSAY] Update listener error: {e}")
+
+    def in_progress(self):
+        """{stage device name: item id being measured there, or None}"""
+        return {stage.device.name: stage.current.item_id if stage.current else None for stage in self.stages}
+
+    def items_per_hour(self):
+        if self.started_at is None or not self.done:
+            return 0.0
+        return self.done * 3600.0 / max(1e-6, time.monotonic() - self.started_at)
+
+    def stop(self):
+        for stage in self.stages:
+            stage.queue.put(None)
@@ -0,0 +1,93 @@
+"""
+Assay throughput benchmark on the pty simulator.
+
+Each ASSAY_STAGES instrument gets its own answer latency (roughly the
+relative measurement times on the bench: XRF slowest, magnetic fastest).
+The same item count is run one item at a time (how the stations were
+operated by hand) and pipelined through AssayPipeline, and items/hour
+is compared with the bound set by the slowest stage.
+
+    python benchmarks/bench_assay.py [--items 20] [--engine thread]
+        [--latency-ms Weighing=200 Conductivity=150 Magnetic=100 XRF=400 "AI Vision"=250]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+DEFAULT_LATENCY_MS = {"Weighing": 200, "Conductivity": 150, "Magnetic": 100, "XRF": 400, "AI Vision": 250}
+
+def run(engine, items, latency_ms, pipelined):
+    from simulator import SimulatorHub, InstrumentProfile, VirtualInstrument
+    from serial_device import create_devices
+    from assay import AssayPipeline
+
+    hub = SimulatorHub()
+    configs = []
+    for i, stage in enumerate(config.ASSAY_STAGES):
+        profile = InstrumentProfile(latency_ms=latency_ms[stage["device"]], jitter_ms=5)
+        port = hub.add(VirtualInstrument(stage["device"], profile, seed=i))
+        configs.append({"name": stage["device"], "port": port, "baudrate": 115200})
+    hub.start()
+    devices = create_devices(configs, engine=engine)
+    for dev in devices:
+        dev.ready.wait(5)
+
+    finished = threading.Semaphore(0)
+    def on_update(item):
+        if item.status in ("done", "failed"):
+            finished.release()
+
+    pipeline = AssayPipeline(devices, on_update=on_update)
+    t0 = time.perf_counter()
+    for i in range(items):
+        pipeline.submit(f"BENCH-{i:04d}")
+        if not pipelined:
+            finished.acquire()
+    if pipelined:
+        for _ in range(items):
+            finished.acquire()
+    elapsed = time.perf_counter() - t0
+    result = (items * 3600.0 / elapsed, pipeline.done, pipeline.failed)
+
+    pipeline.stop()
+    for dev in devices:
+        dev.close()
+    time.sleep(0.5)
+    hub.close()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--engine", default="thread")
+    parser.add_argument("--latency-ms", nargs="*", default=[],
+                        help="per-instrument answer latency, NAME=MS")
+    args = parser.parse_args()
+    latency_ms = dict(DEFAULT_LATENCY_MS)
+    for spec in args.latency_ms:
+        name, ms = spec.rsplit("=", 1)
+        latency_ms[name] = float(ms)
+
+    bound = 3600.0 / (max(latency_ms[s["device"]] for s in config.ASSAY_STAGES) / 1000.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DBFILE = os.path.join(tmp, "bench.db")
+        import db
+        db.DBFILE = config.DBFILE
+        db.init_db()
+        print(f"{'mode':10} {'items/h':>9} {'done':>5} {'failed':>6}")
+        for mode, pipelined in (("sequential", False), ("pipelined", True)):
+            rate, done, failed = run(args.engine, args.items, latency_ms, pipelined)
+            print(f"{mode:10} {rate:9.0f} {done:5d} {failed:6d}")
+        print(f"{'bound':10} {bound:9.0f}   (slowest stage)")
+        db.close_db()
+
+if __name__ == "__main__":
+    main()
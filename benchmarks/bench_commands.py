@@ -0,0 +1,119 @@
+"""
+Command scheduling benchmark on the pty simulator.
+
+burst     an operator clicks "Check Now" --clicks times in quick succession
+          while a sync poll is queued. Reports how many S actually went to
+          the instruments, the deepest queue seen and how long until every
+          caller had its answer.
+deadline  an S queued behind a slow P with a short deadline must be
+          dropped, not sent late.
+pipeline  S, P and B are issued together to a device configured with
+          pipeline=3; each caller must get the answer to its own command.
+
+    python benchmarks/bench_commands.py [--devices 5] [--engines thread mux]
+        [--latency-ms 50] [--clicks 5]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+def fleet(engine, count, profile, **extra):
+    from simulator import SimulatorHub
+    from serial_device import create_devices
+    hub = SimulatorHub()
+    configs = [dict(cfg, **extra) for cfg in hub.add_fleet(count, profile)]
+    hub.start()
+    devices = create_devices(configs, engine=engine)
+    for dev in devices:
+        dev.ready.wait(5)
+    return hub, devices
+
+def shutdown(hub, devices):
+    for dev in devices:
+        dev.close()
+    time.sleep(0.3)
+    hub.close()
+
+def burst(engine, count, profile, clicks):
+    from serial_device import await_all
+    from scheduler import PRIORITY_SYNC
+    hub, devices = fleet(engine, count, profile)
+    instruments = {dev.name: hub.ports[hub.paths[dev.port]][0] for dev in devices}
+    sent0 = {name: inst.commands for name, inst in instruments.items()}
+    futures = {}
+    max_depth = 0
+    t0 = time.perf_counter()
+    for dev in devices:
+        futures[(dev.name, "sync")] = dev.send_command("P", PRIORITY_SYNC, 3)
+    for click in range(clicks):
+        for dev in devices:
+            futures[(dev.name, click)] = dev.send_command("S")
+            max_depth = max(max_depth, dev.queue_depth())
+        time.sleep(0.01)
+    results = await_all(futures, 10)
+    elapsed = time.perf_counter() - t0
+    sent = sum(inst.commands - sent0[name] for name, inst in instruments.items())
+    answered = sum(1 for key, res in results.items() if key[1] != "sync" and isinstance(res, dict) and "error" not in res)
+    shutdown(hub, devices)
+    return sent, answered, max_depth, elapsed
+
+def deadline(engine, profile):
+    hub, devices = fleet(engine, 1, profile)
+    dev = devices[0]
+    slow = dev.send_command("P")
+    stale = dev.send_command("S", deadline_s=profile.latency_ms / 4000)
+    slow.result(5)
+    res = stale.result(5)
+    shutdown(hub, devices)
+    return res
+
+def pipeline(engine, profile):
+    hub, devices = fleet(engine, 1, profile, pipeline=3)
+    dev = devices[0]
+    futures = {cmd: dev.send_command(cmd) for cmd in ("S", "P", "B")}
+    res = {cmd: fut.result(5) for cmd, fut in futures.items()}
+    shutdown(hub, devices)
+    ok = ("weight_display" in res["S"] and isinstance(res["P"], dict) and "device" in res["P"]
+          and res["B"].get("available") is True)
+    return ok, res
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=5)
+    parser.add_argument("--engines", nargs="*", default=["thread", "mux"])
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--clicks", type=int, default=5)
+    args = parser.parse_args()
+
+    from simulator import InstrumentProfile
+    profile = InstrumentProfile(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DBFILE = os.path.join(tmp, "bench.db")
+        import db
+        db.DBFILE = config.DBFILE
+        db.init_db()
+        for engine in args.engines:
+            sent, answered, depth, elapsed = burst(engine, args.devices, profile, args.clicks)
+            requested = args.devices * (args.clicks + 1)
+            print(f"{engine:6} burst     {requested} requested, {sent} sent, {answered}/{args.devices * args.clicks}"
+                  f" S answered, max queue depth {depth}, all answered in {elapsed:.2f} s")
+            failed |= answered != args.devices * args.clicks or depth > 2
+            res = deadline(engine, profile)
+            print(f"{engine:6} deadline  stale S -> {res}")
+            failed |= res != {"error": "Deadline exceeded"}
+            ok, res = pipeline(engine, profile)
+            print(f"{engine:6} pipeline  {'ok' if ok else 'MISMATCH'} {res}")
+            failed |= not ok
+        db.close_db()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
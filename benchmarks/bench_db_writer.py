@@ -0,0 +1,93 @@
+"""
+Compare log throughput of the old per-row connect/commit path against
+the background LogWriter.
+
+    python benchmarks/bench_db_writer.py [rows] [threads]
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import LogWriter, INSERT_LOG_SQL, make_log_row
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        device TEXT,
+        command TEXT,
+        result TEXT,
+        error TEXT,
+        ts REAL,
+        value REAL
+    )
+"""
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute(CREATE_SQL)
+    conn.commit()
+    conn.close()
+
+def row(device):
+    return make_log_row(device, "S", {"weight_display": "Weight = 1.182 g"})
+
+def legacy_worker(path, lock, device, n):
+    for _ in range(n):
+        with lock:
+            conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            try:
+                conn.execute(INSERT_LOG_SQL, row(device))
+                conn.commit()
+            finally:
+                conn.close()
+
+def writer_worker(writer, device, n):
+    for _ in range(n):
+        writer.enqueue(row(device))
+
+def run_threads(target, args_for, threads):
+    ts = [threading.Thread(target=target, args=args_for(i)) for i in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+def bench_legacy(path, rows, threads):
+    make_db(path)
+    lock = threading.Lock()
+    per = rows // threads
+    t0 = time.perf_counter()
+    run_threads(legacy_worker, lambda i: (path, lock, f"dev{i}", per), threads)
+    return per * threads / (time.perf_counter() - t0)
+
+def bench_writer(path, rows, threads):
+    make_db(path)
+    writer = LogWriter(path, queue_size=rows + 1)
+    writer.start()
+    per = rows // threads
+    t0 = time.perf_counter()
+    run_threads(writer_worker, lambda i: (writer, f"dev{i}", per), threads)
+    enqueue_time = time.perf_counter() - t0
+    writer.stop(timeout=60)
+    total = time.perf_counter() - t0
+    return per * threads / enqueue_time, per * threads / total
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = bench_legacy(os.path.join(tmp, "legacy.db"), rows, threads)
+        enq, committed = bench_writer(os.path.join(tmp, "writer.db"), rows, threads)
+    print(f"rows={rows} threads={threads}")
+    print(f"legacy per-row commit : {legacy:12.0f} rows/s")
+    print(f"LogWriter enqueue     : {enq:12.0f} rows/s")
+    print(f"LogWriter committed   : {committed:12.0f} rows/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Heartbeat cost and command dispatch latency for both engines, against
+pty-backed virtual instruments from the simulator package.
+
+Reports idle probes/s per device, serial bus utilisation (bytes written and
+read at 10 bits per byte over the port baud rate) and the time from
+send_command ("Check Now") to the command's bytes being written.
+
+    python benchmarks/bench_heartbeat.py [--devices N] [--idle S] [--samples N]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+BAUD = 9600
+PROBE_WIRE_BYTES = len(b"B\n") + len(b"OK\n")
+
+def run_engine(engine, count, idle_s, samples):
+    from serial_device import create_devices, await_all
+    from simulator import SimulatorHub, InstrumentProfile
+    hub = SimulatorHub()
+    configs = hub.add_fleet(count, InstrumentProfile(latency_ms=0, jitter_ms=0), baudrate=BAUD)
+    hub.start()
+    devices = create_devices(configs, engine=engine)
+    # Let the schedulers settle into their healthy interval, then measure idle traffic
+    time.sleep(min(idle_s, 2))
+    probes0 = sum(d.probes_sent for d in devices)
+    time.sleep(idle_s)
+    probes = sum(d.probes_sent for d in devices) - probes0
+    probe_rate = probes / idle_s / count
+    wire_bytes = probe_rate * PROBE_WIRE_BYTES
+    utilisation = wire_bytes * 10 / BAUD
+
+    latencies = []
+    for _ in range(samples):
+        time.sleep(random.uniform(0.05, 0.5))
+        dev = random.choice(devices)
+        await_all({dev.name: dev.send_command("S")}, 5)
+        if dev.last_dispatch_latency is not None:
+            latencies.append(dev.last_dispatch_latency * 1000)
+    for dev in devices:
+        dev.close()
+    time.sleep(1.2)
+    hub.close()
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else float("nan")
+    return probe_rate, utilisation, statistics.median(latencies), p99
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=5)
+    parser.add_argument("--idle", type=float, default=10)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DBFILE = os.path.join(tmp, "bench.db")
+        import db
+        db.DBFILE = config.DBFILE
+        db.init_db()
+        print(f"{'engine':8} {'probes/s/dev':>12} {'bus util %':>10} {'dispatch p50 ms':>15} {'p99 ms':>8}")
+        for engine in ("thread", "mux"):
+            rate, util, p50, p99 = run_engine(engine, args.devices, args.idle, args.samples)
+            print(f"{engine:8} {rate:12.2f} {util * 100:10.3f} {p50:15.2f} {p99:8.2f}")
+        db.close_db()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+End-to-end load benchmark on the pty simulator.
+
+For each device count and engine, every device is driven with back-to-back
+"S" commands for a fixed time. Reports commands/s, p50/p99 command latency
+(send_command -> Future resolved), DB rows/s committed by the LogWriter and
+process CPU use.
+
+    python benchmarks/bench_load.py [--devices 5 10 25 50 100] [--seconds 5]
+        [--engines thread mux] [--latency-ms 5] [--jitter-ms 2] [--garbage 0] [--dropout 0]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    idx = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[idx]
+
+def run(engine, count, seconds, profile):
+    import db
+    from simulator import SimulatorHub
+    from serial_device import create_devices
+
+    hub = SimulatorHub()
+    configs = hub.add_fleet(count, profile)
+    hub.start()
+    devices = create_devices(configs, engine=engine)
+    time.sleep(0.5)
+
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+    done = threading.Event()
+    in_flight = [0]
+
+    def drive(dev):
+        # Keep exactly one command outstanding per device
+        if time.monotonic() >= stop_at:
+            with lock:
+                in_flight[0] -= 1
+                if in_flight[0] == 0:
+                    done.set()
+            return
+        t0 = time.perf_counter()
+        fut = dev.send_command("S")
+
+        def on_done(_, t0=t0):
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+            drive(dev)
+        fut.add_done_callback(on_done)
+
+    writer = db.get_writer()
+    rows0 = writer.written
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    in_flight[0] = len(devices)
+    for dev in devices:
+        drive(dev)
+    done.wait(seconds + 10)
+    elapsed = time.perf_counter() - t0
+    db.flush_logs(timeout=30)
+    rows = writer.written - rows0
+    cpu = time.process_time() - cpu0
+
+    for dev in devices:
+        dev.close()
+    time.sleep(0.5)
+    hub.close()
+    latencies.sort()
+    return {
+        "cmds_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rows_s": rows / elapsed,
+        "cpu_pct": cpu / elapsed * 100,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", nargs="*", type=int, default=[5, 10, 25, 50, 100])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--engines", nargs="*", default=["thread", "mux"])
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--garbage", type=float, default=0.0)
+    parser.add_argument("--dropout", type=float, default=0.0)
+    args = parser.parse_args()
+
+    from simulator import InstrumentProfile
+    profile = InstrumentProfile(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                garbage_rate=args.garbage, dropout_rate=args.dropout)
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DBFILE = os.path.join(tmp, "bench.db")
+        import db
+        db.DBFILE = config.DBFILE
+        db.init_db()
+        print(f"{'engine':8} {'devices':>7} {'cmds/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'rows/s':>9} {'cpu %':>7}")
+        for count in args.devices:
+            for engine in args.engines:
+                r = run(engine, count, args.seconds, profile)
+                print(f"{engine:8} {count:7d} {r['cmds_s']:9.0f} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f}"
+                      f" {r['rows_s']:9.0f} {r['cpu_pct']:7.1f}")
+        db.close_db()
+
+if __name__ == "__main__":
+    main()
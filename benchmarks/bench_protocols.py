@@ -0,0 +1,38 @@
+"""
+Per-line cost of the framer and the registered parsers.
+
+    python benchmarks/bench_protocols.py [lines]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols import LineFramer, get_parser
+
+SAMPLES = {
+    "S": b"S S      1.182 g\r\n",
+    "P": b'{"weight": 1.182, "unit": "g", "ts": "2025-01-01T00:00:00"}\r\n',
+}
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for cmd, line in SAMPLES.items():
+        framer = LineFramer()
+        parser = get_parser("Weighing", cmd)
+        # Feed in odd-sized chunks so frames straddle reads
+        stream = line * 64
+        chunks = [stream[i:i + 37] for i in range(0, len(stream), 37)]
+        t0 = time.perf_counter()
+        parsed = 0
+        while parsed < n:
+            for chunk in chunks:
+                for text in framer.feed(chunk):
+                    parser(text)
+                    parsed += 1
+        elapsed = time.perf_counter() - t0
+        print(f"{cmd}: {elapsed / parsed * 1e6:6.2f} us/line (frame + parse)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Scaling benchmark: thread-per-port SerialDevice vs the single-loop MuxDevice,
+against pty-backed virtual instruments from the simulator package.
+
+    python benchmarks/bench_serial_mux.py [devices ...] [--rounds N]
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+def run_engine(engine, count, rounds):
+    from serial_device import create_devices, await_all
+    from simulator import SimulatorHub, InstrumentProfile
+    hub = SimulatorHub()
+    configs = hub.add_fleet(count, InstrumentProfile(latency_ms=0, jitter_ms=0))
+    hub.start()
+    devices = create_devices(configs, engine=engine)
+    time.sleep(0.5)
+    if engine == "mux":
+        threads = len({dev.mux for dev in devices})
+    else:
+        threads = sum(dev.is_alive() for dev in devices)
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    done = 0
+    for _ in range(rounds):
+        results = await_all({dev.name: dev.send_command("S") for dev in devices}, 5)
+        done += sum(1 for res in results.values() if isinstance(res, dict) and "weight_display" in res)
+    elapsed = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    for dev in devices:
+        dev.close()
+    time.sleep(1.2)  # let device threads finish their last readline before the next run
+    hub.close()
+    return threads, done / elapsed, cpu / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("devices", nargs="*", type=int, default=[5, 20, 60])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DBFILE = os.path.join(tmp, "bench.db")
+        import db
+        db.DBFILE = config.DBFILE
+        db.init_db()
+        print(f"{'engine':8} {'devices':>7} {'threads':>7} {'cmds/s':>10} {'cpu %':>7}")
+        for count in args.devices:
+            for engine in ("thread", "mux"):
+                threads, rate, cpu = run_engine(engine, count, args.rounds)
+                print(f"{engine:8} {count:7d} {threads:7d} {rate:10.0f} {cpu * 100:7.1f}")
+        db.close_db()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Startup benchmark on the pty simulator.
+
+Brings up a fleet the way GoldControllerApp does: create_devices() on the
+UI thread, then a first "S" per device as soon as it reports available.
+Reports time-to-first-usable-screen (create_devices returning, the part
+the window waits on) and time-to-all-readings, and checks both against
+the targets. A slice of the fleet can be made unreachable with --dead;
+those devices must not hold up the screen.
+
+    python benchmarks/bench_startup.py [--devices 5 50] [--engines thread mux]
+        [--latency-ms 20] [--dead 0] [--screen-target-ms 100] [--readings-target-s 2]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+def run(engine, count, profile, dead):
+    from simulator import SimulatorHub
+    from serial_device import create_devices
+
+    hub = SimulatorHub()
+    configs = hub.add_fleet(count - dead, profile)
+    configs += [{"name": f"Dead{i:03d}", "port": f"/dev/gold-missing-{i}", "baudrate": 115200}
+                for i in range(dead)]
+    hub.start()
+
+    pending = count - dead
+    lock = threading.Lock()
+    all_read = threading.Event()
+    started = set()
+
+    def on_reading(_):
+        nonlocal pending
+        with lock:
+            pending -= 1
+            if pending == 0:
+                all_read.set()
+
+    def on_changed(dev):
+        with lock:
+            if not dev.available or dev.name in started:
+                return
+            started.add(dev.name)
+        dev.send_command("S").add_done_callback(on_reading)
+
+    t0 = time.perf_counter()
+    devices = create_devices(configs, engine=engine)
+    for dev in devices:
+        dev.change_listeners.append(on_changed)
+        on_changed(dev)
+    screen = time.perf_counter() - t0
+    all_read.wait(30)
+    readings = time.perf_counter() - t0
+    got = sum(1 for dev in devices if dev.last_result and "value" in dev.last_result)
+
+    for dev in devices:
+        dev.close()
+    time.sleep(0.5)
+    hub.close()
+    return screen, readings, got
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", nargs="*", type=int, default=[5, 50])
+    parser.add_argument("--engines", nargs="*", default=["thread", "mux"])
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--dead", type=int, default=0)
+    parser.add_argument("--screen-target-ms", type=float, default=100.0)
+    parser.add_argument("--readings-target-s", type=float, default=2.0)
+    args = parser.parse_args()
+
+    from simulator import InstrumentProfile
+    profile = InstrumentProfile(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DBFILE = os.path.join(tmp, "bench.db")
+        import db
+        db.DBFILE = config.DBFILE
+        db.init_db()
+        print(f"{'engine':8} {'devices':>7} {'screen ms':>10} {'readings s':>11} {'read':>9}  result")
+        for count in args.devices:
+            for engine in args.engines:
+                screen, readings, got = run(engine, count, profile, min(args.dead, count))
+                ok = (screen * 1000 <= args.screen_target_ms and readings <= args.readings_target_s
+                      and got == count - min(args.dead, count))
+                failed |= not ok
+                print(f"{engine:8} {count:7d} {screen * 1000:10.1f} {readings:11.2f}"
+                      f" {got:4d}/{count - min(args.dead, count):<4d}  {'ok' if ok else 'OVER TARGET'}")
+        db.close_db()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
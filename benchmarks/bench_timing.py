@@ -0,0 +1,133 @@
+"""
+Learned vs fixed answer budgets on the pty simulator.
+
+A fleet of fast instruments that occasionally drop an answer plus one slow
+instrument is driven with "Check Now" rounds (S to every available device,
+gathered like GoldControllerApp.check_all). With fixed budgets every
+dropped answer stalls the round for the full 3 s "S" budget, and the slow
+instrument's background probes (0.5 s) fail, so it keeps dropping out of
+the rounds. With learned budgets both follow the instruments' real speed.
+Finally the devices are recreated to show the profiles reload from the DB.
+
+    python benchmarks/bench_timing.py [--engines thread mux] [--fast 8]
+        [--rounds 30] [--warmup 30] [--latency-ms 20] [--dropout 0.03] [--slow-ms 800]
+
+--slow-ms 0 leaves the slow instrument out.
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+def build(engine, hub, configs, adaptive):
+    from serial_device import create_devices
+    devices = create_devices(configs, engine=engine)
+    for dev in devices:
+        dev.timing.adaptive = adaptive
+        if not adaptive:
+            dev.timing.learned.clear()
+    for dev in devices:
+        dev.ready.wait(5)
+    return devices
+
+def check_round(devices):
+    from serial_device import await_all
+    ready = [dev for dev in devices if dev.is_connected() and dev.available]
+    futures = {dev.name: dev.send_command("S", deadline_s=dev.timing.deadline("S")) for dev in ready}
+    deadline = max((dev.timing.deadline("S") for dev in ready), default=0.0)
+    t0 = time.perf_counter()
+    results = await_all(futures, deadline)
+    return time.perf_counter() - t0, results
+
+def run(engine, args, adaptive):
+    import db
+    from simulator import SimulatorHub, VirtualInstrument, InstrumentProfile
+    # Every run starts without learned profiles
+    with db.DB_WRITE_LOCK:
+        conn = sqlite3.connect(db.DBFILE)
+        conn.execute("DELETE FROM timing_profiles")
+        conn.commit()
+        conn.close()
+    fast = InstrumentProfile(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4, dropout_rate=args.dropout)
+    slow = InstrumentProfile(latency_ms=args.slow_ms, jitter_ms=args.slow_ms / 20)
+    hub = SimulatorHub()
+    configs = hub.add_fleet(args.fast, fast)
+    if args.slow_ms > 0:
+        configs.append({"name": "Slow", "port": hub.add(VirtualInstrument("Slow", slow, seed=99)), "baudrate": 9600})
+    hub.start()
+    devices = build(engine, hub, configs, adaptive)
+    slow_dev = devices[-1]
+    for _ in range(args.warmup):
+        check_round(devices)
+    times, fast_ok, fast_sent, slow_ok, slow_avail = [], 0, 0, 0, 0
+    for _ in range(args.rounds):
+        slow_avail += slow_dev.available
+        elapsed, results = check_round(devices)
+        times.append(elapsed)
+        for name, res in results.items():
+            ok = isinstance(res, dict) and "error" not in res
+            if name == "Slow":
+                slow_ok += ok
+            else:
+                fast_sent += 1
+                fast_ok += ok
+    times.sort()
+    budgets = slow_dev.timing.summary(), devices[0].timing.summary()
+    for dev in devices:
+        dev.close()
+    time.sleep(0.3)
+    reloaded = None
+    if adaptive:
+        # Same DB, fresh devices: the profiles must come back without relearning
+        db.flush_logs()
+        again = build(engine, hub, configs, adaptive)
+        reloaded = again[0].timing.summary()
+        for dev in again:
+            dev.close()
+        time.sleep(0.3)
+    hub.close()
+    return times, fast_ok, fast_sent, slow_ok, slow_avail, budgets, reloaded
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", nargs="*", default=["thread", "mux"])
+    parser.add_argument("--fast", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--dropout", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=800.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DBFILE = os.path.join(tmp, "bench.db")
+        import db
+        db.DBFILE = config.DBFILE
+        db.init_db()
+        for engine in args.engines:
+            for adaptive in (False, True):
+                times, fast_ok, fast_sent, slow_ok, slow_avail, budgets, reloaded = run(engine, args, adaptive)
+                label = "learned" if adaptive else "fixed"
+                print(f"{engine:6} {label:7} Check Now p50 {percentile(times, 50) * 1000:6.0f} ms"
+                      f"  p95 {percentile(times, 95) * 1000:6.0f} ms  max {times[-1] * 1000:6.0f} ms"
+                      f"  fast {fast_ok}/{fast_sent}" + (f"  slow answered {slow_ok}/{args.rounds}"
+                      f" (available {slow_avail}/{args.rounds})" if args.slow_ms > 0 else ""))
+                print(f"{'':14} budgets" + (f" slow [{budgets[0]}]" if args.slow_ms > 0 else "") + f"  fast [{budgets[1]}]")
+                if reloaded:
+                    print(f"{'':14} reloaded fast [{reloaded}]")
+        db.close_db()
+
+if __name__ == "__main__":
+    main()
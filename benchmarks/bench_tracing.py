@@ -0,0 +1,115 @@
+"""
+Tracing overhead benchmark.
+
+micro  cost of one `with span(...)` while tracing is off and while it is on
+load   back-to-back "S" on simulated devices for --seconds, with tracing off,
+       on, and on plus the sampling profiler; reports commands/s and checks
+       the written trace file for serial/db spans and sampled stacks
+
+    python benchmarks/bench_tracing.py [--devices 10] [--seconds 5]
+        [--engines thread mux] [--latency-ms 5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+def micro(n=200000):
+    from tracing import TRACER, span
+    def loop():
+        t0 = time.perf_counter()
+        for i in range(n):
+            with span("bench", "bench", i=i):
+                pass
+        return (time.perf_counter() - t0) / n * 1e9
+    t0 = time.perf_counter()
+    for i in range(n):
+        pass
+    base = (time.perf_counter() - t0) / n * 1e9
+    off = loop()
+    TRACER.start()
+    on = loop()
+    TRACER.stop()
+    return off - base, on - base
+
+def load(engine, count, seconds, profile, mode, tmp):
+    from simulator import SimulatorHub
+    from serial_device import create_devices
+    from tracing import TRACER, summarize
+
+    hub = SimulatorHub()
+    configs = hub.add_fleet(count, profile)
+    hub.start()
+    devices = create_devices(configs, engine=engine)
+    for dev in devices:
+        dev.ready.wait(5)
+    if mode != "off":
+        TRACER.start(profile=mode == "profile")
+    done = [0]
+    end = time.monotonic() + seconds
+
+    def drive(dev):
+        while time.monotonic() < end:
+            dev.send_command("S").result(5)
+            done[0] += 1
+
+    workers = [threading.Thread(target=drive, args=(dev,)) for dev in devices]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    info = ""
+    if mode != "off":
+        TRACER.stop()
+        path = TRACER.dump(os.path.join(tmp, f"{engine}-{mode}.json"))
+        with open(path) as f:
+            events = json.load(f)["traceEvents"]
+        cats = {}
+        for e in events:
+            if e.get("ph") == "X":
+                cats[e["cat"]] = cats.get(e["cat"], 0) + 1
+        top = summarize(path, 3)
+        info = (f"  {os.path.getsize(path) / 1e6:.1f} MB, spans by cat {cats}, busiest "
+                + ", ".join(f"{name} {total:.0f} ms" for _, name, _, total, _ in top))
+    for dev in devices:
+        dev.close()
+    time.sleep(0.3)
+    hub.close()
+    return done[0] / seconds, info
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--engines", nargs="*", default=["thread", "mux"])
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    off, on = micro()
+    print(f"span overhead: {off:.0f} ns while off, {on:.0f} ns while on")
+
+    from simulator import InstrumentProfile
+    profile = InstrumentProfile(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5)
+    with tempfile.TemporaryDirectory() as tmp:
+        config.DBFILE = os.path.join(tmp, "bench.db")
+        import db
+        db.DBFILE = config.DBFILE
+        db.init_db()
+        for engine in args.engines:
+            base = None
+            for mode in ("off", "on", "profile"):
+                rate, info = load(engine, args.devices, args.seconds, profile, mode, tmp)
+                base = base or rate
+                print(f"{engine:6} tracing {mode:7} {rate:8.0f} cmd/s ({rate / base - 1:+.1%}){info}")
+        db.close_db()
+
+if __name__ == "__main__":
+    main()
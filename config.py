@@ -1,8 +1,165 @@
+import os
+
+# Files the app writes for itself (icon cache, archives, traces) live under
+# DATA_DIR, next to the code like main.resource_path, whatever the working directory
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
 DBFILE = "machine_results.db"
 LOGFILE = "device.log"
 HTTP_ENDPOINT = "http://your-server/endpoint"
 TEST_COMMAND = "B" 
 
+# "thread": one SerialDevice thread per port; "mux": one selector loop for all ports
+SERIAL_ENGINE = "thread"
+
+# Replace the DEVICE_CONFIGS ports with pty-backed virtual instruments (see simulator/)
+SIMULATE = False
+
+# How often the Tk thread drains device state-change events into the cards
+UI_POLL_MS = 50
+
+# Latency histograms served in Prometheus text format at http://HOST:PORT/metrics
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Opt-in tracing (see tracing.py), written as Chrome/Perfetto trace JSON to
+# TRACE_DIR. GOLD_TRACE=1 in the environment (or TRACE_ENABLED) traces from
+# startup and writes the file on exit; GOLD_TRACE=profile (or TRACE_PROFILE)
+# adds a sampling profiler. The Diagnostics panel captures TRACE_CAPTURE_S
+# on demand. Each thread keeps its last TRACE_BUFFER_EVENTS spans.
+TRACE_ENABLED = False
+TRACE_PROFILE = False
+TRACE_DIR = os.path.join(DATA_DIR, "traces")
+TRACE_CAPTURE_S = 30
+TRACE_BUFFER_EVENTS = 50000
+TRACE_SAMPLE_INTERVAL_S = 0.005
+TRACE_MAX_SAMPLES = 200000
+
+# Store-and-forward uploader (outbox table in DBFILE)
+UPLOAD_BATCH_SIZE = 50
+UPLOAD_POLL_S = 2
+UPLOAD_TIMEOUT_S = 5
+UPLOAD_BACKOFF_BASE_S = 1
+UPLOAD_BACKOFF_MAX_S = 300
+UPLOAD_ENQUEUE_TIMEOUT_S = 1    # wait for room in a full log writer queue before refusing a payload
+# A 4xx answer other than 408/429 is permanent: the batch is halved until the
+# rejected item is alone, and that item is dead-lettered (failed_at set, kept
+# in the outbox). So is an item the server answered with an error
+# UPLOAD_MAX_ATTEMPTS times; failed connections don't count, so the outbox
+# still rides out network outages.
+UPLOAD_MAX_ATTEMPTS = 20
+
+# Incremental sync (see sync.py): logs rows past the endpoint's acknowledged
+# id are sent in gzip batches of SYNC_BATCH_ROWS; SKIP_COMMANDS are not sent
+SYNC_BATCH_ROWS = 1000
+SYNC_SKIP_COMMANDS = ("B",)
+
+# Background log writer: commit every N rows or every T milliseconds
+DB_WRITE_BATCH_SIZE = 200
+DB_WRITE_FLUSH_MS = 250
+DB_WRITE_QUEUE_SIZE = 10000
+# A batch whose commit fails is rolled back and retried up to RETRIES times
+# with backoff from RETRY_S, then written row by row so only bad rows are lost
+DB_WRITE_RETRIES = 3
+DB_WRITE_RETRY_S = 0.1
+
+# Availability probes: log only status changes plus one run-length record
+HEARTBEAT_COMPACTION = True
+HEARTBEAT_FLUSH_S = 60
+HEARTBEAT_FLUSH_TIMEOUT_S = 1   # wait for room in the log writer queue when a run ends or at shutdown
+
+# Retention (see retention.py). The first policy whose device/command fnmatch
+# patterns match applies. Rows older than keep_days leave the logs table. With
+# "archive" they are first appended to ARCHIVE_DIR/logs-YYYY-MM.jsonl.gz. With
+# "summarize" ("hour"/"day") they are folded into log_summaries. keep_days None
+# keeps rows forever. Heartbeat runs follow the "B" policy.
+RETENTION_POLICIES = [
+    {"device": "*", "command": "S", "keep_days": 90, "archive": True},
+    {"device": "*", "command": "P", "keep_days": 90, "archive": True},
+    {"device": "*", "command": "B", "keep_days": 7, "summarize": "hour"},
+    {"device": "*", "command": "*", "keep_days": 30, "archive": True},
+]
+RETENTION_INTERVAL_S = 3600
+RETENTION_CHUNK_ROWS = 500      # rows deleted per transaction
+RETENTION_PAUSE_S = 0.05        # pause between chunks, leaving DB_WRITE_LOCK to the LogWriter
+RETENTION_VACUUM_PAGES = 256    # pages freed per incremental_vacuum step
+OUTBOX_KEEP_DAYS = 7            # delivered uploads
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+LOGFILE_MAX_BYTES = 10 * 1024 * 1024
+
+# Log export (see export.py): rows fetched per keyset page; for Parquet each
+# page becomes one row group
+EXPORT_CHUNK_ROWS = 20000
+
+# Health analytics (see analytics.py). New logs values are folded into daily
+# per-device sums every INTERVAL_S; reports look back WINDOW_DAYS. The badge
+# is judged on check-weight readings (ANALYTICS_CHECK_WEIGHTS) only, at least
+# MIN_ROWS of them; devices without check weights show no badge. It turns
+# warn/alert when a metric passes the (warn, alert) limits:
+#   drift_sigma   fitted drift of a check weight's deviation over the window,
+#                 in its standard deviations
+#   outlier_rate  share of check readings with |z| > Z_LIMIT against the prior window
+#   repeatability stddev of repeated check-weight readings
+ANALYTICS_INTERVAL_S = 300
+ANALYTICS_CHUNK_ROWS = 200000
+ANALYTICS_WINDOW_DAYS = 30
+ANALYTICS_ROLLING_DAYS = 7
+ANALYTICS_MIN_ROWS = 30
+ANALYTICS_Z_LIMIT = 4.0
+ANALYTICS_LIMITS = {"drift_sigma": (1.0, 3.0), "outlier_rate": (0.002, 0.01)}
+# Per device: nominal check weights, the relative band a reading must fall in
+# to count as that weight, and (warn, alert) limits on its stddev
+ANALYTICS_CHECK_WEIGHTS = {
+    "Weighing": {"nominals": [1.0, 10.0, 100.0], "tolerance": 0.02, "repeatability": (0.0005, 0.002)},
+}
+
+# Reconnection (see connection.py): a lost or missing port is reopened with
+# backoff from MIN_S doubling to MAX_S. A DEVICE_CONFIGS entry may add
+# "usb": {"vid": 0x0403, "pid": 0x6001, "serial_number": "..."} to be found by
+# those attributes on any port; such devices are rescanned every SCAN_S.
+RECONNECT_SCAN_S = 1.0
+RECONNECT_MIN_S = 0.5
+RECONNECT_MAX_S = 30
+
+# Commands not sent within this many seconds of being queued are dropped
+# (their callers get an error) instead of running late; see scheduler.py
+COMMAND_DEADLINE_S = 10
+
+# Adaptive availability probing: interval grows x BACKOFF per healthy probe
+# up to MAX_S, drops to MIN_S after any failure; probe answers wait READ_TIMEOUT_S
+# until the device has a learned B budget (see TIMING_* below)
+HEARTBEAT_MIN_S = 0.5
+HEARTBEAT_MAX_S = 10
+HEARTBEAT_BACKOFF = 2.0
+HEARTBEAT_READ_TIMEOUT_S = 0.5
+
+# Self-tuning answer budgets (see timing.py). Each device learns how long its
+# B/S/P answers take; from MIN_SAMPLES on, a command's budget is the
+# PERCENTILE of its last WINDOW answer times x FACTOR + MARGIN_S, kept within
+# [MIN_S, MAX_S], and doubles with every expiry in a row. Until then the
+# starting budgets apply: TIMING_PROFILES[device] where given, else the read
+# timeout (x3 lines for "S") and HEARTBEAT_READ_TIMEOUT_S for background
+# probes. "Check Now" and "Sync to Server" wait for the slowest device's
+# learned budget. Samples are saved to the timing_profiles table every SAVE_S
+# and on close, and reloaded at startup.
+TIMING_ADAPTIVE = True
+TIMING_PERCENTILE = 99
+TIMING_FACTOR = 1.5
+TIMING_MARGIN_S = 0.1
+TIMING_MIN_S = 0.2
+TIMING_MAX_S = 5.0
+TIMING_WINDOW = 200
+TIMING_MIN_SAMPLES = 20
+TIMING_SAVE_S = 60
+TIMING_PROFILES = {
+    # "Weighing": {"B": 0.5, "S": 1.5, "P": 1.0},
+}
+
+# Optional per-device keys: "protocol" (parser set, defaults to the name),
+# "usb" (see Reconnection above), "station" (card grouping in the UI) and
+# "pipeline" (how many queued B/S/P commands may share one write, for
+# instruments that buffer input and answer in order; default 1).
 DEVICE_CONFIGS = [
     {"name": "Weighing",    "port": "/dev/ttyUSB0", "baudrate": 9600},
     {"name": "Conductivity","port": "/dev/ttyUSB1", "baudrate": 115200},
@@ -11,6 +168,31 @@ DEVICE_CONFIGS = [
     {"name": "AI Vision",   "port": "/dev/ttyUSB4", "baudrate": 115200},
 ]
 
+# Continuous streaming mode per device. start/stop are the commands that
+# switch the instrument's continuous output on and off (MT-SICS "SIR" / "@").
+# Samples go into a fixed ring buffer of `capacity`; a reading is "stable"
+# once the last `window` samples have a stddev <= `stable_stddev`.
+STREAM_CONFIGS = {
+    "Weighing": {"start": "SIR", "stop": "@", "capacity": 4096, "window": 10, "stable_stddev": 0.002},
+}
+
+# Pre-scaled icon cache (see icon_cache.py); remote icons are fetched in the background
+ICON_CACHE_DIR = os.path.join(DATA_DIR, "icon_cache")
+ICON_FETCH_TIMEOUT_S = 4
+
+# Assay workflow (see assay.py): the instrument stages every item passes
+# through, in order. Each stage sends `command` and allows `retries` extra
+# attempts of up to timeout_s seconds; an item whose stage fails stops there.
+ASSAY_STAGES = [
+    {"device": "Weighing",     "command": "S", "timeout_s": 3, "retries": 1},
+    {"device": "Conductivity", "command": "S", "timeout_s": 3, "retries": 1},
+    {"device": "Magnetic",     "command": "S", "timeout_s": 3, "retries": 1},
+    {"device": "XRF",          "command": "S", "timeout_s": 5, "retries": 1},
+    {"device": "AI Vision",    "command": "S", "timeout_s": 5, "retries": 1},
+]
+# How long an item's record may wait for room in a full log writer queue
+ASSAY_PERSIST_TIMEOUT_S = 1
+
 DEVICE_ICONS = {
     "Weighing":     "images/weighing.png",
     "Conductivity": "images/conductivity.png",
@@ -0,0 +1,129 @@
+import time
+import threading
+
+from serial.tools import list_ports
+
+from config import RECONNECT_SCAN_S, RECONNECT_MIN_S, RECONNECT_MAX_S
+
+def find_port(usb, ports):
+    """Device path of the first port whose USB attributes (vid, pid, serial_number, ...) all match."""
+    for info in ports:
+        if all(getattr(info, key, None) == value for key, value in usb.items()):
+            return info.device
+    return None
+
+class ConnectionManager(threading.Thread):
+    """
+    Reopens ports for devices that lost or never got their connection.
+    Devices with a "usb" match in their config are located by VID/PID/serial
+    number on every scan, so a moved adapter is rebound to its configured
+    name and a replug is picked up within RECONNECT_SCAN_S. Open attempts
+    back off exponentially up to RECONNECT_MAX_S per device. Disconnected
+    devices do no I/O of their own, so a flapping port costs the others nothing.
+    """
+    def __init__(self, scan_s=RECONNECT_SCAN_S, min_s=RECONNECT_MIN_S, max_s=RECONNECT_MAX_S,
+                 ports_fn=list_ports.comports):
+        super().__init__(daemon=True, name="ConnectionManager")
+        self.scan_s = scan_s
+        self.min_s = min_s
+        self.max_s = max_s
+        self.ports_fn = ports_fn
+        self.watched = {}       # device -> {"retry_at", "delay", "present"}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = True
+        self.reconnects = 0
+
+    def watch(self, dev):
+        """Take over reconnecting `dev`; safe to call from any thread, repeatedly."""
+        with self.lock:
+            if dev not in self.watched:
+                self.watched[dev] = {"retry_at": time.monotonic() + self.min_s, "delay": self.min_s,
+                                     "present": False}
+        self.wakeup.set()
+
+    def forget(self, dev):
+        with self.lock:
+            self.watched.pop(dev, None)
+
+    def stop(self, timeout=2):
+        self.running = False
+        self.wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def _resolve(self, dev, ports):
+        if dev.usb:
+            return find_port(dev.usb, ports)
+        return dev.port
+
+    def _attempt(self, dev, state, port, now):
+        try:
+            ser = dev._open_port(port)
+        except Exception as e:
+            dev.last_error = str(e)
+            state["delay"] = min(self.max_s, state["delay"] * 2)
+            state["retry_at"] = now + state["delay"]
+            return
+        self.forget(dev)
+        if port != dev.port:
+            print(f"[CONN] {dev.name} moved from {dev.port} to {port}")
+        self.reconnects += 1
+        dev._attach(ser, port)
+
+    def _pass(self):
+        now = time.monotonic()
+        with self.lock:
+            watched = [(dev, state) for dev, state in self.watched.items()]
+        ports = None
+        if any(dev.usb for dev, _ in watched):
+            try:
+                ports = list(self.ports_fn())
+            except Exception as e:
+                print(f"[CONN] Port scan failed: {e}")
+                ports = []
+        for dev, state in watched:
+            if not dev.running:
+                self.forget(dev)
+                continue
+            port = self._resolve(dev, ports)
+            if port is None:
+                state["present"] = False
+                continue
+            # A port that just (re)appeared is tried at once, regardless of backoff
+            appeared = dev.usb and not state["present"]
+            state["present"] = True
+            if appeared or now >= state["retry_at"]:
+                self._attempt(dev, state, port, now)
+
+    def _next_wait(self):
+        with self.lock:
+            if not self.watched:
+                return None
+            if any(dev.usb for dev in self.watched):
+                return self.scan_s
+            due = min(state["retry_at"] for state in self.watched.values())
+        return max(0.05, due - time.monotonic())
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(self._next_wait())
+            self.wakeup.clear()
+            if not self.running:
+                break
+            try:
+                self._pass()
+            except Exception as e:
+                print(f"[CONN] Reconnect pass failed: {e}")
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_connection_manager():
+    """Return the process-wide ConnectionManager, starting it on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None or not _manager.is_alive():
+            _manager = ConnectionManager()
+            _manager.start()
+        return _manager
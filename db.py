@@ -1,17 +1,279 @@
 import sqlite3
 import datetime
 import threading
-from config import DBFILE
+import queue
+import time
+import itertools
+import json
+import ast
+import re
+from metrics import METRICS
+from tracing import span
+from config import (DBFILE, DB_WRITE_BATCH_SIZE, DB_WRITE_FLUSH_MS, DB_WRITE_QUEUE_SIZE,
+                    DB_WRITE_RETRIES, DB_WRITE_RETRY_S, HEARTBEAT_COMPACTION, HEARTBEAT_FLUSH_S,
+                    HEARTBEAT_FLUSH_TIMEOUT_S)
 
 # Global threading lock for SQLite writes
 DB_WRITE_LOCK = threading.Lock()
 
+SCHEMA_VERSION = 1
+LOG_COLUMNS = ("id", "timestamp", "device", "command", "result", "error", "ts", "value")
+INSERT_LOG_SQL = "INSERT INTO logs (timestamp, ts, device, command, result, value, error) VALUES (?, ?, ?, ?, ?, ?, ?)"
+UPSERT_HEARTBEAT_SQL = """
+    INSERT INTO heartbeats (device, status, first_seen, last_seen, count, last_response, last_error)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(device, first_seen) DO UPDATE SET
+        last_seen = excluded.last_seen,
+        count = excluded.count,
+        last_response = excluded.last_response,
+        last_error = excluded.last_error
+"""
+
+class LogWriter(threading.Thread):
+    """
+    Background writer that owns one long-lived WAL connection.
+    Rows are queued by log_result and committed in batches of
+    `batch_size` rows or every `flush_ms` milliseconds, whichever comes first.
+    """
+    def __init__(self, path=DBFILE, batch_size=DB_WRITE_BATCH_SIZE,
+                 flush_ms=DB_WRITE_FLUSH_MS, queue_size=DB_WRITE_QUEUE_SIZE):
+        super().__init__(daemon=True, name="LogWriter")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.running = True
+        self.conn = None
+        self.lock_wait_hist = METRICS.histogram("gold_db_lock_wait_seconds", "Wait for DB_WRITE_LOCK per log batch")
+        self.commit_hist = METRICS.histogram("gold_db_commit_seconds", "Insert + commit time per log batch")
+        METRICS.gauge("gold_db_queue_depth", "Rows waiting for the log writer", self.queue.qsize)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def enqueue(self, row, sql=INSERT_LOG_SQL, timeout=None):
+        """
+        Queue a row, by default without blocking; with a timeout, wait up to
+        that long for room. Returns False (and counts a drop) if the queue is full.
+        """
+        try:
+            if timeout is None:
+                self.queue.put_nowait((sql, row))
+            else:
+                self.queue.put((sql, row), timeout=timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=5):
+        """Block until everything queued so far has been committed."""
+        if not self.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout=5):
+        """Flush pending rows, stop the thread and close the connection."""
+        self.flush(timeout)
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.is_alive():
+            self.join(timeout)
+
+    def _commit(self, rows):
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            rows.append((INSERT_LOG_SQL, make_log_row("LogWriter", "dropped", dropped, "Log queue full")))
+        t0 = time.perf_counter()
+        with span("db.commit", "db", rows=len(rows)), DB_WRITE_LOCK:
+            t1 = time.perf_counter()
+            for sql, group in itertools.groupby(rows, key=lambda item: item[0]):
+                self.conn.executemany(sql, [params for _, params in group])
+            self.conn.commit()
+        t2 = time.perf_counter()
+        self.lock_wait_hist.observe(t1 - t0)
+        self.commit_hist.observe(t2 - t1)
+        self.written += len(rows)
+
+    def _rollback(self):
+        try:
+            self.conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _write(self, rows):
+        """
+        Commit a batch, retrying with backoff. A batch that still fails is
+        written row by row; rows that fail on their own count as dropped.
+        """
+        for attempt in range(DB_WRITE_RETRIES):
+            try:
+                self._commit(rows)
+                return
+            except Exception as e:
+                self._rollback()
+                print(f"[DB] Error writing {len(rows)} log rows (attempt {attempt + 1}): {e}")
+                if not isinstance(e, sqlite3.OperationalError):
+                    break   # not locked/busy: retrying the same batch cannot help
+                time.sleep(DB_WRITE_RETRY_S * (2 ** attempt))
+        lost = 0
+        for row in rows:
+            try:
+                self._commit([row])
+            except Exception as e:
+                self._rollback()
+                lost += 1
+                if lost == 1:
+                    print(f"[DB] Dropping a row that cannot be written: {e}")
+        # Recorded by the "dropped" marker row of the next commit
+        self.dropped += lost
+
+    def run(self):
+        self.conn = self._connect()
+        rows = []
+        waiters = []
+        deadline = None
+        try:
+            while self.running or not self.queue.empty():
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = False
+                if item is None:
+                    if not self.running:
+                        break
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item is not False:
+                    rows.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                due = deadline is not None and time.monotonic() >= deadline
+                if rows and (len(rows) >= self.batch_size or due or waiters):
+                    self._write(rows)
+                    rows = []
+                    deadline = None
+                for w in waiters:
+                    w.set()
+                waiters = []
+            if rows:
+                self._write(rows)
+            if self.dropped:
+                self._write([])
+        finally:
+            for w in waiters:
+                w.set()
+            self.conn.close()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """Return the process-wide LogWriter, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = LogWriter()
+            _writer.start()
+        return _writer
+
+_NUMBER_RE = re.compile(r'[-+]?\d*\.?\d+')
+
+def encode_result(result):
+    """JSON-encode a result; anything json can't handle is stored as its str()."""
+    try:
+        return json.dumps(result, default=str)
+    except (TypeError, ValueError):
+        return json.dumps(str(result))
+
+def decode_result(text):
+    """Inverse of encode_result. Rows written before schema v1 fall back to the raw text."""
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def extract_value(result):
+    """Pull the numeric measurement out of a result dict, e.g. the weighing grams."""
+    if not isinstance(result, dict):
+        return None
+    for key in ("value", "weight"):
+        v = result.get(key)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return float(v)
+    text = result.get("weight_display")
+    if isinstance(text, str):
+        m = _NUMBER_RE.search(text)
+        if m:
+            return float(m.group(0))
+    return None
+
+def make_log_row(device_name, cmd, result, error=None):
+    now = datetime.datetime.now()
+    return (now.isoformat(), now.timestamp(), device_name, cmd, encode_result(result),
+            extract_value(result), str(error) if error else None)
+
+def _migrate_logs(conn, chunk=5000):
+    """
+    Bring an existing logs table up to SCHEMA_VERSION: add ts/value columns
+    and rewrite repr()-style results as JSON, a chunk at a time.
+    """
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(logs)")}
+    if "ts" not in cols:
+        conn.execute("ALTER TABLE logs ADD COLUMN ts REAL")
+    if "value" not in cols:
+        conn.execute("ALTER TABLE logs ADD COLUMN value REAL")
+    conn.commit()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, timestamp, result FROM logs WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row_id, timestamp, text in rows:
+            try:
+                ts = datetime.datetime.fromisoformat(timestamp).timestamp()
+            except (TypeError, ValueError):
+                ts = None
+            try:
+                result = ast.literal_eval(text) if text is not None else None
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                result = text
+            updates.append((ts, encode_result(result) if text is not None else None,
+                            extract_value(result), row_id))
+        conn.executemany("UPDATE logs SET ts = ?, result = ?, value = ? WHERE id = ?", updates)
+        conn.commit()
+        last_id = rows[-1][0]
+
 def init_db():
     """Initialize the logs table. Call once at app startup."""
     with DB_WRITE_LOCK:
         conn = sqlite3.connect(DBFILE, timeout=10, check_same_thread=False)
         try:
             c = conn.cursor()
+            # Only takes effect on a new file; older databases are converted offline
+            # with python retention.py --convert-vacuum
+            c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            c.execute("PRAGMA journal_mode=WAL")
             c.execute("""
                 CREATE TABLE IF NOT EXISTS logs (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -19,41 +281,326 @@ def init_db():
                     device TEXT,
                     command TEXT,
                     result TEXT,
-                    error TEXT
+                    error TEXT,
+                    ts REAL,
+                    value REAL
+                )
+            """)
+            if c.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                _migrate_logs(conn)
+                c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idem_key TEXT UNIQUE,
+                    created REAL,
+                    payload TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    last_error TEXT,
+                    sent_at REAL,
+                    failed_at REAL
+                )
+            """)
+            if "failed_at" not in {row[1] for row in c.execute("PRAGMA table_info(outbox)")}:
+                c.execute("ALTER TABLE outbox ADD COLUMN failed_at REAL")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (sent_at, id)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_logs_device_ts ON logs (device, ts)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs (ts)")
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS heartbeats (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    device TEXT,
+                    status TEXT,
+                    first_seen TEXT,
+                    last_seen TEXT,
+                    count INTEGER,
+                    last_response TEXT,
+                    last_error TEXT,
+                    UNIQUE (device, first_seen)
+                )
+            """)
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS log_summaries (
+                    device TEXT,
+                    command TEXT,
+                    bucket_ts REAL,
+                    count INTEGER,
+                    errors INTEGER,
+                    value_count INTEGER,
+                    value_sum REAL,
+                    value_min REAL,
+                    value_max REAL,
+                    PRIMARY KEY (device, command, bucket_ts)
+                )
+            """)
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS sync_watermarks (
+                    endpoint TEXT PRIMARY KEY,
+                    last_log_id INTEGER,
+                    updated REAL,
+                    pending_to_id INTEGER,
+                    pending_key TEXT,
+                    pending_snapshots TEXT
+                )
+            """)
+            cols = {row[1] for row in c.execute("PRAGMA table_info(sync_watermarks)")}
+            for col, kind in (("pending_to_id", "INTEGER"), ("pending_key", "TEXT"), ("pending_snapshots", "TEXT")):
+                if col not in cols:
+                    c.execute(f"ALTER TABLE sync_watermarks ADD COLUMN {col} {kind}")
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS sync_snapshots (
+                    endpoint TEXT,
+                    device TEXT,
+                    hash TEXT,
+                    sent_at REAL,
+                    PRIMARY KEY (endpoint, device)
+                )
+            """)
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_state (
+                    key TEXT PRIMARY KEY,
+                    value REAL
+                )
+            """)
+            # Derived from logs by analytics.py: an older layout is dropped and refolded
+            if "stv" not in {row[1] for row in c.execute("PRAGMA table_info(analytics_checks)")}:
+                c.execute("DROP TABLE IF EXISTS analytics_buckets")
+                c.execute("DROP TABLE IF EXISTS analytics_checks")
+                c.execute("DELETE FROM analytics_state")
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_buckets (
+                    device TEXT,
+                    day INTEGER,
+                    n INTEGER,
+                    s1 REAL,
+                    s2 REAL,
+                    PRIMARY KEY (device, day)
+                )
+            """)
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_checks (
+                    device TEXT,
+                    nominal REAL,
+                    day INTEGER,
+                    n INTEGER,
+                    s1 REAL,
+                    s2 REAL,
+                    st REAL,
+                    stt REAL,
+                    stv REAL,
+                    outliers INTEGER,
+                    PRIMARY KEY (device, nominal, day)
+                )
+            """)
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS assays (
+                    item_id TEXT PRIMARY KEY,
+                    created REAL,
+                    finished REAL,
+                    status TEXT,
+                    record TEXT
+                )
+            """)
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS timing_profiles (
+                    device TEXT,
+                    command TEXT,
+                    samples TEXT,
+                    budget REAL,
+                    updated REAL,
+                    PRIMARY KEY (device, command)
                 )
             """)
             conn.commit()
         finally:
             conn.close()
+    get_writer()
 
 def log_result(device_name, cmd, result, error=None):
     """
     Log every command and response, including errors, to the logs table.
-    Thread-safe.
+    Thread-safe and non-blocking: the row is handed to the background writer.
     """
-    with DB_WRITE_LOCK:
-        conn = sqlite3.connect(DBFILE, timeout=10, check_same_thread=False)
-        try:
-            c = conn.cursor()
-            c.execute(
-                "INSERT INTO logs (timestamp, device, command, result, error) VALUES (?, ?, ?, ?, ?)",
-                (datetime.datetime.now().isoformat(), device_name, cmd, str(result), str(error) if error else None)
-            )
-            conn.commit()
-        finally:
-            conn.close()
+    with span("log_result", "db", device=device_name, cmd=cmd):
+        get_writer().enqueue(make_log_row(device_name, cmd, result, error))
+
+class HeartbeatLog:
+    """
+    Run-length log of availability probes.
+    A "B" row goes to the logs table only when a device's status changes;
+    the steady state in between is kept as one heartbeats row
+    (first_seen, last_seen, count, last response) that is upserted every
+    `flush_s` seconds and once more when the run ends. A periodic upsert
+    the LogWriter could not take is retried on the next probe.
+    """
+    def __init__(self, flush_s=HEARTBEAT_FLUSH_S):
+        self.flush_s = flush_s
+        self.runs = {}
+        self.lock = threading.Lock()
+
+    def _upsert(self, device, run, timeout=None):
+        stored = get_writer().enqueue(
+            (device, run["status"], run["first_seen"], run["last_seen"], run["count"],
+             run["last_response"], run["last_error"]),
+            sql=UPSERT_HEARTBEAT_SQL, timeout=timeout,
+        )
+        if stored:
+            run["flushed_at"] = time.monotonic()
+        return stored
+
+    def record(self, device_name, status, response, error=None):
+        now = datetime.datetime.now().isoformat()
+        error = str(error) if error else None
+        with self.lock:
+            run = self.runs.get(device_name)
+            if run is None or run["status"] != status:
+                if run is not None and not self._upsert(device_name, run, HEARTBEAT_FLUSH_TIMEOUT_S):
+                    print(f"[DB] Final heartbeat run of {device_name} not stored: log queue full")
+                log_result(device_name, "B", response, error)
+                run = {"status": status, "first_seen": now, "last_seen": now, "count": 1,
+                       "last_response": str(response), "last_error": error, "flushed_at": None}
+                self.runs[device_name] = run
+                self._upsert(device_name, run)
+                return
+            run["last_seen"] = now
+            run["count"] += 1
+            run["last_response"] = str(response)
+            run["last_error"] = error
+            if run["flushed_at"] is None or time.monotonic() - run["flushed_at"] >= self.flush_s:
+                self._upsert(device_name, run)
+
+    def flush(self, timeout=HEARTBEAT_FLUSH_TIMEOUT_S):
+        """Upsert every open run; returns the devices whose run could not be queued."""
+        with self.lock:
+            return [device_name for device_name, run in self.runs.items()
+                    if not self._upsert(device_name, run, timeout)]
+
+HEARTBEATS = HeartbeatLog()
+
+def log_heartbeat(device_name, status, response, error=None):
+    """
+    Log an availability probe. With HEARTBEAT_COMPACTION only status
+    transitions become logs rows; otherwise every probe is logged.
+    """
+    if HEARTBEAT_COMPACTION:
+        HEARTBEATS.record(device_name, status, response, error)
+    else:
+        log_result(device_name, "B", response, error)
+
+def flush_logs(timeout=5):
+    """Wait until all queued log rows are committed."""
+    if _writer is not None:
+        return _writer.flush(timeout)
+    return True
+
+def close_db(timeout=5):
+    """Flush and stop the background writer. Call on app shutdown."""
+    global _writer
+    if _writer is not None:
+        unsaved = HEARTBEATS.flush()
+        if unsaved:
+            print(f"[DB] Heartbeat runs not stored at shutdown: {', '.join(unsaved)}")
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop(timeout)
+
+_readers = threading.local()
+
+def get_read_conn():
+    """
+    Per-thread read-only connection. Under WAL readers never wait on the
+    writer, so queries do not take DB_WRITE_LOCK.
+    """
+    conn = getattr(_readers, "conn", None)
+    if conn is None or getattr(_readers, "path", None) != DBFILE:
+        conn = sqlite3.connect(f"file:{DBFILE}?mode=ro", uri=True, timeout=10)
+        _readers.conn = conn
+        _readers.path = DBFILE
+    return conn
+
+def _epoch(t):
+    if t is None or isinstance(t, (int, float)):
+        return t
+    if isinstance(t, str):
+        t = datetime.datetime.fromisoformat(t)
+    return t.timestamp()
+
+def _row_to_dict(row, decode=True):
+    d = dict(zip(LOG_COLUMNS, row))
+    if decode:
+        d["result"] = decode_result(d["result"])
+    return d
+
+def _log_filters(device, command, since, until, errors_only, max_id):
+    where, params = [], []
+    if device is not None:
+        where.append("device = ?")
+        params.append(device)
+    if command is not None:
+        where.append("command = ?")
+        params.append(command)
+    if since is not None:
+        where.append("ts >= ?")
+        params.append(_epoch(since))
+    if until is not None:
+        where.append("ts < ?")
+        params.append(_epoch(until))
+    if errors_only:
+        where.append("error IS NOT NULL")
+    if max_id is not None:
+        where.append("id <= ?")
+        params.append(max_id)
+    return where, params
+
+def count_logs(device=None, command=None, since=None, until=None, errors_only=False, max_id=None):
+    """Number of log rows matching the same filters as query_logs."""
+    where, params = _log_filters(device, command, since, until, errors_only, max_id)
+    sql = "SELECT COUNT(*) FROM logs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return get_read_conn().execute(sql, params).fetchone()[0]
+
+def max_log_id():
+    """Highest logs id written so far (0 for an empty table)."""
+    return get_read_conn().execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+
+def query_logs(device=None, command=None, since=None, until=None, errors_only=False,
+               cursor=None, limit=100, newest_first=True, decode=True, max_id=None):
+    """
+    Filtered log query with keyset pagination.
+    `since`/`until` accept epoch seconds, datetimes or ISO strings; max_id
+    leaves out rows written after a max_log_id() snapshot.
+    With decode=False "result" is left as the stored JSON text.
+    Returns (rows, next_cursor); pass next_cursor back to get the next page,
+    it is None once there are no more rows.
+    """
+    where, params = _log_filters(device, command, since, until, errors_only, max_id)
+    if cursor is not None:
+        # Rows without a ts (unparseable legacy timestamps) sort first ascending
+        # and last descending; (ts, id) comparisons never match them
+        ts, row_id = cursor
+        if ts is None:
+            where.append("(ts IS NULL AND id < ?)" if newest_first
+                         else "((ts IS NULL AND id > ?) OR ts IS NOT NULL)")
+            params.append(row_id)
+        else:
+            where.append("((ts, id) < (?, ?) OR ts IS NULL)" if newest_first else "(ts, id) > (?, ?)")
+            params.extend(cursor)
+    order = "DESC" if newest_first else "ASC"
+    sql = f"SELECT {', '.join(LOG_COLUMNS)} FROM logs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY ts {order}, id {order} LIMIT ?"
+    params.append(limit)
+    rows = [_row_to_dict(r, decode) for r in get_read_conn().execute(sql, params)]
+    next_cursor = (rows[-1]["ts"], rows[-1]["id"]) if len(rows) == limit else None
+    return rows, next_cursor
 
 def get_logs(limit=100):
     """
     Fetch the most recent logs for viewing/debugging.
-    Thread-safe.
+    Thread-safe; reads on a read-only connection without the write lock.
     """
-    with DB_WRITE_LOCK:
-        conn = sqlite3.connect(DBFILE, timeout=10, check_same_thread=False)
-        try:
-            c = conn.cursor()
-            c.execute("SELECT * FROM logs ORDER BY id DESC LIMIT ?", (limit,))
-            rows = c.fetchall()
-            return rows
-        finally:
-            conn.close()
+    c = get_read_conn().execute(f"SELECT {', '.join(LOG_COLUMNS)} FROM logs ORDER BY id DESC LIMIT ?", (limit,))
+    return c.fetchall()
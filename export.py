@@ -0,0 +1,174 @@
+"""
+Streaming export of the logs table.
+
+    python export.py logs-2026-09.csv.gz --since 2026-09-01 --until 2026-10-01
+    python export.py weighing.parquet --device Weighing --command S
+
+Rows are read in keyset-paginated chunks of EXPORT_CHUNK_ROWS on a
+read-only connection, so memory stays flat for any table size and the
+devices keep writing throughout. The format follows the file extension
+(.csv, .jsonl, .parquet; .csv/.jsonl may end in .gz) or --format.
+Parquet needs pyarrow.
+"""
+import os
+import csv
+import sys
+import gzip
+import json
+import time
+import argparse
+
+from config import EXPORT_CHUNK_ROWS
+from db import LOG_COLUMNS, query_logs, count_logs, max_log_id
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+def iter_log_chunks(device=None, command=None, since=None, until=None, errors_only=False,
+                    chunk_rows=EXPORT_CHUNK_ROWS, decode=True, max_id=None):
+    """Yield lists of log rows (dicts, oldest first) matching the filters, chunk_rows at a time."""
+    cursor = None
+    while True:
+        rows, cursor = query_logs(device, command, since, until, errors_only, cursor=cursor,
+                                  limit=chunk_rows, newest_first=False, decode=decode, max_id=max_id)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+def iter_logs(**filters):
+    """Yield log rows one by one; same filters as iter_log_chunks."""
+    for rows in iter_log_chunks(**filters):
+        yield from rows
+
+def _open_text(path, compress):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+class CsvExporter:
+    decode = False      # "result" stays the stored JSON text
+
+    def __init__(self, path, compress=False):
+        self.f = _open_text(path, compress)
+        self.writer = csv.DictWriter(self.f, LOG_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+class JsonlExporter:
+    decode = True
+
+    def __init__(self, path, compress=False):
+        self.f = _open_text(path, compress)
+
+    def write(self, rows):
+        self.f.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+
+    def close(self):
+        self.f.close()
+
+class ParquetExporter:
+    """One zstd-compressed row group per chunk; "result" is the stored JSON text."""
+    decode = False
+
+    def __init__(self, path, compress=False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+        self.pa = pa
+        self.schema = pa.schema([("id", pa.int64()), ("timestamp", pa.string()), ("device", pa.string()),
+                                 ("command", pa.string()), ("result", pa.string()), ("error", pa.string()),
+                                 ("ts", pa.float64()), ("value", pa.float64())])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+EXPORTERS = {"csv": CsvExporter, "jsonl": JsonlExporter, "parquet": ParquetExporter}
+
+def guess_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    ext = os.path.splitext(name)[1].lstrip(".").lower()
+    if ext == "json":
+        ext = "jsonl"
+    if ext not in FORMATS:
+        raise ValueError(f"Cannot tell the export format from '{path}'; use one of {', '.join(FORMATS)}")
+    return ext
+
+def export_logs(path, fmt=None, device=None, command=None, since=None, until=None, errors_only=False,
+                chunk_rows=EXPORT_CHUNK_ROWS, progress=None):
+    """
+    Write matching log rows to `path`; returns the row count.
+    progress(rows, out_bytes, elapsed_s) is called after every chunk.
+    The file is written under a temporary name and only appears complete,
+    covering the rows present when the export started; a row count that
+    does not match COUNT(*) for the same filters raises RuntimeError.
+    """
+    exporter_cls = EXPORTERS[fmt or guess_format(path)]
+    tmp = path + ".part"
+    exporter = exporter_cls(tmp, compress=path.endswith(".gz"))
+    count = 0
+    t0 = time.monotonic()
+    try:
+        max_id = max_log_id()
+        for rows in iter_log_chunks(device, command, since, until, errors_only, chunk_rows,
+                                    exporter_cls.decode, max_id):
+            exporter.write(rows)
+            count += len(rows)
+            if progress:
+                progress(count, os.path.getsize(tmp), time.monotonic() - t0)
+        exporter.close()
+        expected = count_logs(device, command, since, until, errors_only, max_id)
+        if count != expected:
+            raise RuntimeError(f"Exported {count} rows but {expected} match the filters "
+                               f"(rows removed by retention meanwhile?); run the export again")
+    except BaseException:
+        exporter.close()
+        os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    return count
+
+def _print_progress(rows, out_bytes, elapsed):
+    rate = rows / elapsed if elapsed else 0.0
+    print(f"\r[EXPORT] {rows:,} rows  {rate:,.0f} rows/s  {out_bytes / 1e6:,.1f} MB written",
+          end="", file=sys.stderr, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the logs table to CSV, JSON-lines or Parquet.")
+    parser.add_argument("path", help="output file; the extension picks the format unless --format is given")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--device")
+    parser.add_argument("--command")
+    parser.add_argument("--since", help="ISO date/time or epoch seconds (inclusive)")
+    parser.add_argument("--until", help="ISO date/time or epoch seconds (exclusive)")
+    parser.add_argument("--errors-only", action="store_true")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    parser.add_argument("--quiet", action="store_true", help="no progress output")
+    args = parser.parse_args(argv)
+
+    def when(text):
+        try:
+            return float(text)
+        except (TypeError, ValueError):
+            return text
+
+    t0 = time.monotonic()
+    count = export_logs(args.path, args.format, args.device, args.command, when(args.since), when(args.until),
+                        args.errors_only, args.chunk_rows, None if args.quiet else _print_progress)
+    elapsed = time.monotonic() - t0
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"[EXPORT] {count:,} rows to {args.path} in {elapsed:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import requests
+from PIL import Image
+from config import ICON_CACHE_DIR, ICON_FETCH_TIMEOUT_S
+
+class IconCache:
+    """
+    Pre-scaled RGBA icons on disk, keyed by (source, size, version).
+    For a local file the version is its mtime; for a URL it is the
+    server's ETag (or a content hash). Each scaled image is decoded once
+    per process. Remote icons are fetched and revalidated on a
+    background thread, so callers never wait on the network. Only the
+    newest version of each (source, size) is kept, on disk and in memory.
+    """
+    def __init__(self, cache_dir=ICON_CACHE_DIR, timeout=ICON_FETCH_TIMEOUT_S):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.images = {}        # (source, size, version) -> scaled RGBA Image
+        self.fetching = set()   # (url, size) with a fetch in flight
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _file(self, *parts, ext):
+        key = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + ext)
+
+    def _scaled(self, source, size, version, decode=None):
+        """Scaled image from memory, else disk, else decode() + LANCZOS resize (then written to disk)."""
+        key = (source, size, version)
+        img = self.images.get(key)
+        if img is not None:
+            return img
+        path = self._file(source, f"{size[0]}x{size[1]}", version, ext=".png")
+        try:
+            img = Image.open(path)
+            img.load()
+        except OSError:
+            if decode is None:
+                return None
+            img = decode().convert("RGBA").resize(size, Image.LANCZOS)
+            try:
+                tmp = path + ".tmp"
+                img.save(tmp, "PNG")
+                os.replace(tmp, path)
+                self._retire(source, size, path)
+            except OSError as e:
+                print(f"[ICON] Could not write cache entry for '{source}': {e}")
+        with self.lock:
+            for old in [k for k in self.images if k[:2] == key[:2]]:
+                del self.images[old]
+            self.images[key] = img
+        return img
+
+    def _retire(self, source, size, path):
+        """Record `path` as the current file for (source, size) and delete the one it replaces."""
+        index = self._file(source, f"{size[0]}x{size[1]}", ext=".json")
+        try:
+            with open(index) as f:
+                old = json.load(f).get("file")
+        except (OSError, ValueError):
+            old = None
+        name = os.path.basename(path)
+        if old == name:
+            return
+        tmp = index + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"source": source, "size": list(size), "file": name}, f)
+        os.replace(tmp, index)
+        if old:
+            try:
+                os.remove(os.path.join(self.cache_dir, old))
+            except FileNotFoundError:
+                pass
+
+    def local(self, path, size):
+        return self._scaled(path, size, os.stat(path).st_mtime_ns, lambda: Image.open(path))
+
+    def _etag(self, url):
+        try:
+            with open(self._file(url, ext=".json")) as f:
+                return json.load(f).get("etag")
+        except (OSError, ValueError):
+            return None
+
+    def cached_remote(self, url, size):
+        """Last fetched copy of `url` at `size`, or None if it was never fetched."""
+        etag = self._etag(url)
+        return self._scaled(url, size, etag) if etag else None
+
+    def fetch(self, url, size, on_update):
+        """Revalidate `url` in the background; on_update(img) runs on that thread if a new version arrives."""
+        with self.lock:
+            if (url, size) in self.fetching:
+                return
+            self.fetching.add((url, size))
+        threading.Thread(target=self._fetch, args=(url, size, on_update), daemon=True).start()
+
+    def _fetch(self, url, size, on_update):
+        try:
+            etag = self._etag(url)
+            have = etag and self.cached_remote(url, size) is not None
+            headers = {"If-None-Match": etag} if have else {}
+            resp = requests.get(url, timeout=self.timeout, headers=headers)
+            if resp.status_code == 304:
+                return
+            resp.raise_for_status()
+            content = resp.content
+            etag = resp.headers.get("ETag") or hashlib.sha1(content).hexdigest()
+            img = self._scaled(url, size, etag, lambda: Image.open(io.BytesIO(content)))
+            with open(self._file(url, ext=".json"), "w") as f:
+                json.dump({"url": url, "etag": etag}, f)
+            on_update(img)
+        except Exception as e:
+            print(f"[ICON] Error fetching '{url}': {e}")
+        finally:
+            with self.lock:
+                self.fetching.discard((url, size))
+
+_icon_cache = None
+
+def get_icon_cache():
+    global _icon_cache
+    if _icon_cache is None:
+        _icon_cache = IconCache()
+    return _icon_cache
@@ -1,14 +1,22 @@
 import tkinter as tk
 from PIL import Image, ImageTk
-import requests
-import io
 import threading
-import time
 import os
 
-from serial_device import SerialDevice
-from config import DEVICE_CONFIGS, DEVICE_ICONS, HTTP_ENDPOINT, OTHER_ICONS
-from db import init_db
+from serial_device import create_devices, await_all
+from config import (DEVICE_CONFIGS, DEVICE_ICONS, OTHER_ICONS, SIMULATE, METRICS_ENABLED,
+                    UI_POLL_MS, TRACE_CAPTURE_S)
+from db import init_db, close_db
+from uploader import get_uploader, stop_uploader
+from sync import get_delta_sync
+from icon_cache import get_icon_cache
+from retention import get_retention, stop_retention
+from analytics import get_analytics, stop_analytics
+from connection import get_connection_manager
+from assay import AssayPipeline
+from metrics import METRICS, start_metrics_server, stop_metrics_server
+from scheduler import PRIORITY_SYNC
+from tracing import TRACER, traced, start_from_env, stop_tracing
 
 def resource_path(rel_path):
     base = os.path.dirname(os.path.abspath(__file__))
@@ -48,37 +56,54 @@ def maximize_window(root):
         except Exception:
             root.attributes('-fullscreen', True)
 
-def get_icon(path_or_url, size=(44, 44)):
+_photos = {}   # (source, size) -> PhotoImage, shared by every widget showing that icon
+
+def _fallback_icon(cache, size):
     placeholder = resource_path(PLACEHOLDER_ICON)
+    if placeholder and os.path.exists(placeholder):
+        return cache.local(placeholder, size)
+    return Image.new("RGBA", size, (180, 180, 180, 255))
+
+def get_icon(path_or_url, size=(44, 44), on_update=None):
+    """
+    Tk image for an icon, served pre-scaled from the icon cache. A remote
+    icon shows its last cached copy (or the placeholder) at once and is
+    fetched in the background; on_update(photo, img) is then called from
+    the fetch thread so the caller can paste img into photo on the Tk thread.
+    """
+    key = (path_or_url, size)
+    if key in _photos:
+        return _photos[key]
+    cache = get_icon_cache()
+    remote = bool(path_or_url) and path_or_url.startswith("http")
     try:
-        if path_or_url and path_or_url.startswith("http"):
-            resp = requests.get(path_or_url, timeout=4)
-            img = Image.open(io.BytesIO(resp.content)).convert("RGBA")
+        if remote:
+            img = cache.cached_remote(path_or_url, size) or _fallback_icon(cache, size)
         elif path_or_url and os.path.exists(resource_path(path_or_url)):
-            img = Image.open(resource_path(path_or_url)).convert("RGBA")
-        elif placeholder and os.path.exists(placeholder):
-            img = Image.open(placeholder).convert("RGBA")
+            img = cache.local(resource_path(path_or_url), size)
         else:
             raise FileNotFoundError("No icon file found for path: %s" % path_or_url)
     except Exception as e:
         print(f"[ICON] Error loading '{path_or_url}': {e}")
-        if placeholder and os.path.exists(placeholder):
-            img = Image.open(placeholder).convert("RGBA")
-        else:
-            img = Image.new("RGBA", size, (180, 180, 180, 255))
-    img = img.resize(size, Image.LANCZOS)
-    return ImageTk.PhotoImage(img)
+        img = _fallback_icon(cache, size)
+    photo = ImageTk.PhotoImage(img)
+    _photos[key] = photo
+    if remote and on_update:
+        cache.fetch(path_or_url, size, lambda fresh: on_update(photo, fresh))
+    return photo
 
 class StatusDot(tk.Canvas):
     def __init__(self, parent, theme, **kwargs):
         super().__init__(parent, width=18, height=18, highlightthickness=0, bg=theme["card_bg"], **kwargs)
         self.theme = theme
         self.available = False
+        self.oval = self.create_oval(4, 4, 16, 16)
         self.draw()
 
     def set_available(self, available):
-        self.available = available
-        self.draw()
+        if available != self.available:
+            self.available = available
+            self.draw()
 
     def set_theme(self, theme):
         self.theme = theme
@@ -86,36 +111,69 @@ class StatusDot(tk.Canvas):
         self.draw()
 
     def draw(self):
-        self.delete("all")
         color = self.theme['dot_on'] if self.available else self.theme['dot_off']
-        self.create_oval(4, 4, 16, 16, fill=color, outline=color)
+        self.itemconfigure(self.oval, fill=color, outline=color)
+
+class UIEventQueue:
+    """
+    Hand-off of state changes from device/worker threads to the Tk thread.
+    Events are keyed by (kind, key); repeats before the next drain collapse
+    into the latest payload, so a chatty device costs one redraw per drain.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def post(self, kind, key, payload=None):
+        with self.lock:
+            self.pending.pop((kind, key), None)
+            self.pending[(kind, key)] = payload
+
+    def drain(self):
+        with self.lock:
+            events, self.pending = self.pending, {}
+        return events.items()
+
+class CardState:
+    """Per-device UI state; outlives the recycled DeviceCard currently showing it (if any)."""
+    def __init__(self, device, icon_img=None):
+        self.device = device
+        self.icon_img = icon_img
+        self.loading = False
+        self.status_override = None
+        self.health = None      # analytics.DeviceHealth, refreshed every ANALYTICS_INTERVAL_S
+        self.card = None
 
 class DeviceCard(tk.Frame):
-    def __init__(self, parent, device, icon_img=None, loading_img=None, theme=THEMES["dark"]):
+    def __init__(self, parent, loading_img=None, theme=THEMES["dark"]):
         super().__init__(parent, width=340, height=140, bg=theme["card_bg"], highlightthickness=2)
-        self.device = device
+        self.state = None
         self.theme = theme
-        self.icon_img = icon_img
         self.loading_img = loading_img
-        self._loading = False
+        self._shown = {}    # widget -> options last applied, so render() skips no-op configures
         self.grid_propagate(False)
+        self.pack_propagate(False)
         self._build_card()
 
+    @property
+    def device(self):
+        return self.state.device
+
     def _build_card(self):
         self.configure(bg=self.theme["card_bg"], highlightbackground=self.theme["card_border"], highlightcolor=self.theme["card_border"])
         # Top Row: Icon, Name, Status Dot
         top = tk.Frame(self, bg=self.theme["card_bg"])
         top.pack(fill="x", pady=(12, 3), padx=14)
-        if self.icon_img:
-            tk.Label(top, image=self.icon_img, bg=self.theme["card_bg"]).pack(side="left", padx=(0, 8))
-        else:
-            tk.Label(top, text="🟡", font=("Segoe UI", 20), bg=self.theme["card_bg"]).pack(side="left", padx=(0, 8))
+        self.icon_lbl = tk.Label(top, font=("Segoe UI", 20), bg=self.theme["card_bg"])
+        self.icon_lbl.pack(side="left", padx=(0, 8))
 
-        self.name_lbl = tk.Label(top, text=self.device.name, font=("Segoe UI", 15, "bold"),
+        self.name_lbl = tk.Label(top, text="", font=("Segoe UI", 15, "bold"),
                                  fg=self.theme["accent"], bg=self.theme["card_bg"])
         self.name_lbl.pack(side="left", padx=(0, 10))
         self.status_dot = StatusDot(top, self.theme)
         self.status_dot.pack(side="right", padx=(0, 2))
+        self.health_lbl = tk.Label(top, text="", font=("Segoe UI", 9, "bold"), bg=self.theme["card_bg"])
+        self.health_lbl.pack(side="right", padx=(0, 8))
 
         # Status
         self.status_lbl = tk.Label(self, text="Unavailable — disconnected", font=("Segoe UI", 11),
@@ -134,55 +192,323 @@ class DeviceCard(tk.Frame):
         self.loading_icon_lbl.place(relx=0.5, rely=0.67, anchor="center")
         self.loading_icon_lbl.lower()  # always below result text
 
+    def bind_state(self, state):
+        """Show another device in this (recycled) card."""
+        if self.state is state:
+            return
+        if self.state is not None and self.state.card is self:
+            self.state.card = None
+        self.state = state
+        state.card = self
+        if state.icon_img:
+            self._apply(self.icon_lbl, image=state.icon_img, text="")
+        else:
+            self._apply(self.icon_lbl, image="", text="🟡")
+        self._apply(self.name_lbl, text=state.device.name)
+        self.render()
+
     def set_theme(self, theme):
         self.theme = theme
         self.configure(bg=theme["card_bg"], highlightbackground=theme["card_border"], highlightcolor=theme["card_border"])
         for w in self.winfo_children():
             if isinstance(w, tk.Frame):
                 w.configure(bg=theme["card_bg"])
+        self.icon_lbl.configure(bg=theme["card_bg"])
         self.name_lbl.configure(fg=theme["accent"], bg=theme["card_bg"])
+        self.health_lbl.configure(bg=theme["card_bg"])
+        self._shown.pop(self.health_lbl, None)
         self.status_lbl.configure(bg=theme["card_bg"], fg=self.theme["unavailable"])
         self.result_lbl.configure(bg=theme["card_bg"])
         self.status_dot.set_theme(theme)
         self.loading_icon_lbl.configure(bg=theme["card_bg"])
-
-    def update_status(self):
-        available = self.device.serial is not None and self.device.serial.is_open and self.device.available
+        self._shown.pop(self.status_lbl, None)
+        self._shown.pop(self.result_lbl, None)
+        if self.state is not None:
+            self.render()
+
+    def _apply(self, widget, **options):
+        if self._shown.get(widget) != options:
+            widget.configure(**options)
+            self._shown[widget] = options
+
+    @traced("ui.render_card", "ui")
+    def render(self):
+        """Bring the widgets in line with the device state, touching only what changed."""
+        state = self.state
+        available = self.device.is_connected() and self.device.available
         self.status_dot.set_available(available)
-        if available:
-            self.status_lbl.configure(text="Connected — available", fg=self.theme["accent"])
+        if state.status_override:
+            text, color = state.status_override
+            self._apply(self.status_lbl, text=text, fg=self.theme[color])
+        elif not self.device.ready.is_set():
+            self._apply(self.status_lbl, text="Connecting…", fg=self.theme["status_warn"])
+        elif available:
+            self._apply(self.status_lbl, text="Connected — available", fg=self.theme["accent"])
+        else:
+            self._apply(self.status_lbl, text="Unavailable — disconnected", fg=self.theme["unavailable"])
+        health = state.health
+        if health is None or health.status == "unknown":
+            self._apply(self.health_lbl, text="")
+        elif health.status == "ok":
+            self._apply(self.health_lbl, text="● OK", fg=self.theme["accent"])
         else:
-            self.status_lbl.configure(text="Unavailable — disconnected", fg=self.theme["unavailable"])
+            self._apply(self.health_lbl, text=f"▲ {health.reason.upper()}",
+                        fg=self.theme["status_warn" if health.status == "warn" else "unavailable"])
         res = self.device.last_result
-        if self._loading:
+        if state.loading:
             # Hide text, show spinner
-            self.result_lbl.configure(text="", fg=self.theme["result"])
-            self.loading_icon_lbl.lift()
-            self.loading_icon_lbl.configure(image=self.loading_img)
-            self.loading_icon_lbl.place(relx=0.5, rely=0.67, anchor="center")
+            self._apply(self.result_lbl, text="", fg=self.theme["result"], bg=self.theme["card_bg"])
+            if self._apply_spinner(True):
+                self.loading_icon_lbl.lift()
+                self.loading_icon_lbl.place(relx=0.5, rely=0.67, anchor="center")
         else:
             # Hide spinner, show text
-            self.loading_icon_lbl.configure(image="")
-            self.result_lbl.lift()
+            if self._apply_spinner(False):
+                self.result_lbl.lift()
             if res:
                 if "weight_display" in res:
-                    self.result_lbl.configure(text=res["weight_display"], fg=self.theme["result"])
+                    self._apply(self.result_lbl, text=res["weight_display"], fg=self.theme["result"], bg=self.theme["card_bg"])
                 elif "weight" in res:
-                    self.result_lbl.configure(text=f"Weight = {res['weight']}", fg=self.theme["result"])
+                    self._apply(self.result_lbl, text=f"Weight = {res['weight']}", fg=self.theme["result"], bg=self.theme["card_bg"])
                 elif "error" in res:
                     txt = res["error"]
                     if "readonly" in txt or "read only" in txt:
-                        self.result_lbl.configure(text=txt, fg=self.theme["readonly"], bg=self.theme["readonly_bg"])
+                        self._apply(self.result_lbl, text=txt, fg=self.theme["readonly"], bg=self.theme["readonly_bg"])
                     else:
-                        self.result_lbl.configure(text=txt, fg=self.theme["unavailable"], bg=self.theme["card_bg"])
+                        self._apply(self.result_lbl, text=txt, fg=self.theme["unavailable"], bg=self.theme["card_bg"])
                 else:
-                    self.result_lbl.configure(text="No value", fg=self.theme["fg"], bg=self.theme["card_bg"])
+                    self._apply(self.result_lbl, text="No value", fg=self.theme["fg"], bg=self.theme["card_bg"])
             else:
-                self.result_lbl.configure(text="", fg=self.theme["fg"], bg=self.theme["card_bg"])
+                self._apply(self.result_lbl, text="", fg=self.theme["fg"], bg=self.theme["card_bg"])
+
+    def _apply_spinner(self, loading):
+        """Show/hide the spinner image; True if it changed."""
+        image = self.loading_img if loading else ""
+        if self._shown.get(self.loading_icon_lbl) == {"image": image}:
+            return False
+        self._apply(self.loading_icon_lbl, image=image)
+        return True
+
+class VirtualCardGrid(tk.Frame):
+    """
+    Scrollable grid of device cards grouped by station. Only rows in view
+    have widgets: a pool of DeviceCards and station headers is re-bound to
+    whatever scrolls into view, so build and refresh cost follow the window
+    size, not the number of configured devices.
+    """
+    CARD_W, CARD_H, PAD_X, PAD_Y, HEADER_H = 340, 140, 34, 18, 44
+
+    def __init__(self, parent, states, loading_img, theme):
+        super().__init__(parent, bg=theme["panel_bg"])
+        self.states = states
+        self.loading_img = loading_img
+        self.theme = theme
+        self.canvas = tk.Canvas(self, bg=theme["panel_bg"], highlightthickness=0, bd=0)
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self._yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.rows = []          # (y, height, kind, payload) with kind "header" or "cards"
+        self.cols = 0
+        self.cards = []         # pool of (DeviceCard, canvas window id)
+        self.headers = []       # pool of (Label, canvas window id)
+        self._refresh_pending = False
+        self.canvas.bind("<Configure>", lambda e: self._layout())
+        # Cards cover the canvas, so the wheel is grabbed while the pointer is over the grid
+        self.bind("<Enter>", self._grab_wheel)
+        self.bind("<Leave>", self._release_wheel)
+
+    WHEEL_EVENTS = ("<MouseWheel>", "<Button-4>", "<Button-5>")
+
+    def _grab_wheel(self, event):
+        for seq in self.WHEEL_EVENTS:
+            self.bind_all(seq, self._on_wheel)
+
+    def _release_wheel(self, event):
+        for seq in self.WHEEL_EVENTS:
+            self.unbind_all(seq)
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self._schedule_refresh()
+
+    def _on_wheel(self, event):
+        step = -1 if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0 else 1
+        self.canvas.yview_scroll(step, "units")
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.after_idle(self._refresh_visible)
+
+    @traced("ui.layout", "ui")
+    def _layout(self):
+        """Recompute row positions for the current width; cheap, no widgets are created here."""
+        cell_w = self.CARD_W + 2 * self.PAD_X
+        cols = max(1, self.canvas.winfo_width() // cell_w)
+        self.cols = cols
+        self.rows = []
+        y = 0
+        stations = {}
+        for state in self.states:
+            stations.setdefault(state.device.station, []).append(state)
+        show_headers = len(stations) > 1
+        for station, members in stations.items():
+            if show_headers:
+                self.rows.append((y, self.HEADER_H, "header", station))
+                y += self.HEADER_H
+            for i in range(0, len(members), cols):
+                height = self.CARD_H + 2 * self.PAD_Y
+                self.rows.append((y, height, "cards", members[i:i + cols]))
+                y += height
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), y))
+        self.canvas.configure(yscrollincrement=self.CARD_H // 2)
+        self._schedule_refresh()
+
+    def _pooled(self, pool, index, make):
+        while len(pool) <= index:
+            widget = make()
+            pool.append((widget, self.canvas.create_window(0, 0, window=widget, anchor="nw", state="hidden")))
+        return pool[index]
+
+    @traced("ui.refresh_visible", "ui")
+    def _refresh_visible(self):
+        self._refresh_pending = False
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        x0 = max(0, (self.canvas.winfo_width() - self.cols * (self.CARD_W + 2 * self.PAD_X)) // 2)
+        n_cards = n_headers = 0
+        for y, height, kind, payload in self.rows:
+            if y + height < top:
+                continue
+            if y > bottom:
+                break
+            if kind == "header":
+                label, item = self._pooled(self.headers, n_headers, lambda: tk.Label(
+                    self.canvas, font=("Segoe UI", 14, "bold"), anchor="w",
+                    fg=self.theme["subtitle"], bg=self.theme["panel_bg"]))
+                label.configure(text=payload)
+                self.canvas.coords(item, x0 + self.PAD_X, y + 12)
+                self.canvas.itemconfigure(item, state="normal")
+                n_headers += 1
+                continue
+            for col, state in enumerate(payload):
+                card, item = self._pooled(self.cards, n_cards, lambda: DeviceCard(
+                    self.canvas, loading_img=self.loading_img, theme=self.theme))
+                card.bind_state(state)
+                self.canvas.coords(item, x0 + col * (self.CARD_W + 2 * self.PAD_X) + self.PAD_X, y + self.PAD_Y)
+                self.canvas.itemconfigure(item, state="normal")
+                n_cards += 1
+        for card, item in self.cards[n_cards:]:
+            self.canvas.itemconfigure(item, state="hidden")
+            if card.state is not None and card.state.card is card:
+                card.state.card = None
+            card.state = None
+        for _, item in self.headers[n_headers:]:
+            self.canvas.itemconfigure(item, state="hidden")
 
-    def show_loading(self, is_loading=True):
-        self._loading = is_loading
-        self.update_status()
+    def set_theme(self, theme):
+        self.theme = theme
+        self.configure(bg=theme["panel_bg"])
+        self.canvas.configure(bg=theme["panel_bg"])
+        for card, _ in self.cards:
+            card.set_theme(theme)
+        for label, _ in self.headers:
+            label.configure(fg=theme["subtitle"], bg=theme["panel_bg"])
+
+class StationSummary(tk.Frame):
+    """Compact view: one line per station with availability and error counts."""
+    def __init__(self, parent, states, theme):
+        super().__init__(parent, bg=theme["panel_bg"])
+        self.theme = theme
+        self.stations = {}
+        for state in states:
+            self.stations.setdefault(state.device.station, []).append(state)
+        self.labels = {}
+        for station in self.stations:
+            label = tk.Label(self, font=("Segoe UI", 13), anchor="w", bg=theme["panel_bg"])
+            label.pack(fill="x", padx=40, pady=4)
+            self.labels[station] = label
+            self.update_station(station)
+
+    @traced("ui.update_station", "ui")
+    def update_station(self, station):
+        members = self.stations[station]
+        up = sum(1 for s in members if s.device.is_connected() and s.device.available)
+        errors = sum(1 for s in members if isinstance(s.device.last_result, dict) and "error" in s.device.last_result)
+        color = self.theme["accent"] if up == len(members) and not errors else self.theme["status_warn"] if up else self.theme["unavailable"]
+        self.labels[station].configure(text=f"{station}  —  {up}/{len(members)} available  ·  {errors} with errors",
+                                       fg=color)
+
+    def set_theme(self, theme):
+        self.theme = theme
+        self.configure(bg=theme["panel_bg"])
+        for station, label in self.labels.items():
+            label.configure(bg=theme["panel_bg"])
+            self.update_station(station)
+
+class DiagnosticsPanel(tk.Toplevel):
+    """Live view of the latency histograms in metrics.METRICS (p50/p99 are bucket upper bounds)."""
+    def __init__(self, app):
+        super().__init__(app)
+        self.app = app
+        self.title("Diagnostics")
+        self.geometry("760x420")
+        self.trace_note = ""    # set from the capture thread, shown on the next refresh
+        self.trace_btn = tk.Button(self, text=f"Capture {TRACE_CAPTURE_S} s trace", command=self.capture_trace,
+                                   bg=app.theme["button_bg"], fg=app.theme["button_fg"],
+                                   activebackground=app.theme["btn_active"], relief="flat", bd=0, padx=10, pady=4)
+        self.trace_btn.pack(side="bottom", anchor="w", padx=8, pady=(0, 8))
+        self.text = tk.Text(self, font=("Consolas", 10), bg=app.theme["panel_bg"], fg=app.theme["subtitle"],
+                            bd=0, wrap="none")
+        self.text.pack(fill="both", expand=True, padx=8, pady=8)
+        self.protocol("WM_DELETE_WINDOW", app.toggle_diagnostics)
+        self.refresh_id = None
+        self.refresh()
+
+    def destroy(self):
+        if self.refresh_id is not None:
+            self.after_cancel(self.refresh_id)
+            self.refresh_id = None
+        super().destroy()
+
+    def capture_trace(self):
+        """Record spans for TRACE_CAPTURE_S in the background and write them under TRACE_DIR."""
+        def done(result):
+            self.trace_note = f"Trace: {result}"
+        if TRACER.capture(on_done=done) is not None:
+            self.trace_note = f"Tracing for {TRACE_CAPTURE_S} s..."
+
+    @staticmethod
+    def _ms(hist, q):
+        v = hist.quantile(q)
+        if v is None:
+            return "      -"
+        return "   >5 s" if v == float("inf") else f"{v * 1000:7.1f}"
+
+    @traced("ui.diagnostics", "ui")
+    def refresh(self):
+        lines = [f"{'device':14} {'cmd':4} {'phase':10} {'count':>7} {'p50 ms':>7} {'p99 ms':>7}"]
+        family = METRICS.histograms.get("gold_command_latency_seconds", ("", {}))[1]
+        for key, hist in sorted(list(family.items())):
+            labels = dict(key)
+            lines.append(f"{labels['device']:14} {labels['command']:4} {labels['phase']:10} {hist.count:7d}"
+                         f" {self._ms(hist, 0.5)} {self._ms(hist, 0.99)}")
+        lines.append("")
+        for dev in self.app.devices:
+            lines.append(f"{dev.name:14} queue depth {dev.queue_depth():3d}   budgets {dev.timing.summary()}")
+        lines.append("")
+        for name in ("gold_db_lock_wait_seconds", "gold_db_commit_seconds", "gold_http_upload_seconds"):
+            for hist in list(METRICS.histograms.get(name, ("", {}))[1].values()):
+                lines.append(f"{name:28} {hist.count:7d} {self._ms(hist, 0.5)} {self._ms(hist, 0.99)}")
+        if self.trace_note:
+            lines += ["", self.trace_note]
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("1.0", "\n".join(lines))
+        self.text.configure(state="disabled")
+        self.refresh_id = self.after(1000, self.refresh)
 
 class GoldControllerApp(tk.Tk):
     def __init__(self):
@@ -201,18 +527,40 @@ class GoldControllerApp(tk.Tk):
         self.theme_name = "dark"
         self.theme = THEMES[self.theme_name]
 
+        start_from_env()
         init_db()
+        get_uploader()
+        get_retention()
+        if METRICS_ENABLED:
+            start_metrics_server()
+        self.diagnostics = None
         self.icon_imgs = {}
         for k, url in DEVICE_ICONS.items():
-            self.icon_imgs[k] = get_icon(url)  # returns a Tk image object
+            self.icon_imgs[k] = get_icon(url, on_update=self.update_icon)  # returns a Tk image object
 
         self.loading_img = get_icon(LOADING_ICON, size=(38, 38))
 
-        self.devices = [SerialDevice(**cfg) for cfg in DEVICE_CONFIGS]
-        self.device_cards = []
+        device_configs = DEVICE_CONFIGS
+        self.simulator = None
+        if SIMULATE:
+            from simulator import simulated_device_configs
+            self.simulator, device_configs = simulated_device_configs(DEVICE_CONFIGS)
+            get_connection_manager().ports_fn = self.simulator.list_ports
+        # Devices open and probe in the background; the window does not wait for them
+        self.devices = create_devices(device_configs)
+        self.device_states = [CardState(dev, self.icon_imgs.get(dev.name) or self.icon_imgs.get(dev.protocol))
+                              for dev in self.devices]
+        self.events = UIEventQueue()
+        self._awaiting_first_reading = set(self.devices)
+        self._first_reading_lock = threading.Lock()
+        self.assay = AssayPipeline(self.devices, on_update=lambda _item: self.events.post("assay", self.assay, None))
         self.build_ui()
-        self.after(800, self.auto_initial_check)
-        self.refresh_cards_loop()
+        for state in self.device_states:
+            state.device.change_listeners.append(lambda _dev, state=state: self.on_device_changed(state))
+            self.on_device_changed(state)   # it may have come up while the UI was being built
+        get_analytics().listeners.append(self.on_health_report)
+        self.drain_ui_events()
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def build_ui(self):
         self.configure(bg=self.theme["bg"])
@@ -231,36 +579,25 @@ class GoldControllerApp(tk.Tk):
                                    font=("Segoe UI", 12, "bold"), bd=0, relief="flat", cursor="hand2",
                                    activebackground=self.theme["panel_bg"], activeforeground=self.theme["accent"])
         self.theme_btn.place(relx=1.0, x=-24, y=10, anchor="ne")
+        self.diag_btn = tk.Button(block, text="📊 Diagnostics", command=self.toggle_diagnostics,
+                                  bg=self.theme["panel_bg"], fg=self.theme["subtitle"],
+                                  font=("Segoe UI", 12, "bold"), bd=0, relief="flat", cursor="hand2",
+                                  activebackground=self.theme["panel_bg"], activeforeground=self.theme["accent"])
+        self.diag_btn.place(relx=1.0, x=-150, y=10, anchor="ne")
+        self.view_btn = tk.Button(block, text="☰ Summary", command=self.toggle_view,
+                                  bg=self.theme["panel_bg"], fg=self.theme["subtitle"],
+                                  font=("Segoe UI", 12, "bold"), bd=0, relief="flat", cursor="hand2",
+                                  activebackground=self.theme["panel_bg"], activeforeground=self.theme["accent"])
+        self.view_btn.place(relx=1.0, x=-300, y=10, anchor="ne")
         # Title and subtitle
         tk.Label(block, text="GoldController", font=("Segoe UI", 29, "bold"),
                  fg=self.theme["title"], bg=self.theme["panel_bg"]).pack(pady=(14, 0))
         tk.Label(block, text="Real-time monitoring and control system", font=("Segoe UI", 14),
                  fg=self.theme["subtitle"], bg=self.theme["panel_bg"]).pack(pady=(2, 13))
 
-        # ---- CARD GRID ----
-        panel = tk.Frame(self, bg=self.theme["panel_bg"])
-        panel.pack(fill="x", padx=60, pady=(10, 0))
-        self.card_grid = tk.Frame(panel, bg=self.theme["panel_bg"])
-        self.card_grid.pack(anchor="center", pady=18)
-        # fill grid
-        self.device_cards = []
-        idx = 0
-        for row in range(2):
-            for col in range(3):
-                if idx < len(self.devices):
-                    dev = self.devices[idx]
-                    card = DeviceCard(self.card_grid, dev, icon_img=self.icon_imgs.get(dev.name), loading_img=self.loading_img, theme=self.theme)
-                    card.grid(row=row, column=col, padx=34, pady=18)
-                    self.device_cards.append(card)
-                    idx += 1
-                else:
-                    empty = tk.Frame(self.card_grid, width=340, height=140, bg=self.theme["panel_bg"])
-                    empty.grid(row=row, column=col, padx=34, pady=18)
-
         # ---- BUTTONS ----
-        tk.Frame(self, height=18, bg=self.theme["bg"]).pack()
         btn_bar = tk.Frame(self, bg=self.theme["bg"])
-        btn_bar.pack(fill="x", padx=0, pady=(0, 18))
+        btn_bar.pack(side="bottom", fill="x", padx=0, pady=(18, 18))
         btn_bar.columnconfigure(0, weight=1)
         btn_bar.columnconfigure(2, weight=1)
         self.check_btn = tk.Button(btn_bar, text="Check Now", command=self.check_all,
@@ -274,103 +611,225 @@ class GoldControllerApp(tk.Tk):
                                   bg=self.theme["button_bg"], fg=self.theme["button_fg"],
                                   activebackground=self.theme["btn_active"], bd=0, relief="ridge")
         self.sync_btn.grid(row=0, column=2, padx=18)
+        self.streaming = False
+        if any(dev.stream_cfg for dev in self.devices):
+            tk.Frame(btn_bar, width=60, bg=self.theme["bg"]).grid(row=0, column=3)
+            self.stream_btn = tk.Button(btn_bar, text="Start Stream", command=self.toggle_streaming,
+                                        font=("Segoe UI", 16, "bold"), width=18, height=2,
+                                        bg=self.theme["button_bg"], fg=self.theme["button_fg"],
+                                        activebackground=self.theme["btn_active"], bd=0, relief="ridge")
+            self.stream_btn.grid(row=0, column=4, padx=18)
+            btn_bar.columnconfigure(4, weight=1)
+        else:
+            self.stream_btn = None
+        tk.Frame(btn_bar, width=60, bg=self.theme["bg"]).grid(row=0, column=5)
+        self.assay_btn = tk.Button(btn_bar, text="Start Assay", command=self.start_assay,
+                                   font=("Segoe UI", 16, "bold"), width=18, height=2,
+                                   bg=self.theme["button_bg"], fg=self.theme["button_fg"],
+                                   activebackground=self.theme["btn_active"], bd=0, relief="ridge")
+        self.assay_btn.grid(row=0, column=6, padx=18)
+        btn_bar.columnconfigure(6, weight=1)
+        self.assay_label = tk.Label(self, text="Assay: idle", font=("Segoe UI", 12),
+                                    fg=self.theme["subtitle"], bg=self.theme["bg"])
+        self.assay_label.pack(side="bottom", pady=(6, 0))
+
+        # ---- CARD GRID ----
+        # Packed last so the button bar keeps its room; the grid takes the rest
+        self.panel = tk.Frame(self, bg=self.theme["panel_bg"])
+        self.panel.pack(fill="both", expand=True, padx=60, pady=(10, 0))
+        self.card_grid = VirtualCardGrid(self.panel, self.device_states, self.loading_img, self.theme)
+        self.card_grid.pack(fill="both", expand=True, pady=18)
+        self.summary = StationSummary(self.panel, self.device_states, self.theme)
+        self.summary_view = False
 
     def set_theme_all(self):
         self.theme = THEMES[self.theme_name]
         self.configure(bg=self.theme["bg"])
         # Update theme button (now inside the block panel)
         self.theme_btn.configure(bg=self.theme["panel_bg"], fg=self.theme["subtitle"], activebackground=self.theme["panel_bg"], activeforeground=self.theme["accent"])
+        self.diag_btn.configure(bg=self.theme["panel_bg"], fg=self.theme["subtitle"], activebackground=self.theme["panel_bg"], activeforeground=self.theme["accent"])
         for w in self.winfo_children():
             if isinstance(w, tk.Frame):
                 w.configure(bg=self.theme["bg"])
-        # Cards
-        for card in self.device_cards:
-            card.set_theme(self.theme)
+        self.view_btn.configure(bg=self.theme["panel_bg"], fg=self.theme["subtitle"], activebackground=self.theme["panel_bg"], activeforeground=self.theme["accent"])
         self.check_btn.configure(bg=self.theme["button_bg"], fg=self.theme["button_fg"], activebackground=self.theme["btn_active"])
         self.sync_btn.configure(bg=self.theme["button_bg"], fg=self.theme["button_fg"], activebackground=self.theme["btn_active"])
-        # Panels
-        for panel in [self.card_grid.master, self.card_grid]:
-            panel.configure(bg=self.theme["panel_bg"])
-        for child in self.card_grid.winfo_children():
-            if isinstance(child, tk.Frame) and not hasattr(child, "device"):
-                child.configure(bg=self.theme["panel_bg"])
+        if self.stream_btn:
+            self.stream_btn.configure(bg=self.theme["button_bg"], fg=self.theme["button_fg"], activebackground=self.theme["btn_active"])
+        self.assay_btn.configure(bg=self.theme["button_bg"], fg=self.theme["button_fg"], activebackground=self.theme["btn_active"])
+        self.assay_label.configure(bg=self.theme["bg"], fg=self.theme["subtitle"])
+        # Panels and cards
+        self.panel.configure(bg=self.theme["panel_bg"])
+        self.card_grid.set_theme(self.theme)
+        self.summary.set_theme(self.theme)
 
     def toggle_theme(self):
         self.theme_name = "light" if self.theme_name == "dark" else "dark"
         self.set_theme_all()
 
-    def refresh_cards_loop(self):
-        for card in self.device_cards:
-            card.update_status()
-        self.after(400, self.refresh_cards_loop)
-
-    def auto_initial_check(self):
-        def initial_sequence():
-            for dev, card in zip(self.devices, self.device_cards):
-                dev.send_command("B")
-                time.sleep(0.6)
-            time.sleep(1)
-            for dev, card in zip(self.devices, self.device_cards):
-                if dev.serial and dev.serial.is_open and dev.available:
-                    card.show_loading(True)
-                    dev.send_command("S")
-                    t0 = time.time()
-                    while time.time() - t0 < 2.2:
-                        if dev.last_result and "weight_display" in dev.last_result:
-                            break
-                        time.sleep(0.15)
-                    card.show_loading(False)
-        threading.Thread(target=initial_sequence, daemon=True).start()
+    @traced("ui.drain_events", "ui")
+    def drain_ui_events(self):
+        """Apply state changes posted by device/worker threads; only visible cards are touched."""
+        stations = set()
+        for (kind, target), payload in self.events.drain():
+            if kind == "icon":
+                target.paste(payload)   # every widget showing this PhotoImage updates
+                continue
+            if kind == "assay":
+                self.update_assay_status()
+                continue
+            if kind == "device":
+                target.status_override = None
+                stations.add(target.device.station)
+            elif kind == "loading":
+                target.loading = payload
+            elif kind == "status":
+                target.status_override = payload
+            elif kind == "health":
+                target.health = payload
+            if target.card is not None:
+                target.card.render()
+        if self.summary_view:
+            for station in stations:
+                self.summary.update_station(station)
+        self.after(UI_POLL_MS, self.drain_ui_events)
+
+    def update_icon(self, photo, img):
+        self.events.post("icon", photo, img)
+
+    def set_loading(self, state, is_loading):
+        self.events.post("loading", state, is_loading)
+
+    def on_health_report(self, report):
+        """Analytics thread: new {device: DeviceHealth} report."""
+        for state in self.device_states:
+            self.events.post("health", state, report.get(state.device.name))
+
+    def set_status(self, state, text, color):
+        """Override the status line (e.g. sync progress) until the device state next changes."""
+        self.events.post("status", state, (text, color))
+
+    def on_device_changed(self, state):
+        """Device-thread listener: refresh the card and take the first reading once the device is available."""
+        self.events.post("device", state)
+        dev = state.device
+        if not dev.available:
+            return
+        with self._first_reading_lock:
+            if dev not in self._awaiting_first_reading:
+                return
+            self._awaiting_first_reading.discard(dev)
+        self.set_loading(state, True)
+        dev.send_command("S").add_done_callback(lambda _: self.set_loading(state, False))
+
+    def toggle_view(self):
+        """Switch between the card grid and the one-line-per-station summary."""
+        self.summary_view = not self.summary_view
+        if self.summary_view:
+            self.card_grid.pack_forget()
+            for station in self.summary.stations:
+                self.summary.update_station(station)
+            self.summary.pack(fill="both", expand=True, pady=18)
+        else:
+            self.summary.pack_forget()
+            self.card_grid.pack(fill="both", expand=True, pady=18)
+        self.view_btn.configure(text="▦ Cards" if self.summary_view else "☰ Summary")
 
     def check_all(self):
         def check_sequence():
-            for dev, card in zip(self.devices, self.device_cards):
+            # Each device gets as long as its learned timing profile says it needs
+            futures, deadline = {}, 0.0
+            for state in self.device_states:
+                dev = state.device
                 if dev.serial and dev.serial.is_open and dev.available:
-                    card.show_loading(True)
-                    dev.send_command("S")
+                    self.set_loading(state, True)
+                    futures[state] = dev.send_command("S", deadline_s=dev.timing.deadline("S"))
+                    deadline = max(deadline, dev.timing.deadline("S"))
                 else:
-                    card.show_loading(False)
-            for dev, card in zip(self.devices, self.device_cards):
-                if dev.serial and dev.serial.is_open and dev.available:
-                    t0 = time.time()
-                    while time.time() - t0 < 2.2:
-                        if dev.last_result and "weight_display" in dev.last_result:
-                            break
-                        time.sleep(0.15)
-                    card.show_loading(False)
-                else:
-                    card.show_loading(False)
+                    self.set_loading(state, False)
+            results = await_all(futures, deadline, on_result=lambda state, _: self.set_loading(state, False))
+            for state, res in results.items():
+                if isinstance(res, TimeoutError):
+                    self.set_loading(state, False)
         threading.Thread(target=check_sequence, daemon=True).start()
 
     def sync_all(self):
         def sync_sequence():
-            results = {}
-            for dev in self.devices:
-                if dev.serial and dev.serial.is_open and dev.available:
-                    dev.send_command("P")
-                    t0 = time.time()
-                    while time.time() - t0 < 3:
-                        if dev.last_result:
-                            break
-                        time.sleep(0.2)
-                    results[dev.name] = dev.last_result
-            try:
-                payload = {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
-                    "results": results
-                }
-                resp = requests.post(HTTP_ENDPOINT, json=payload, timeout=5)
-                for card in self.device_cards:
-                    card.status_lbl.config(text=f"Sync: {resp.status_code}",
-                                          fg=self.theme["accent"] if resp.status_code == 200 else self.theme["status_warn"])
-            except Exception as ex:
-                for card in self.device_cards:
-                    card.status_lbl.config(text=f"HTTP error: {ex}", fg=self.theme["unavailable"])
+            # Fan out "P" to every available device, then gather until the slowest one's learned deadline
+            ready = [dev for dev in self.devices if dev.serial and dev.serial.is_open and dev.available]
+            futures = {dev.name: dev.send_command("P", PRIORITY_SYNC, dev.timing.deadline("P")) for dev in ready}
+            deadline = max((dev.timing.deadline("P") for dev in ready), default=0.0)
+            results, timed_out = {}, []
+            for name, res in await_all(futures, deadline).items():
+                if isinstance(res, TimeoutError):
+                    timed_out.append(name)
+                else:
+                    results[name] = res
+
+            def on_progress(report):
+                for state in self.device_states:
+                    self.set_status(state, f"Sync: {report.rows} new rows sent", "status_warn")
+            for state in self.device_states:
+                self.set_status(state, "Sync: sending", "status_warn")
+            # Only rows the server has not acknowledged and snapshots that changed go out
+            report = get_delta_sync().sync(results, on_progress)
+            for state in self.device_states:
+                if report.error:
+                    self.set_status(state, f"Sync error: {report.error} (will resend)", "unavailable")
+                elif state.device.name in timed_out:
+                    self.set_status(state, f"Sync: {report.rows} rows (timed out)", "status_warn")
+                elif not report.batches:
+                    self.set_status(state, "Sync: up to date", "accent")
+                else:
+                    self.set_status(state, f"Sync: {report.rows} rows, {report.bytes / 1024:.1f} KiB", "accent")
         threading.Thread(target=sync_sequence, daemon=True).start()
 
+    def toggle_diagnostics(self):
+        if self.diagnostics is None:
+            self.diagnostics = DiagnosticsPanel(self)
+        else:
+            self.diagnostics.destroy()
+            self.diagnostics = None
+
+    def toggle_streaming(self):
+        """Switch continuous output on/off for every device with a STREAM_CONFIGS entry."""
+        self.streaming = not self.streaming
+        for dev in self.devices:
+            if dev.stream_cfg:
+                if self.streaming:
+                    dev.start_streaming()
+                else:
+                    dev.stop_streaming()
+        self.stream_btn.configure(text="Stop Stream" if self.streaming else "Start Stream")
+
+    def start_assay(self):
+        try:
+            self.assay.submit()
+        except RuntimeError as e:
+            print(f"[ASSAY] {e}")
+
+    @traced("ui.assay_status", "ui")
+    def update_assay_status(self):
+        stages = "  ".join(f"{name}: {item_id or '-'}" for name, item_id in self.assay.in_progress().items())
+        self.assay_label.configure(
+            text=f"Assay  {stages}   |  waiting {sum(s.queue.qsize() for s in self.assay.stages)}"
+                 f"  done {self.assay.done}  failed {self.assay.failed}  {self.assay.items_per_hour():.0f} items/h"
+                 + (f"  not uploaded {self.assay.not_uploaded}" if self.assay.not_uploaded else "")
+                 + (f"  unsaved {self.assay.unsaved}" if self.assay.unsaved else ""))
+
     def on_closing(self):
+        if getattr(self, "assay", None):
+            self.assay.stop()
         for dev in getattr(self, "devices", []):
             dev.close()
+        stop_uploader()
+        stop_retention()
+        stop_analytics()
+        close_db()
+        stop_metrics_server()
+        stop_tracing()
+        if getattr(self, "simulator", None):
+            self.simulator.close()
         self.destroy()
 
 if __name__ == "__main__":
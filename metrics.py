@@ -0,0 +1,146 @@
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from config import METRICS_HOST, METRICS_PORT
+
+# Seconds. Wide enough for a 115200 baud reply (sub-ms) up to a 3-line 'S' timeout.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    """
+    Fixed-bucket histogram. observe() is a bisect and two adds with no lock:
+    under the GIL a concurrent update can at worst be lost, which is fine for
+    diagnostics and keeps the hot path cheap.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf if in the overflow bucket)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+def _escape_label(value):
+    """Backslash, double quote and newline escaped as the text exposition format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Registry:
+    """Named metric families with label sets, rendered in Prometheus text format."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}    # name -> (help, {labels: Histogram})
+        self.gauges = {}        # name -> (help, {labels: callable})
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        family = self.histograms.get(name)
+        if family is None or key not in family[1]:
+            with self.lock:
+                family = self.histograms.setdefault(name, (help_text, {}))
+                family[1].setdefault(key, Histogram(buckets))
+        return family[1][key]
+
+    def gauge(self, name, help_text, fn, **labels):
+        """Register a gauge whose value is read from fn() at scrape time."""
+        with self.lock:
+            self.gauges.setdefault(name, (help_text, {}))[1][tuple(sorted(labels.items()))] = fn
+
+    def remove_gauge(self, name, **labels):
+        with self.lock:
+            family = self.gauges.get(name)
+            if family:
+                family[1].pop(tuple(sorted(labels.items())), None)
+
+    @staticmethod
+    def _labels(key, extra=None):
+        items = list(key) + ([extra] if extra else [])
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items) + "}"
+
+    def render(self):
+        lines = []
+        with self.lock:
+            histograms = {name: (h, dict(series)) for name, (h, series) in self.histograms.items()}
+            gauges = {name: (h, dict(series)) for name, (h, series) in self.gauges.items()}
+        for name, (help_text, series) in sorted(histograms.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, n in zip(hist.buckets, hist.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{self._labels(key, ('le', repr(bound)))} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(key, ('le', '+Inf'))} {hist.count}")
+                lines.append(f"{name}_sum{self._labels(key)} {hist.sum}")
+                lines.append(f"{name}_count{self._labels(key)} {hist.count}")
+        for name, (help_text, series) in sorted(gauges.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, fn in sorted(series.items()):
+                try:
+                    value = fn()
+                except Exception:
+                    continue
+                lines.append(f"{name}{self._labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+METRICS = Registry()
+
+def command_histogram(device, command, phase):
+    return METRICS.histogram("gold_command_latency_seconds",
+                             "Serial command latency by phase: queue (enqueue->write), "
+                             "first_byte (write->first byte), total (enqueue->answer)",
+                             device=device, command=command, phase=phase)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+_server = None
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve METRICS at http://host:port/metrics from a daemon thread."""
+    global _server
+    if _server is None:
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"[METRICS] Could not bind {host}:{port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, daemon=True, name="MetricsServer").start()
+    return _server
+
+def stop_metrics_server():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
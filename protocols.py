@@ -0,0 +1,98 @@
+import re
+import json
+
+# 'S S      1.182 g' (stable) or 'S      1.182 g'
+WEIGHT_RE = re.compile(r'(?:S S|S)\s*([\d.]+)\s*g')
+
+# Continuous output, e.g. MT-SICS 'SIR': 'S D     1.183 g' (dynamic) / 'S S     1.182 g' (stable)
+STREAM_WEIGHT_RE = re.compile(r'S\s+[SD]?\s*([-+]?[\d.]+)\s*g')
+
+MAX_LINE = 4096
+
+class LineFramer:
+    """
+    Per-port receive buffer. feed() takes whatever bytes one read returned
+    and hands back every complete line; a trailing partial line is kept
+    until the rest arrives.
+    """
+    def __init__(self, max_line=MAX_LINE):
+        self.buf = bytearray()
+        self.max_line = max_line
+
+    def feed(self, data):
+        if data:
+            self.buf += data
+        lines = []
+        if data and b"\n" in data:
+            *complete, rest = self.buf.split(b"\n")
+            self.buf = bytearray(rest)
+            lines = [raw.decode("utf-8", errors="ignore").strip() for raw in complete]
+        if len(self.buf) > self.max_line:
+            # Runaway line without a terminator: surface it rather than grow forever
+            lines.append(self.flush())
+        return lines
+
+    def flush(self):
+        """Return and clear any partial line."""
+        partial = self.buf.decode("utf-8", errors="ignore").strip()
+        self.buf.clear()
+        return partial
+
+# --- parsers: line -> result dict, or None if the line is not an answer ---
+
+def parse_weighing(line):
+    match = WEIGHT_RE.match(line)
+    if not match:
+        return None
+    value = match.group(1)
+    result = {"weight_display": f"Weight = {value} g"}
+    try:
+        result["value"] = float(value)
+    except ValueError:
+        pass
+    return result
+
+def parse_weighing_stream(line):
+    """Streaming samples are parsed to a bare float: no per-sample dicts on the hot path."""
+    match = STREAM_WEIGHT_RE.match(line)
+    if not match:
+        return None
+    try:
+        return float(match.group(1))
+    except ValueError:
+        return None
+
+def parse_json(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+PARSERS = {
+    "default": {"S": parse_weighing, "P": parse_json, "stream": parse_weighing_stream},
+    "Weighing": {"S": parse_weighing, "P": parse_json, "stream": parse_weighing_stream},
+    # Hooks for the other instruments. Until their own formats are
+    # registered they fall back to "default".
+    "Conductivity": {},
+    "Magnetic": {},
+    "XRF": {},
+    "AI Vision": {},
+}
+
+def register_parser(protocol, cmd, parser=None):
+    """
+    Register `parser` for (protocol, cmd). Usable as a decorator:
+
+        @register_parser("XRF", "S")
+        def parse_xrf(line): ...
+    """
+    def _register(fn):
+        PARSERS.setdefault(protocol, {})[cmd] = fn
+        return fn
+    if parser is not None:
+        return _register(parser)
+    return _register
+
+def get_parser(protocol, cmd):
+    parser = PARSERS.get(protocol, {}).get(cmd)
+    return parser or PARSERS["default"].get(cmd)
@@ -0,0 +1,278 @@
+import os
+import sys
+import gzip
+import json
+import time
+import sqlite3
+import datetime
+import argparse
+import threading
+from fnmatch import fnmatchcase
+
+from config import (DBFILE, LOGFILE, RETENTION_POLICIES, RETENTION_INTERVAL_S, RETENTION_CHUNK_ROWS,
+                    RETENTION_PAUSE_S, RETENTION_VACUUM_PAGES, ARCHIVE_DIR, LOGFILE_MAX_BYTES,
+                    OUTBOX_KEEP_DAYS)
+from db import DB_WRITE_LOCK, LOG_COLUMNS, decode_result
+
+HEARTBEAT_COLUMNS = ("id", "device", "status", "first_seen", "last_seen", "count", "last_response", "last_error")
+BUCKET_S = {"hour": 3600, "day": 86400}
+UPSERT_SUMMARY_SQL = """
+    INSERT INTO log_summaries (device, command, bucket_ts, count, errors, value_count, value_sum, value_min, value_max)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(device, command, bucket_ts) DO UPDATE SET
+        count = count + excluded.count,
+        errors = errors + excluded.errors,
+        value_count = value_count + excluded.value_count,
+        value_sum = COALESCE(value_sum, 0) + COALESCE(excluded.value_sum, 0),
+        value_min = MIN(COALESCE(value_min, excluded.value_min), COALESCE(excluded.value_min, value_min)),
+        value_max = MAX(COALESCE(value_max, excluded.value_max), COALESCE(excluded.value_max, value_max))
+"""
+
+def find_policy(device, command, policies=RETENTION_POLICIES):
+    """First policy whose device/command patterns match, or None."""
+    for policy in policies:
+        if fnmatchcase(device or "", policy.get("device", "*")) and fnmatchcase(command or "", policy.get("command", "*")):
+            return policy
+    return None
+
+def _summarize(rows, bucket_s):
+    """Fold log rows (as dicts) into {(device, command, bucket_ts): summary row}."""
+    buckets = {}
+    for row in rows:
+        key = (row["device"], row["command"], row["ts"] - row["ts"] % bucket_s)
+        s = buckets.setdefault(key, [0, 0, 0, None, None, None])
+        s[0] += 1
+        s[1] += 1 if row["error"] else 0
+        v = row["value"]
+        if v is not None:
+            s[2] += 1
+            s[3] = v if s[3] is None else s[3] + v
+            s[4] = v if s[4] is None else min(s[4], v)
+            s[5] = v if s[5] is None else max(s[5], v)
+    return [key + tuple(s) for key, s in buckets.items()]
+
+class RetentionWorker(threading.Thread):
+    """
+    Hourly housekeeping so the database and device.log stay bounded.
+    Expired logs rows are archived into monthly gzip JSON-lines files
+    and/or summarized into log_summaries (see RETENTION_POLICIES), then
+    deleted a small chunk per transaction. Freed pages are returned with
+    incremental vacuum. Devices only ever enqueue to the LogWriter, so a
+    pass never stalls them; the LogWriter itself waits for at most one chunk.
+    """
+    def __init__(self, path=DBFILE, policies=RETENTION_POLICIES, archive_dir=ARCHIVE_DIR,
+                 interval_s=RETENTION_INTERVAL_S, chunk_rows=RETENTION_CHUNK_ROWS, pause_s=RETENTION_PAUSE_S):
+        super().__init__(daemon=True, name="Retention")
+        self.path = path
+        self.policies = policies
+        self.archive_dir = archive_dir
+        self.interval_s = interval_s
+        self.chunk_rows = chunk_rows
+        self.pause_s = pause_s
+        self.stopped = threading.Event()
+        self.deleted = 0
+        self.archived = 0
+        self.last_run = None
+        self.vacuum_hint_shown = False
+
+    def stop(self, timeout=5):
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _archive(self, table, rows, ts_of):
+        """Append rows (dicts) to ARCHIVE_DIR/<table>-YYYY-MM.jsonl.gz, one gzip member per call."""
+        by_month = {}
+        for row in rows:
+            month = datetime.datetime.fromtimestamp(ts_of(row)).strftime("%Y-%m")
+            by_month.setdefault(month, []).append(row)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for month, month_rows in by_month.items():
+            with gzip.open(os.path.join(self.archive_dir, f"{table}-{month}.jsonl.gz"), "at", encoding="utf-8") as f:
+                for row in month_rows:
+                    f.write(json.dumps(row, default=str) + "\n")
+        self.archived += len(rows)
+
+    def _delete_rows(self, conn, table, ids, summaries=()):
+        with DB_WRITE_LOCK:
+            if summaries:
+                conn.executemany(UPSERT_SUMMARY_SQL, summaries)
+            conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(i,) for i in ids])
+            conn.commit()
+        self.deleted += len(ids)
+        # Leave the write lock free between chunks
+        self.stopped.wait(self.pause_s)
+
+    def expire_logs(self, conn, now):
+        keep = [p["keep_days"] for p in self.policies if p.get("keep_days") is not None]
+        if not keep:
+            return
+        # Only (device, command) pairs that have rows past the shortest retention
+        oldest_cutoff = now - min(keep) * 86400
+        for device, command in conn.execute(
+                "SELECT DISTINCT device, command FROM logs WHERE ts < ?", (oldest_cutoff,)).fetchall():
+            policy = find_policy(device, command, self.policies)
+            if not policy or policy.get("keep_days") is None:
+                continue
+            cutoff = now - policy["keep_days"] * 86400
+            bucket_s = BUCKET_S.get(policy.get("summarize"))
+            while not self.stopped.is_set():
+                rows = [dict(zip(LOG_COLUMNS, r)) for r in conn.execute(
+                    f"SELECT {', '.join(LOG_COLUMNS)} FROM logs WHERE device IS ? AND command IS ? AND ts < ?"
+                    " ORDER BY ts LIMIT ?", (device, command, cutoff, self.chunk_rows))]
+                if not rows:
+                    break
+                if policy.get("archive"):
+                    for row in rows:
+                        row["result"] = decode_result(row["result"])
+                    self._archive("logs", rows, lambda r: r["ts"])
+                self._delete_rows(conn, "logs", [r["id"] for r in rows], _summarize(rows, bucket_s) if bucket_s else ())
+
+    def expire_heartbeats(self, conn, now):
+        """Heartbeat runs follow the policy for "B"; they already are run-length summaries."""
+        policies = [p for p in self.policies if fnmatchcase("B", p.get("command", "*"))]
+        for (device,) in conn.execute("SELECT DISTINCT device FROM heartbeats").fetchall():
+            policy = find_policy(device, "B", policies)
+            if not policy or policy.get("keep_days") is None:
+                continue
+            cutoff = datetime.datetime.fromtimestamp(now - policy["keep_days"] * 86400).isoformat()
+            while not self.stopped.is_set():
+                rows = [dict(zip(HEARTBEAT_COLUMNS, r)) for r in conn.execute(
+                    f"SELECT {', '.join(HEARTBEAT_COLUMNS)} FROM heartbeats WHERE device IS ? AND last_seen < ?"
+                    " ORDER BY id LIMIT ?", (device, cutoff, self.chunk_rows))]
+                if not rows:
+                    break
+                if policy.get("archive"):
+                    self._archive("heartbeats", rows,
+                                  lambda r: datetime.datetime.fromisoformat(r["first_seen"]).timestamp())
+                self._delete_rows(conn, "heartbeats", [r["id"] for r in rows])
+
+    def expire_outbox(self, conn, now):
+        """Delivered uploads are only kept for OUTBOX_KEEP_DAYS."""
+        cutoff = now - OUTBOX_KEEP_DAYS * 86400
+        while not self.stopped.is_set():
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM outbox WHERE sent_at IS NOT NULL AND sent_at < ? LIMIT ?", (cutoff, self.chunk_rows))]
+            if not ids:
+                break
+            self._delete_rows(conn, "outbox", ids)
+
+    def vacuum(self, conn):
+        """Hand free pages back to the filesystem, RETENTION_VACUUM_PAGES per transaction."""
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Databases created before retention existed need the offline
+            # conversion (a full VACUUM); never rewrite the file while devices log
+            if not self.vacuum_hint_shown:
+                print(f"[RETENTION] {self.path} is not in incremental auto-vacuum mode; free pages stay in the"
+                      f" file until it is converted with the app stopped: python retention.py --convert-vacuum")
+                self.vacuum_hint_shown = True
+            return
+        while not self.stopped.is_set() and conn.execute("PRAGMA freelist_count").fetchone()[0]:
+            with DB_WRITE_LOCK:
+                conn.execute(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})").fetchall()
+            self.stopped.wait(self.pause_s)
+
+    def rotate_logfile(self, path=LOGFILE, max_bytes=LOGFILE_MAX_BYTES):
+        """Move device.log into ARCHIVE_DIR as a timestamped .gz once it passes max_bytes."""
+        try:
+            if os.path.getsize(path) < max_bytes:
+                return
+            stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            rotated = f"{path}.{stamp}"
+            # log_command reopens the file for every line, so a rename is safe
+            os.replace(path, rotated)
+            os.makedirs(self.archive_dir, exist_ok=True)
+            with open(rotated, "rb") as src, gzip.open(
+                    os.path.join(self.archive_dir, f"{os.path.basename(path)}-{stamp}.gz"), "wb") as dst:
+                while chunk := src.read(1 << 20):
+                    dst.write(chunk)
+            os.remove(rotated)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[RETENTION] Could not rotate {path}: {e}")
+
+    def run_once(self):
+        now = time.time()
+        conn = self._connect()
+        try:
+            self.expire_logs(conn, now)
+            self.expire_heartbeats(conn, now)
+            self.expire_outbox(conn, now)
+            self.vacuum(conn)
+        finally:
+            conn.close()
+        self.rotate_logfile()
+        self.last_run = now
+
+    def run(self):
+        # First pass shortly after startup, then every interval_s
+        while not self.stopped.wait(min(60, self.interval_s) if self.last_run is None else self.interval_s):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[RETENTION] Pass failed: {e}")
+                self.last_run = time.time()
+
+_retention = None
+_retention_lock = threading.Lock()
+
+def get_retention():
+    """Return the process-wide RetentionWorker, starting it on first use."""
+    global _retention
+    with _retention_lock:
+        if _retention is None or not _retention.is_alive():
+            _retention = RetentionWorker()
+            _retention.start()
+        return _retention
+
+def stop_retention(timeout=5):
+    global _retention
+    with _retention_lock:
+        worker, _retention = _retention, None
+    if worker is not None:
+        worker.stop(timeout)
+
+def convert_to_incremental_vacuum(path=DBFILE):
+    """
+    Switch an existing database to incremental auto-vacuum. This rewrites
+    the whole file with VACUUM, so run it offline, with the app stopped.
+    Returns False if the database already was incremental.
+    """
+    conn = sqlite3.connect(path, timeout=10)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one retention pass, or convert the database offline.")
+    parser.add_argument("--db", default=DBFILE)
+    parser.add_argument("--convert-vacuum", action="store_true",
+                        help="switch the database to incremental auto-vacuum (full VACUUM; stop the app first)")
+    args = parser.parse_args(argv)
+    t0 = time.monotonic()
+    if args.convert_vacuum:
+        try:
+            converted = convert_to_incremental_vacuum(args.db)
+        except sqlite3.OperationalError as e:
+            print(f"[RETENTION] Could not convert {args.db} (is the app still running?): {e}")
+            sys.exit(1)
+        state = "converted to" if converted else "already in"
+        print(f"[RETENTION] {args.db} {state} incremental auto-vacuum ({time.monotonic() - t0:.1f} s)")
+        return
+    worker = RetentionWorker(path=args.db)
+    worker.run_once()
+    print(f"[RETENTION] {worker.deleted:,} rows deleted, {worker.archived:,} archived in {time.monotonic() - t0:.1f} s")
+
+if __name__ == "__main__":
+    main()
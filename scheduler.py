@@ -0,0 +1,160 @@
+import heapq
+import queue
+import time
+import itertools
+import threading
+from concurrent.futures import InvalidStateError
+
+# Priority classes, most urgent first
+PRIORITY_OPERATOR = 0       # buttons, assay stages
+PRIORITY_SYNC = 1           # "Sync to Server" polls
+PRIORITY_HEARTBEAT = 2      # availability re-probes queued by the device itself
+# Commands whose pending duplicates can share one answer (stream toggles must keep their order)
+COALESCE_COMMANDS = ("B", "S", "P")
+
+class CommandEntry:
+    """One pending command and every caller waiting on it."""
+    def __init__(self, cmd, priority, queued_at, deadline, seq):
+        self.cmd = cmd
+        self.priority = priority
+        self.queued_at = queued_at
+        self.deadline = deadline    # monotonic time after which it is not worth sending; None = never
+        self.seq = seq
+        self.futures = []
+        self.popped = False
+
+    def add_future(self, future):
+        if future is not None:
+            self.futures.append(future)
+
+    def resolve(self, result):
+        for future in self.futures:
+            if not future.done():
+                try:
+                    future.set_result(result)
+                except InvalidStateError:
+                    pass
+
+class CommandScheduler:
+    """
+    Per-device command queue. Entries come out by priority class, oldest
+    first within a class. A command that is already waiting is not queued
+    twice: the new caller's Future joins the pending entry (and raises its
+    priority/extends its deadline), so a burst of clicks costs one exchange.
+    Entries whose deadline has passed are dropped at the head instead of
+    being sent; on_expired(entry) is called for each.
+    """
+    def __init__(self, on_expired=None):
+        self.on_expired = on_expired
+        self.heap = []              # (priority, seq, entry); stale pairs are skipped on pop
+        self.pending = {}           # cmd -> waiting entry, for coalescing
+        self.count = 0
+        self.coalesced = 0
+        self.expired = 0
+        self._seq = itertools.count()
+        self.cond = threading.Condition()
+
+    def submit(self, cmd, future=None, priority=PRIORITY_OPERATOR, deadline_s=None, queued_at=None):
+        """Queue `cmd` (or join an identical pending one); returns its CommandEntry."""
+        now = time.monotonic()
+        deadline = None if deadline_s is None else now + deadline_s
+        key = cmd.upper()
+        with self.cond:
+            entry = self.pending.get(key) if key in COALESCE_COMMANDS else None
+            if entry is not None:
+                self.coalesced += 1
+                entry.add_future(future)
+                entry.deadline = None if deadline is None or entry.deadline is None else max(entry.deadline, deadline)
+                if priority < entry.priority:
+                    # Re-file under the higher class; the old heap slot is skipped on pop
+                    entry.priority = priority
+                    heapq.heappush(self.heap, (priority, entry.seq, entry))
+                return entry
+            entry = CommandEntry(cmd, priority, queued_at or now, deadline, next(self._seq))
+            entry.add_future(future)
+            if key in COALESCE_COMMANDS:
+                self.pending[key] = entry
+            heapq.heappush(self.heap, (priority, entry.seq, entry))
+            self.count += 1
+            self.cond.notify()
+            return entry
+
+    def _take(self, now, commands=None):
+        """
+        Pop the best live entry, dropping expired ones on the way. With
+        `commands`, None is returned if the best entry is not one of them,
+        so nothing is ever taken out of order. Lock held.
+        """
+        expired = []
+        while self.heap:
+            priority, seq, entry = heapq.heappop(self.heap)
+            if entry.popped or priority != entry.priority:
+                continue
+            if entry.deadline is not None and now > entry.deadline:
+                self._remove(entry)
+                expired.append(entry)
+                continue
+            if commands is not None and entry.cmd.upper() not in commands:
+                heapq.heappush(self.heap, (priority, seq, entry))
+                break
+            self._remove(entry)
+            return entry, expired
+        return None, expired
+
+    def _remove(self, entry):
+        entry.popped = True
+        self.count -= 1
+        if self.pending.get(entry.cmd.upper()) is entry:
+            del self.pending[entry.cmd.upper()]
+
+    def _dropped(self, expired):
+        for entry in expired:
+            self.expired += 1
+            if self.on_expired:
+                self.on_expired(entry)
+
+    def get(self, timeout=None):
+        """Next entry, waiting up to `timeout`; raises queue.Empty like queue.Queue.get."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.cond:
+                entry, expired = self._take(time.monotonic())
+                if entry is None and not expired:
+                    left = None if end is None else end - time.monotonic()
+                    if left is not None and left <= 0:
+                        raise queue.Empty
+                    self.cond.wait(left)
+                    continue
+            self._dropped(expired)
+            if entry is not None:
+                return entry
+
+    def pop(self):
+        """Next entry or None, without waiting."""
+        with self.cond:
+            entry, expired = self._take(time.monotonic())
+        self._dropped(expired)
+        return entry
+
+    def pop_batch(self, limit, commands):
+        """Up to `limit` further entries, best first, while they are among `commands` (one pipelined write)."""
+        batch, dropped = [], []
+        with self.cond:
+            now = time.monotonic()
+            while len(batch) < limit:
+                entry, expired = self._take(now, commands)
+                dropped += expired
+                if entry is None:
+                    break
+                batch.append(entry)
+        self._dropped(dropped)
+        return batch
+
+    def __len__(self):
+        return self.count
+
+    def empty(self):
+        return self.count == 0
+
+    def qsize(self):
+        return self.count
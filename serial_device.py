@@ -1,198 +1,775 @@
 import serial
 import threading
 import queue
-import json
 import datetime
-import requests
 import traceback
-import re
-from config import LOGFILE, HTTP_ENDPOINT, TEST_COMMAND
-from db import log_result
+import time
+from collections import deque
+from concurrent.futures import Future
+from config import (LOGFILE, TEST_COMMAND, SERIAL_ENGINE, HEARTBEAT_MIN_S, HEARTBEAT_MAX_S,
+                    HEARTBEAT_BACKOFF, STREAM_CONFIGS, COMMAND_DEADLINE_S)
+from db import log_result, log_heartbeat
+from uploader import enqueue_upload
+from protocols import LineFramer, get_parser
+from streaming import StabilityDetector
+from connection import get_connection_manager, find_port
+from metrics import METRICS, command_histogram
+from scheduler import CommandScheduler, PRIORITY_OPERATOR, PRIORITY_HEARTBEAT
+from tracing import span
+from timing import TimingProfile
+
+READ_TIMEOUT = 1.0      # per-line answer budget, as with the old serial timeout=1
+MEASUREMENT_LINES = 3   # 'S' reads up to this many lines
+POLL_TIMEOUT = 0.05     # blocking read slice for the threaded engine
+COMMANDS = ("B", "S", "P", "STREAM", "STREAM_STOP")
+REPLY_COMMANDS = ("B", "S", "P")    # answered with lines, so they can share a pipelined write
 
 def log_command(cmd, device_name):
     with open(LOGFILE, "a") as f:
         f.write(f"{datetime.datetime.now().isoformat()} | {device_name} | CMD: {cmd}\n")
 
-def send_result_http(device_name, result):
-    try:
-        payload = {
-            "device": device_name,
-            "result": result,
-            "timestamp": datetime.datetime.now().isoformat(),
-        }
-        r = requests.post(HTTP_ENDPOINT, json=payload, timeout=5)
-        return r.status_code, r.text
-    except Exception as e:
-        return None, str(e)
-
-class SerialDevice(threading.Thread):
-    def __init__(self, port, baudrate, name):
-        super().__init__(daemon=True)
+def send_result_http(device_name, result, on_sent=None):
+    """Queue a single result on the uploader outbox; returns its idempotency key."""
+    payload = {
+        "device": device_name,
+        "result": result,
+        "timestamp": datetime.datetime.now().isoformat(),
+    }
+    return enqueue_upload(payload, on_sent)
+
+def await_all(futures, timeout, on_result=None):
+    """
+    Wait for a {key: Future} mapping from send_command under one deadline.
+    on_result(key, result) is called the moment each command completes.
+    Returns {key: result}; commands still pending at the deadline map to a
+    TimeoutError instance.
+    """
+    completed = queue.Queue()
+    for key, fut in futures.items():
+        fut.add_done_callback(lambda _, key=key: completed.put(key))
+    deadline = time.monotonic() + timeout
+    results = {}
+    while len(results) < len(futures):
+        left = deadline - time.monotonic()
+        if left <= 0:
+            break
+        try:
+            key = completed.get(timeout=left)
+        except queue.Empty:
+            break
+        results[key] = futures[key].result()
+        if on_result:
+            on_result(key, results[key])
+    for key in futures:
+        if key not in results:
+            results[key] = TimeoutError(f"{key}: no response within {timeout}s")
+    return results
+
+class HeartbeatScheduler:
+    """
+    Decides when a device should be probed with "B".
+    Each healthy probe stretches the interval by `backoff` up to `max_s`;
+    any failure drops it back to `min_s` for fast re-probing. A real command
+    that was answered counts as a probe and pushes the next one out.
+    """
+    def __init__(self, min_s=HEARTBEAT_MIN_S, max_s=HEARTBEAT_MAX_S, backoff=HEARTBEAT_BACKOFF):
+        self.min_s = min_s
+        self.max_s = max_s
+        self.backoff = backoff
+        self.interval = min_s
+        self.next_probe = 0.0
+
+    def record(self, ok, probe=True):
+        if not ok:
+            self.interval = self.min_s
+        elif probe:
+            self.interval = min(self.max_s, self.interval * self.backoff)
+        self.next_probe = time.monotonic() + self.interval
+
+    def due(self, now):
+        return now >= self.next_probe
+
+    def time_until_due(self, now):
+        return max(0.0, self.next_probe - now)
+
+class DeviceBase:
+    """
+    Device state plus response parsing and logging, shared by the
+    thread-per-port SerialDevice and the multiplexed MuxDevice engine.
+    The engines do the I/O and feed framed lines to _accept_line.
+    """
+    def _init_state(self, port, baudrate, name, protocol=None, usb=None, station=None, pipeline=None,
+                    read_timeout=READ_TIMEOUT):
         self.port = port
+        self.usb = usb      # optional {"vid", "pid", "serial_number"} match, see connection.py
         self.baudrate = baudrate
         self.name = name
+        self.station = station or "Devices"     # UI grouping
+        self.protocol = protocol or name
+        self.parsers = {cmd: get_parser(self.protocol, cmd) for cmd in ("S", "P", "stream")}
         self.serial = None
-        self.last_result = None
-        self.status = "disconnected"
-        self.available = False
+        # available/last_result are properties that notify change_listeners (the UI)
+        self.change_listeners = []
+        self._last_result = None
+        self.status = "connecting"
+        self._available = False
+        self.ready = threading.Event()  # set once the port has been opened and first probed
+        self.cmd_queue = CommandScheduler(on_expired=self._expired)
+        # Instruments that accept several commands back to back and answer
+        # them in order get up to `pipeline` of them in one write
+        self.pipeline_depth = max(1, int(pipeline or 1))
+        self._current = None            # entry whose answer is being collected, when pipelining
+        self._pipeline = deque()        # entries already written, answered after _current
         self.last_error = None
-        self.cmd_queue = queue.Queue()
         self.running = True
-        self._open_serial()
-        self.check_availability()
-        self.start()
+        self.heartbeat = HeartbeatScheduler()
+        # Answer budgets start from read_timeout and are then learned (see timing.py)
+        self.read_timeout = read_timeout
+        self.timing = TimingProfile(name, {"B": read_timeout, "S": read_timeout * MEASUREMENT_LINES,
+                                           "P": read_timeout})
+        self.timing.load()
+        self._begun_at = 0.0
+        self.framer = LineFramer()
+        self._inflight = None
+        self._background = False
+        self._lines = []
+        self._deadline = 0.0
+        self._stale_probe_until = 0.0
+        # Continuous streaming (see STREAM_CONFIGS)
+        self.stream_cfg = STREAM_CONFIGS.get(name)
+        self.streaming = False
+        self.stability = None
+        if self.stream_cfg:
+            self.stability = StabilityDetector(self.stream_cfg["capacity"], self.stream_cfg["window"],
+                                               self.stream_cfg["stable_stddev"])
+        self.stable_listeners = []
+        # Bus accounting: probes/commands written and enqueue->write latency
+        self.probes_sent = 0
+        self.commands_sent = 0
+        self.bytes_sent = 0
+        self.last_dispatch_latency = None
+        # Latency histograms (see metrics.py), cached per (command, phase)
+        self._hists = {}
+        self._written_at = None
+        self._started_at = None
+        self._awaiting_first_byte = False
+        METRICS.gauge("gold_cmd_queue_depth", "Commands waiting in the device queue",
+                      self.queue_depth, device=name)
+
+    @property
+    def available(self):
+        return self._available
+
+    @available.setter
+    def available(self, value):
+        if value != self._available:
+            self._available = value
+            self._changed()
+
+    @property
+    def last_result(self):
+        return self._last_result
+
+    @last_result.setter
+    def last_result(self, value):
+        if value is not self._last_result:
+            self._last_result = value
+            self._changed()
+
+    def _brought_up(self):
+        self.ready.set()
+        self._changed()
+
+    def _changed(self):
+        for listener in self.change_listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                print(f"[DEVICE] Change listener error on {self.name}: {e}")
+
+    def queue_depth(self):
+        return len(self.cmd_queue)
+
+    def _wake(self):
+        """Let the engine know a command was queued (the threaded engine blocks on the queue itself)."""
+
+    def send_command(self, cmd, priority=PRIORITY_OPERATOR, deadline_s=COMMAND_DEADLINE_S):
+        """
+        Queue a command. Returns a Future that resolves with this command's
+        result (last_result for S/P, availability for B). An identical
+        command already waiting is shared rather than queued again. If it
+        has not gone out within deadline_s it is dropped and resolves with
+        an error. Commands sent while the device is still connecting wait
+        for bring-up.
+        """
+        if self.is_connected() or not self.ready.is_set():
+            future = Future()
+            self.cmd_queue.submit(cmd, future, priority, deadline_s)
+            self._wake()
+            return future
+        return self._not_sent(cmd)
+
+    def _queue_internal(self, cmd, priority=PRIORITY_HEARTBEAT, future=None):
+        self.cmd_queue.submit(cmd, future, priority)
+        self._wake()
+
+    def _expired(self, entry):
+        log_result(self.name, entry.cmd, "Not sent", "Deadline exceeded")
+        entry.resolve({"error": "Deadline exceeded"})
+
+    def _observe(self, cmd, phase, seconds):
+        hist = self._hists.get((cmd, phase))
+        if hist is None:
+            hist = self._hists[(cmd, phase)] = command_histogram(self.name, cmd, phase)
+        hist.observe(seconds)
+
+    def _write(self, data):
+        with span("serial.write", "serial", device=self.name, bytes=len(data)):
+            self.serial.write(data)
+
+    def _read(self):
+        """Everything buffered, or wait for one byte (up to the port's timeout)."""
+        with span("serial.read", "serial", device=self.name):
+            return self.serial.read(self.serial.in_waiting or 1)
+
+    def _note_write(self, data, queued_at, cmd):
+        now = time.monotonic()
+        self.bytes_sent += len(data)
+        if queued_at is None:
+            self.probes_sent += 1
+        else:
+            self.commands_sent += 1
+            self.last_dispatch_latency = now - queued_at
+            self._observe(cmd, "queue", self.last_dispatch_latency)
+        if cmd in ("B", "S", "P"):
+            self._written_at = now
+            self._started_at = now if queued_at is None else queued_at
+            self._awaiting_first_byte = True
+
+    def _note_rx(self, data):
+        if data and self._awaiting_first_byte and self._inflight:
+            self._awaiting_first_byte = False
+            self._observe(self._inflight, "first_byte", time.monotonic() - self._written_at)
+
+    def _note_done(self, cmd):
+        if self._started_at is not None:
+            self._observe(cmd, "total", time.monotonic() - self._started_at)
+            self._started_at = None
+        self._awaiting_first_byte = False
+
+    def _budget(self, cmd, background=False):
+        """How long to wait for the complete answer to `cmd`."""
+        return self.timing.budget(cmd, background)
+
+    # --- response state machine ---
+
+    def _begin(self, cmd, background=False, flush=True):
+        """Start collecting the answer to `cmd`. A leftover partial line is logged, not dropped."""
+        partial = self.framer.flush() if flush else None
+        if partial:
+            self._unsolicited(partial)
+        if cmd != "B":
+            self.last_result = None
+            self.last_error = None
+        self._inflight = cmd
+        self._background = background
+        self._lines = []
+        self._begun_at = time.monotonic()
+        self._deadline = self._begun_at + self._budget(cmd, background)
+        self._started_at = None
+
+    def _accept_line(self, line):
+        """Feed one framed line to the in-flight command. Returns True once it has completed."""
+        cmd = self._inflight
+        if cmd is None:
+            self._unsolicited(line)
+            return False
+        if cmd == "B":
+            self._inflight = None
+            self._answered(cmd)
+            self._finish_availability(line)
+            return True
+        parsed = self.parsers[cmd](line) if line else None
+        if parsed is None and self._claim_stale_probe(line):
+            return False
+        if cmd == "S":
+            self._lines.append(line)
+            if parsed is None and len(self._lines) < MEASUREMENT_LINES:
+                return False
+            self._inflight = None
+            self._answered(cmd)
+            self._finish_measurement(self._lines, parsed)
+            return True
+        self._inflight = None
+        self._answered(cmd)
+        self._finish_json(line, parsed)
+        return True
+
+    def _answered(self, cmd):
+        self.timing.observe(cmd, time.monotonic() - self._begun_at)
+
+    def _expire(self):
+        """The in-flight command ran out of time."""
+        cmd, lines = self._inflight, self._lines
+        self._inflight = None
+        self.timing.expired(cmd)
+        if cmd == "B":
+            self._finish_availability("")
+        elif cmd == "S":
+            self._finish_measurement(lines, None)
+        elif cmd == "P":
+            self._finish_json("", None)
+
+    def _preempt_probe(self):
+        """
+        Abandon an in-flight background probe so a user command can go out.
+        Its answer may still arrive; until the probe's own deadline an
+        unparseable line is credited to the probe instead of the command.
+        """
+        self._inflight = None
+        self._background = False
+        self._stale_probe_until = self._deadline
+
+    def _claim_stale_probe(self, line):
+        if line and time.monotonic() < self._stale_probe_until:
+            self._stale_probe_until = 0.0
+            self._finish_availability(line)
+            return True
+        return False
+
+    # --- pipelining ---
+
+    def _pipelined_batch(self, entry):
+        """Queued entries that can follow `entry` in the same write (none unless the device pipelines)."""
+        if self.pipeline_depth <= 1 or entry.cmd.upper() not in REPLY_COMMANDS:
+            return []
+        return self.cmd_queue.pop_batch(self.pipeline_depth - 1, REPLY_COMMANDS)
+
+    def _start_pipeline(self, entries):
+        """Begin the first of `entries`, line up the rest; returns the bytes for one write."""
+        self._begin(entries[0].cmd.upper())
+        self._current = entries[0]
+        self._pipeline.extend(entries[1:])
+        return b"".join(e.cmd.upper().encode() + b"\n" for e in entries)
+
+    def _note_pipeline_write(self, entries):
+        for e in entries:
+            self._note_write(e.cmd.encode() + b"\n", e.queued_at, e.cmd.upper())
+        self._started_at = entries[0].queued_at
+
+    def _advance(self, cmd):
+        """
+        `cmd` completed: resolve its callers and, if more pipelined answers
+        are due, start collecting the next one straight away (its bytes may
+        already be in the framer, so nothing is flushed).
+        """
+        self._note_done(cmd)
+        entry, self._current = self._current, None
+        self._resolve(entry, cmd)
+        if self._pipeline:
+            nxt = self._pipeline.popleft()
+            self._begin(nxt.cmd.upper(), flush=False)
+            self._current = nxt
+            self._started_at = nxt.queued_at
+
+    def _abort_pipeline(self, err):
+        while self._pipeline:
+            entry = self._pipeline.popleft()
+            self._fail(entry.cmd.upper(), err)
+            self._resolve(entry, entry.cmd)
+
+    def _unsolicited(self, line):
+        if self._claim_stale_probe(line):
+            return
+        if self.streaming and self._on_sample(line):
+            return
+        if line:
+            log_result(self.name, "unsolicited", line)
+
+    # --- streaming ---
+
+    def _begin_stream(self, on):
+        """Switch streaming mode; returns the bytes to write, or None if not configured."""
+        cmd = "STREAM" if on else "STREAM_STOP"
+        if not self.stream_cfg:
+            log_result(self.name, cmd, "NotImplemented", "Streaming not configured")
+            return None
+        self.streaming = on
+        self.stability.reset()
+        log_result(self.name, cmd, {"streaming": on})
+        return (self.stream_cfg["start"] if on else self.stream_cfg["stop"]).encode() + b"\n"
+
+    def _on_sample(self, line):
+        value = self.parsers["stream"](line) if line else None
+        if value is None:
+            return False
+        # A live stream is proof of availability; it keeps pushing the next probe out
+        self.heartbeat.record(True, probe=False)
+        if not self.available:
+            self.available = True
+            self.status = "available"
+        settled = self.stability.add(value)
+        if settled:
+            self._publish_stable(*settled)
+        return True
+
+    def _publish_stable(self, mean, stddev):
+        result = {"weight_display": f"Weight = {mean:.3f} g", "value": mean, "stddev": stddev, "stable": True}
+        self.status = "stable reading"
+        self.last_result = result
+        log_result(self.name, "stable", result)
+        for listener in self.stable_listeners:
+            try:
+                listener(self, result)
+            except Exception as e:
+                print(f"[STREAM] Listener error on {self.name}: {e}")
+
+    def start_streaming(self):
+        return self.send_command("STREAM")
+
+    def stop_streaming(self):
+        return self.send_command("STREAM_STOP")
+
+    # --- outcomes ---
+
+    def _finish_availability(self, response):
+        self.available = bool(response)
+        self.status = "available" if self.available else "no response"
+        self.heartbeat.record(self.available)
+        log_heartbeat(self.name, self.status, response, None)
+
+    def _finish_measurement(self, lines, parsed):
+        """Record the outcome of 'S'; expect 'S S      1.182 g'."""
+        err = None
+        if parsed is not None:
+            self.status = "measurement ok"
+            self.last_result = parsed
+        else:
+            err = "Could not parse value"
+            self.status = "unexpected response"
+            self.last_result = {"error": err}
+            raw = [line for line in lines if line]
+            if raw:
+                # Keep what the device actually said
+                self.last_result["raw"] = raw
+        self._finish("S", err)
+        return err is None
+
+    def _finish_json(self, line, parsed):
+        """Record the outcome of 'P'; expect JSON."""
+        err = None
+        if parsed is not None:
+            self.last_result = parsed
+            self.status = "last result ok"
+        elif line:
+            err = f"JSON decode error: {line}"
+            self.status = f"bad json: {line}"
+            self.last_result = {"error": err}
+        else:
+            err = "No response"
+            self.status = "no response for P"
+            self.last_result = {"error": err}
+        self._finish("P", err)
+        return err is None
+
+    def _fail(self, cmd, err, status=None):
+        """Record an I/O failure or a missing connection for `cmd`."""
+        self._inflight = None
+        self.status = status or f"error: {err}"
+        if cmd == "B":
+            self.available = False
+            self.heartbeat.record(False)
+            log_heartbeat(self.name, self.status, "", err)
+        else:
+            self.last_result = {"error": err}
+            self._finish(cmd, err)
+
+    def _finish(self, cmd, err):
+        self.heartbeat.record(err is None, probe=False)
+        log_result(self.name, cmd, self.last_result, err)
+        self.last_error = err
+
+    def _command_result(self, cmd):
+        cmd = (cmd or "").upper()
+        if cmd == "B":
+            return {"available": self.available, "status": self.status}
+        if cmd in ("S", "P"):
+            return self.last_result
+        if cmd in ("STREAM", "STREAM_STOP"):
+            return {"streaming": self.streaming}
+        return {"error": "Unknown command"}
+
+    def _resolve(self, entry, cmd):
+        """Complete the Futures of every send_command caller sharing this entry."""
+        if entry is not None:
+            entry.resolve(self._command_result(cmd))
+
+    def _not_sent(self, cmd):
+        # Always log attempts to send when disconnected
+        log_result(self.name, cmd, "Not sent", "Device not connected")
+        future = Future()
+        future.set_result({"error": "Device not connected"})
+        return future
+
+    def is_connected(self):
+        return self.serial is not None and self.serial.is_open
+
+    def _open_port(self, port):
+        return serial.Serial(port, self.baudrate, timeout=self.read_poll)
 
     def _open_serial(self):
+        """Open the port at bring-up; if that fails the ConnectionManager keeps retrying."""
         try:
-            self.serial = serial.Serial(self.port, self.baudrate, timeout=1)
+            port = find_port(self.usb, get_connection_manager().ports_fn()) if self.usb else self.port
+            if port is None:
+                raise serial.SerialException(f"no port matches {self.usb}")
+            self.serial = self._open_port(port)
+            self.port = port
             self.status = "connected"
         except Exception as e:
             self.status = f"error: {e}"
             self.available = False
+            get_connection_manager().watch(self)
 
-    def check_availability(self):
-        """Check if device is available, log every check."""
-        response = ""
-        err = None
-        if self.serial and self.serial.is_open:
-            try:
-                self.serial.reset_input_buffer()
-                self.serial.write(b'B\n')
-                response = self.serial.readline().decode('utf-8', errors='ignore').strip()
-                self.available = bool(response)
-                self.status = "available" if self.available else "no response"
-            except Exception as e:
-                self.available = False
-                self.status = f"error: {e}"
-                err = str(e)
-        else:
+    def _lost(self, cmd, err):
+        """
+        The port failed mid-I/O (e.g. the adapter was unplugged): close it,
+        record one failure and leave reopening to the ConnectionManager.
+        The device does no I/O until _attach hands it a new port.
+        """
+        self._close_port()
+        self._abort_pipeline(f"Device error: {err}")
+        if cmd and cmd != "B":
+            # The command's failure row is the one record of the loss
+            self._fail(cmd, f"Device error: {err}", "disconnected")
             self.available = False
-            self.status = "disconnected"
-            err = "disconnected"
+        else:
+            self._fail("B", f"connection lost: {err}", "disconnected")
+        get_connection_manager().watch(self)
+
+    def _reattached(self, ser, port):
+        self.serial, self.port = ser, port
+        self.status = "connected"
+        self.framer.flush()
+        # Re-probe at once and resume continuous output if it was on
+        self._queue_internal("B")
+        if self.streaming:
+            self._queue_internal("STREAM")
+
+class SerialDevice(DeviceBase, threading.Thread):
+    read_poll = POLL_TIMEOUT    # short poll timeout: _transact enforces the real per-command deadline
+
+    def __init__(self, port, baudrate, name, protocol=None, read_timeout=READ_TIMEOUT, usb=None, station=None,
+                 pipeline=None):
+        threading.Thread.__init__(self, daemon=True)
+        self._init_state(port, baudrate, name, protocol, usb, station, pipeline, read_timeout)
+        self._queued_at = None
+        # Opening and the first probe run on the device thread, so a fleet comes up in parallel
+        self.start()
+
+    def _close_port(self):
+        try:
+            self.serial.close()
+        except Exception:
+            pass
 
-        log_result(self.name, "B", response, err)
+    def _attach(self, ser, port):
+        """Called by the ConnectionManager with a freshly opened port."""
+        self._reattached(ser, port)
+
+    def _read_available(self):
+        """One read of everything buffered (or wait up to POLL_TIMEOUT for a byte), framed into lines."""
+        data = self._read()
+        self._note_rx(data)
+        for line in self.framer.feed(data):
+            cmd = self._inflight
+            if self._accept_line(line) and self._current is not None:
+                self._advance(cmd)
+
+    def _transact(self, cmd, background=False):
+        """
+        Write `cmd` and feed the port's lines to the response state machine
+        until the command completes, runs out of time or, for a background
+        probe, is preempted by a queued user command.
+        """
+        if self.serial.in_waiting:
+            # Bytes that arrived between commands are framed and logged, not reset away
+            self._read_available()
+        self._begin(cmd, background)
+        data = cmd.encode() + b"\n"
+        self._write(data)
+        self._note_write(data, None if background else self._queued_at, cmd)
+        while self._inflight == cmd:
+            if background and not self.cmd_queue.empty():
+                self._preempt_probe()
+                return
+            if time.monotonic() >= self._deadline:
+                self._expire()
+                break
+            self._read_available()
+        self._note_done(cmd)
+
+    def _transact_pipelined(self, entries):
+        """Write all of `entries` at once and collect their answers in order, each under its own deadline."""
+        data = self._start_pipeline(entries)
+        self._write(data)
+        self._note_pipeline_write(entries)
+        while self._inflight is not None:
+            if time.monotonic() >= self._deadline:
+                cmd = self._inflight
+                self._expire()
+                self._advance(cmd)
+            else:
+                self._read_available()
+
+    def _execute_pipelined(self, entries):
+        if self.is_connected():
+            try:
+                if self.serial.in_waiting:
+                    self._read_available()
+            except OSError as e:
+                # Gone before anything was written: the entries are answered one by one below
+                self._lost(None, e)
+        if not self.is_connected():
+            for entry in entries:
+                self._execute(entry.cmd)
+                self._resolve(entry, entry.cmd)
+            return
+        try:
+            self._transact_pipelined(entries)
+        except OSError as e:
+            cmd = self._inflight
+            self._lost(cmd, e)
+            self._advance(cmd)
+        except Exception as e:
+            cmd = self._inflight
+            self._abort_pipeline(f"Device error: {e}")
+            self._fail(cmd, f"Device error: {e}", f"error: {e}")
+            self._advance(cmd)
+
+    def check_availability(self, background=False):
+        """Check if device is available, log status changes."""
+        if not self.is_connected():
+            self._fail("B", "disconnected", "disconnected")
+            return
+        try:
+            self._transact("B", background)
+        except OSError as e:
+            self._lost("B", e)
+        except Exception as e:
+            self._fail("B", str(e))
 
     def get_measurement(self):
         """
         Send 'S' to device, expect 'S S      1.182 g'
         Log every attempt/result.
         """
-        self.last_result = None
-        self.last_error = None
-        result = None
-        err = None
-
-        if self.serial and self.serial.is_open:
-            try:
-                self.serial.reset_input_buffer()
-                self.serial.write(b'S\n')
-                value = None
-                for _ in range(3):
-                    line = self.serial.readline().decode('utf-8', errors='ignore').strip()
-                    if not line:
-                        continue
-                    match = re.match(r'(?:S S|S)\s*([\d.]+)\s*g', line)
-                    if match:
-                        value = match.group(1)
-                        result = {"weight_display": f"Weight = {value} g"}
-                        self.status = "measurement ok"
-                        self.last_result = result
-                        break
-                    else:
-                        # Even if line doesn't match, log it as a raw result
-                        result = {"raw": line}
-                        self.last_result = result
-                if not value:
-                    err = "Could not parse value"
-                    self.status = "unexpected response"
-                    self.last_result = {"error": err}
-            except Exception as e:
-                err = f"Device error: {e}"
-                self.status = f"error: {e}"
-                self.last_result = {"error": str(e)}
-        else:
-            err = "Device not connected"
-            self.status = "disconnected"
-            self.last_result = {"error": err}
+        if not self.is_connected():
+            self._fail("S", "Device not connected", "disconnected")
+            return False
+        try:
+            self._transact("S")
+        except OSError as e:
+            self._lost("S", e)
+        except Exception as e:
+            self._fail("S", f"Device error: {e}", f"error: {e}")
+        return self.last_error is None
 
-        log_result(self.name, "S", self.last_result, err)
-        self.last_error = err
-        return err is None
+    def set_streaming(self, on):
+        """Switch the instrument's continuous output on or off."""
+        if not self.is_connected():
+            self._not_sent("STREAM" if on else "STREAM_STOP")
+            return
+        data = self._begin_stream(on)
+        if data:
+            self._write(data)
+            self._note_write(data, self._queued_at, "STREAM" if on else "STREAM_STOP")
 
     def get_last_json(self):
         """
         Send 'P' to device, expect JSON. Log every result.
         """
-        self.last_result = None
-        self.last_error = None
-        result = None
-        err = None
+        if not self.is_connected():
+            self._fail("P", "Device not connected", "disconnected")
+            return False
+        try:
+            self._transact("P")
+        except OSError as e:
+            self._lost("P", e)
+        except Exception as e:
+            self._fail("P", str(e))
+        return self.last_error is None
 
-        if self.serial and self.serial.is_open:
-            try:
-                self.serial.reset_input_buffer()
-                self.serial.write(b'P\n')
-                line = self.serial.readline().decode('utf-8', errors='ignore').strip()
-                if line:
-                    try:
-                        data = json.loads(line)
-                        result = data
-                        self.last_result = data
-                        self.status = "last result ok"
-                    except Exception as e:
-                        err = f"JSON decode error: {line}"
-                        self.status = f"bad json: {line}"
-                        result = {"raw": line}
-                        self.last_result = {"error": err}
-                else:
-                    err = "No response"
-                    self.status = "no response for P"
-                    self.last_result = {"error": err}
-            except Exception as e:
-                err = str(e)
-                self.status = f"error: {e}"
-                self.last_result = {"error": err}
+    def _execute(self, cmd):
+        if cmd.upper() == "S":
+            self.get_measurement()
+        elif cmd.upper() == "P":
+            self.get_last_json()
+        elif cmd.upper() == "B":
+            self.check_availability()
+        elif cmd.upper() in ("STREAM", "STREAM_STOP"):
+            self.set_streaming(cmd.upper() == "STREAM")
         else:
-            err = "Device not connected"
-            self.status = "disconnected"
-            self.last_result = {"error": err}
-
-        log_result(self.name, "P", self.last_result, err)
-        self.last_error = err
-        return err is None
+            # Log any custom/unknown command
+            log_result(self.name, cmd, "NotImplemented", "Unknown command")
 
     def run(self):
+        self._open_serial()
         self.check_availability()
+        self._brought_up()
         while self.running:
+            cmd, entry = None, None
+            connected = self.is_connected()
             try:
                 try:
-                    cmd = self.cmd_queue.get(timeout=0.1)
-                    if cmd.upper() == "S":
-                        self.get_measurement()
-                    elif cmd.upper() == "P":
-                        self.get_last_json()
-                    elif cmd.upper() == "B":
-                        self.check_availability()
+                    if not connected:
+                        # Nothing to probe or read; the ConnectionManager queues a "B" on reattach
+                        timeout = 1.0
                     else:
-                        # Log any custom/unknown command
-                        log_result(self.name, cmd, "NotImplemented", "Unknown command")
+                        timeout = 0 if self.streaming else self.heartbeat.time_until_due(time.monotonic())
+                    entry = self.cmd_queue.get(timeout=timeout)
+                    cmd, self._queued_at = entry.cmd, entry.queued_at
                 except queue.Empty:
-                    self.check_availability()
+                    self._queued_at = None
+                    if not connected:
+                        continue
+                    # While streaming, samples keep the heartbeat fresh; a probe
+                    # only goes out if the stream stalls
+                    if self.heartbeat.due(time.monotonic()):
+                        with span("run", "serial", device=self.name, cmd="B", probe=True):
+                            self.check_availability(background=True)
+                    elif self.streaming:
+                        self._read_available()
                     continue
+                with span("run", "serial", device=self.name, cmd=cmd):
+                    batch = self._pipelined_batch(entry)
+                    if batch:
+                        self._execute_pipelined([entry] + batch)
+                    else:
+                        self._execute(cmd)
+            except OSError as ex:
+                self._lost(cmd, ex)
             except Exception as ex:
                 self.status = f"error: {ex}"
                 self.last_error = str(ex)
                 self.last_result = {"error": str(ex)}
                 log_result(self.name, "run-loop", self.last_result, str(ex))
-
-    def send_command(self, cmd):
-        if self.serial and self.serial.is_open:
-            self.cmd_queue.put(cmd)
-        else:
-            # Always log attempts to send when disconnected
-            log_result(self.name, cmd, "Not sent", "Device not connected")
+            self._resolve(entry, cmd)
 
     def close(self):
         self.running = False
+        get_connection_manager().forget(self)
+        self.timing.save()
         if self.serial and self.serial.is_open:
             self.serial.close()
+
+def create_devices(configs, engine=SERIAL_ENGINE):
+    """
+    Build the device fleet with the configured engine:
+    "thread" runs one SerialDevice thread per port, "mux" services every
+    port from a single selector loop (see serial_mux).
+    """
+    if engine == "mux":
+        from serial_mux import MuxDevice
+        return [MuxDevice(**cfg) for cfg in configs]
+    return [SerialDevice(**cfg) for cfg in configs]
@@ -0,0 +1,299 @@
+import os
+import time
+import threading
+import selectors
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from db import log_result
+from serial_device import DeviceBase, READ_TIMEOUT, COMMANDS
+from connection import get_connection_manager
+from scheduler import PRIORITY_OPERATOR
+from tracing import span
+
+class SerialMultiplexer(threading.Thread):
+    """
+    One selector loop servicing every registered MuxDevice with
+    non-blocking reads. Other threads talk to the loop through call_soon.
+    """
+    def __init__(self):
+        super().__init__(daemon=True, name="SerialMultiplexer")
+        self.selector = selectors.DefaultSelector()
+        self.devices = []
+        self.running = True
+        self._calls = deque()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+    def call_soon(self, fn):
+        """Run fn on the loop thread. Safe to call from any thread."""
+        self._calls.append(fn)
+        self.wake()
+
+    def wake(self):
+        try:
+            os.write(self._wake_w, b"x")
+        except BlockingIOError:
+            pass
+
+    def add(self, dev):
+        self.call_soon(lambda: self._add(dev))
+
+    def _add(self, dev):
+        self.devices.append(dev)
+        dev._register()
+
+    def remove(self, dev):
+        self.call_soon(lambda: self._remove(dev))
+
+    def _remove(self, dev):
+        dev._unregister()
+        if dev in self.devices:
+            self.devices.remove(dev)
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+    def _next_timeout(self, now):
+        timeout = 1.0
+        for dev in self.devices:
+            if dev._inflight:
+                timeout = min(timeout, dev._deadline - now)
+            elif dev.is_connected() or dev.cmd_queue:
+                timeout = min(timeout, dev.heartbeat.next_probe - now)
+        return max(0.0, timeout)
+
+    def run(self):
+        while self.running:
+            events = self.selector.select(self._next_timeout(time.monotonic()))
+            with span("mux.loop", "serial", ready=len(events)):
+                for key, _ in events:
+                    if key.data is None:
+                        try:
+                            while os.read(self._wake_r, 4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                    else:
+                        try:
+                            key.data._on_readable()
+                        except Exception as ex:
+                            key.data._loop_error(ex)
+                while self._calls:
+                    self._calls.popleft()()
+                now = time.monotonic()
+                for dev in list(self.devices):
+                    try:
+                        dev._tick(now)
+                    except Exception as ex:
+                        dev._loop_error(ex)
+        for dev in list(self.devices):
+            dev._unregister()
+        self.selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+_default_mux = None
+_default_mux_lock = threading.Lock()
+
+def get_default_mux():
+    """Return the shared multiplexer, starting it on first use."""
+    global _default_mux
+    with _default_mux_lock:
+        if _default_mux is None or not _default_mux.is_alive():
+            _default_mux = SerialMultiplexer()
+            _default_mux.start()
+        return _default_mux
+
+_opener = None
+_opener_lock = threading.Lock()
+
+def get_opener():
+    """Small shared pool that opens MuxDevice ports off the caller's (UI) thread."""
+    global _opener
+    with _opener_lock:
+        if _opener is None:
+            _opener = ThreadPoolExecutor(max_workers=8, thread_name_prefix="SerialOpen")
+        return _opener
+
+class MuxDevice(DeviceBase):
+    """
+    Drop-in replacement for SerialDevice that owns no thread.
+    Exposes the same send_command/last_result/status/available/serial/close
+    surface; all I/O runs on a SerialMultiplexer loop.
+    """
+    read_poll = 0
+
+    def __init__(self, port, baudrate, name, protocol=None, mux=None, read_timeout=READ_TIMEOUT, usb=None,
+                 station=None, pipeline=None):
+        self._init_state(port, baudrate, name, protocol, usb, station, pipeline, read_timeout)
+        self._registered = False
+        self.mux = mux or get_default_mux()
+        # The port is opened on the opener pool and joins the loop once open;
+        # the first (foreground, so never preempted) probe completes bring-up
+        probe = Future()
+        probe.add_done_callback(lambda _: self._brought_up())
+        self.cmd_queue.submit("B", probe, PRIORITY_OPERATOR)
+        get_opener().submit(self._connect)
+
+    def _connect(self):
+        if not self.running:
+            return
+        self._open_serial()
+        self.mux.add(self)
+
+    # --- loop-thread only ---
+
+    def _register(self):
+        if self.is_connected() and not self._registered:
+            self.mux.selector.register(self.serial.fileno(), selectors.EVENT_READ, self)
+            self._registered = True
+
+    def _unregister(self):
+        if self._registered:
+            try:
+                self.mux.selector.unregister(self.serial.fileno())
+            except (KeyError, ValueError, OSError):
+                pass
+            self._registered = False
+
+    def _on_readable(self):
+        try:
+            data = self._read()
+        except Exception as e:
+            self._io_error(e)
+            return
+        self._note_rx(data)
+        for line in self.framer.feed(data):
+            cmd = self._inflight
+            if self._accept_line(line):
+                self._advance(cmd)
+
+    def _tick(self, now):
+        if self._inflight:
+            if self._background and self.cmd_queue:
+                # A queued user command preempts a background probe
+                self._preempt_probe()
+            elif now >= self._deadline:
+                cmd = self._inflight
+                self._expire()
+                self._advance(cmd)
+                if self._inflight:
+                    return  # the next pipelined answer is now due
+            else:
+                return
+        entry = self.cmd_queue.pop() if self.cmd_queue else None
+        if entry is not None:
+            batch = self._pipelined_batch(entry)
+            if batch:
+                self._start_pipelined([entry] + batch)
+            else:
+                self._start(entry.cmd, entry, entry.queued_at)
+        elif self.running and self.is_connected() and self.heartbeat.due(now):
+            self._start("B", None, None)
+
+    def _start_pipelined(self, entries):
+        if not self.is_connected():
+            for entry in entries:
+                self._start(entry.cmd, entry, entry.queued_at)
+            return
+        data = self._start_pipeline(entries)
+        try:
+            self._write(data)
+            self._note_pipeline_write(entries)
+        except OSError as e:
+            cmd = self._inflight
+            self._lost(cmd, e)
+            self._advance(cmd)
+        except Exception as e:
+            cmd = self._inflight
+            self._abort_pipeline(f"Device error: {e}")
+            self._fail(cmd, f"Device error: {e}", f"error: {e}")
+            self._advance(cmd)
+
+    def _start(self, cmd, entry, queued_at):
+        cmd = cmd.upper()
+        if cmd not in COMMANDS:
+            # Log any custom/unknown command
+            log_result(self.name, cmd, "NotImplemented", "Unknown command")
+            self._resolve(entry, cmd)
+            return
+        if not self.is_connected():
+            if cmd == "B":
+                self._fail("B", "disconnected", "disconnected")
+            else:
+                self._fail(cmd, "Device not connected", "disconnected")
+            self._resolve(entry, cmd)
+            return
+        if cmd in ("STREAM", "STREAM_STOP"):
+            try:
+                data = self._begin_stream(cmd == "STREAM")
+                if data:
+                    self._write(data)
+                    self._note_write(data, queued_at, cmd)
+            except OSError as e:
+                self._lost(cmd, e)
+            except Exception as e:
+                self._fail(cmd, str(e))
+            self._resolve(entry, cmd)
+            return
+        self._begin(cmd, background=queued_at is None and cmd == "B")
+        self._current = entry
+        try:
+            data = cmd.encode() + b"\n"
+            self._write(data)
+            self._note_write(data, queued_at, cmd)
+        except OSError as e:
+            self._lost(cmd, e)
+            self._advance(cmd)
+        except Exception as e:
+            self._fail(cmd, f"Device error: {e}" if cmd == "S" else str(e), f"error: {e}")
+            self._advance(cmd)
+
+    def _close_port(self):
+        self._unregister()
+        try:
+            self.serial.close()
+        except Exception:
+            pass
+
+    def _attach(self, ser, port):
+        """Called by the ConnectionManager with a freshly opened port; joins the loop."""
+        def attach():
+            self._reattached(ser, port)
+            self._register()
+        self.mux.call_soon(attach)
+
+    def _io_error(self, e):
+        cmd = self._inflight
+        self._lost(cmd, e)
+        self._advance(cmd)
+
+    def _loop_error(self, ex):
+        cmd = self._inflight
+        self._inflight = None
+        self._abort_pipeline(str(ex))
+        self.status = f"error: {ex}"
+        self.last_error = str(ex)
+        self.last_result = {"error": str(ex)}
+        log_result(self.name, "run-loop", self.last_result, str(ex))
+        self._advance(cmd)
+
+    # --- public surface, callable from any thread ---
+
+    def _wake(self):
+        self.mux.wake()
+
+    def close(self):
+        self.running = False
+        get_connection_manager().forget(self)
+        self.timing.save()
+        self.mux.call_soon(self._close)
+
+    def _close(self):
+        self.mux._remove(self)
+        if self.serial and self.serial.is_open:
+            self.serial.close()
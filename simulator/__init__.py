@@ -0,0 +1,13 @@
+"""
+PTY-backed virtual instruments speaking the B/S/P protocol, so SerialDevice
+and MuxDevice can be exercised without physical /dev/ttyUSB* ports.
+
+    from simulator import SimulatorHub, InstrumentProfile
+    hub = SimulatorHub()
+    configs = hub.add_fleet(5)           # DEVICE_CONFIGS-shaped list
+    hub.start()
+"""
+from simulator.instrument import InstrumentProfile, VirtualInstrument
+from simulator.hub import SimulatorHub, simulated_device_configs
+
+__all__ = ["InstrumentProfile", "VirtualInstrument", "SimulatorHub", "simulated_device_configs"]
@@ -0,0 +1,40 @@
+"""
+Run virtual instruments standalone and print their ports:
+
+    python -m simulator [--count N] [--latency-ms 5] [--jitter-ms 2] [--garbage 0.0] [--dropout 0.0]
+
+Without --count the five DEVICE_CONFIGS instruments are mirrored.
+"""
+import time
+import argparse
+
+from config import DEVICE_CONFIGS
+from simulator.hub import SimulatorHub, simulated_device_configs
+from simulator.instrument import InstrumentProfile
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulator")
+    parser.add_argument("--count", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--garbage", type=float, default=0.0)
+    parser.add_argument("--dropout", type=float, default=0.0)
+    args = parser.parse_args()
+    profile = InstrumentProfile(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                garbage_rate=args.garbage, dropout_rate=args.dropout)
+    hub = SimulatorHub()
+    if args.count:
+        configs = hub.add_fleet(args.count, profile)
+        hub.start()
+    else:
+        hub, configs = simulated_device_configs(DEVICE_CONFIGS, profile, hub)
+    for cfg in configs:
+        print(f"{cfg['name']:14} {cfg['port']}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        hub.close()
+
+if __name__ == "__main__":
+    main()
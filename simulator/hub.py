@@ -0,0 +1,171 @@
+import os
+import tty
+import time
+import heapq
+import select
+import threading
+
+from serial.tools.list_ports_common import ListPortInfo
+
+from simulator.instrument import InstrumentProfile, VirtualInstrument
+
+# USB ids reported for simulated ports by SimulatorHub.list_ports (serial number = instrument name)
+SIM_VID, SIM_PID = 0x1209, 0x0001
+
+class SimulatorHub(threading.Thread):
+    """
+    Serves any number of VirtualInstruments over pseudo-terminals from a
+    single thread, so the simulator itself does not skew thread or CPU
+    counts much. Answers are scheduled on a timer heap to model latency.
+    """
+    def __init__(self):
+        super().__init__(daemon=True, name="SimulatorHub")
+        self.ports = {}         # master fd -> (instrument, slave fd, rx buffer)
+        self.dead = set()       # master fds whose read failed; no longer polled
+        self.paths = {}         # slave path -> master fd
+        self.timers = []        # heap of (due, seq, fd, data)
+        self.busy_until = {}    # master fd -> when the instrument finishes its last answer
+        self._seq = 0
+        self.running = True
+        self._lock = threading.Lock()
+
+    def add(self, instrument):
+        """Create a pty for `instrument`; returns the slave path to open as a serial port."""
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        os.set_blocking(master, False)
+        path = os.ttyname(slave)
+        with self._lock:
+            self.ports[master] = (instrument, slave, bytearray())
+            self.paths[path] = master
+            self.dead.discard(master)
+        return path
+
+    def unplug(self, path):
+        """Close the pty behind `path`, like pulling the USB cable. Returns the instrument."""
+        with self._lock:
+            master = self.paths.pop(path)
+            instrument, slave, _ = self.ports.pop(master)
+            self.busy_until.pop(master, None)
+            self.dead.discard(master)
+            for fd in (master, slave):
+                os.close(fd)
+        return instrument
+
+    def list_ports(self):
+        """serial.tools.list_ports.comports()-style entries for the live ptys."""
+        with self._lock:
+            entries = [(path, self.ports[master][0]) for path, master in self.paths.items()]
+        infos = []
+        for path, instrument in entries:
+            info = ListPortInfo(path, skip_link_detection=True)
+            info.vid, info.pid, info.serial_number = SIM_VID, SIM_PID, instrument.name
+            infos.append(info)
+        return infos
+
+    def add_fleet(self, count, profile=None, names=None, baudrate=115200):
+        """Add `count` instruments and return DEVICE_CONFIGS-shaped entries for them."""
+        configs = []
+        for i in range(count):
+            name = names[i] if names else f"Sim{i:03d}"
+            port = self.add(VirtualInstrument(name, profile, seed=i))
+            configs.append({"name": name, "port": port, "baudrate": baudrate})
+        return configs
+
+    def _schedule(self, delay, fd, data):
+        self._seq += 1
+        heapq.heappush(self.timers, (time.monotonic() + delay, self._seq, fd, data))
+
+    def _read(self, fd):
+        instrument, _, buf = self.ports[fd]
+        try:
+            data = os.read(fd, 4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.dead.add(fd)
+            return
+        buf += data
+        while True:
+            idx = buf.find(b"\n")
+            if idx < 0:
+                break
+            line = buf[:idx].decode("utf-8", errors="ignore")
+            del buf[:idx + 1]
+            was_streaming = instrument.streaming
+            answers = instrument.handle(line)
+            if answers:
+                # An instrument works through back-to-back commands one at a time, in order
+                now = time.monotonic()
+                start = max(0.0, self.busy_until.get(fd, 0.0) - now)
+                for delay, answer in answers:
+                    self._schedule(start + delay, fd, answer)
+                self.busy_until[fd] = now + start + max(delay for delay, _ in answers)
+            if instrument.streaming and not was_streaming:
+                self._schedule(1.0 / instrument.profile.stream_hz, fd, None)
+
+    def _fire(self, now):
+        while self.timers and self.timers[0][0] <= now:
+            _, _, fd, data = heapq.heappop(self.timers)
+            if fd not in self.ports:
+                continue
+            instrument = self.ports[fd][0]
+            if data is None:
+                # Streaming tick: emit a sample and reschedule
+                if not instrument.streaming:
+                    continue
+                data = instrument.stream_sample()
+                self._schedule(1.0 / instrument.profile.stream_hz, fd, None)
+            try:
+                os.write(fd, data)
+            except OSError:
+                pass
+
+    def run(self):
+        while self.running:
+            timeout = 0.2
+            if self.timers:
+                timeout = max(0.0, min(timeout, self.timers[0][0] - time.monotonic()))
+            # Poll a snapshot without the lock, so add/unplug/list_ports never
+            # wait out the timeout; fds unplugged meanwhile are skipped below
+            with self._lock:
+                fds = [fd for fd in self.ports if fd not in self.dead]
+            poller = select.poll()
+            for fd in fds:
+                poller.register(fd, select.POLLIN)
+            events = poller.poll(timeout * 1000)
+            with self._lock:
+                for fd, _ in events:
+                    if fd in self.ports and fd not in self.dead:
+                        self._read(fd)
+                self._fire(time.monotonic())
+
+    def close(self):
+        self.running = False
+        if self.is_alive():
+            self.join(1)
+        with self._lock:
+            for master, (_, slave, _) in list(self.ports.items()):
+                for fd in (master, slave):
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            self.ports.clear()
+            self.paths.clear()
+
+def simulated_device_configs(device_configs, profile=None, hub=None):
+    """
+    Mirror `device_configs` (e.g. config.DEVICE_CONFIGS) onto virtual
+    instruments: same names and baud rates, ports replaced by ptys and
+    matched by USB serial number (see list_ports), so unplug/re-add moves them.
+    Returns (hub, configs); the hub is started.
+    """
+    hub = hub or SimulatorHub()
+    configs = []
+    for i, cfg in enumerate(device_configs):
+        port = hub.add(VirtualInstrument(cfg["name"], profile or InstrumentProfile(), seed=i))
+        configs.append(dict(cfg, port=port, usb={"vid": SIM_VID, "pid": SIM_PID, "serial_number": cfg["name"]}))
+    if not hub.is_alive():
+        hub.start()
+    return hub, configs
@@ -0,0 +1,68 @@
+import json
+import random
+
+class InstrumentProfile:
+    """How a virtual instrument behaves on the wire."""
+    def __init__(self, latency_ms=5.0, jitter_ms=2.0, garbage_rate=0.0, dropout_rate=0.0,
+                 weight_g=1.182, noise_g=0.0005, stream_hz=10.0, stream_start="SIR", stream_stop="@"):
+        self.latency_ms = latency_ms        # base delay before an answer
+        self.jitter_ms = jitter_ms          # uniform +/- jitter on top of latency
+        self.garbage_rate = garbage_rate    # chance of a garbage line before an answer
+        self.dropout_rate = dropout_rate    # chance of not answering at all
+        self.weight_g = weight_g            # nominal reading for S / streaming
+        self.noise_g = noise_g              # gaussian noise on each reading
+        self.stream_hz = stream_hz          # sample rate after the stream start command
+        self.stream_start = stream_start
+        self.stream_stop = stream_stop
+
+class VirtualInstrument:
+    """
+    Protocol logic for one simulated port: turns a received command line
+    into (delay_s, bytes) answers. Transport lives in SimulatorHub.
+    """
+    def __init__(self, name, profile=None, seed=None):
+        self.name = name
+        self.profile = profile or InstrumentProfile()
+        self.rng = random.Random(seed)
+        self.streaming = False
+        self.commands = 0
+
+    def _delay(self):
+        p = self.profile
+        return max(0.0, (p.latency_ms + self.rng.uniform(-p.jitter_ms, p.jitter_ms)) / 1000.0)
+
+    def reading(self):
+        p = self.profile
+        return p.weight_g + self.rng.gauss(0, p.noise_g) if p.noise_g else p.weight_g
+
+    def handle(self, line):
+        """Return a list of (delay_s, data) answers for one command line."""
+        p = self.profile
+        self.commands += 1
+        cmd = line.strip().upper()
+        if cmd == p.stream_start.upper():
+            self.streaming = True
+            return []
+        if cmd == p.stream_stop.upper():
+            self.streaming = False
+            return []
+        if self.rng.random() < p.dropout_rate:
+            return []
+        if cmd == "B":
+            body = b"OK\n"
+        elif cmd == "S":
+            body = f"S S      {self.reading():.3f} g\n".encode()
+        elif cmd == "P":
+            body = (json.dumps({"device": self.name, "weight": round(self.reading(), 4), "unit": "g"}) + "\n").encode()
+        else:
+            body = b"ES\n"
+        delay = self._delay()
+        answers = []
+        if self.rng.random() < p.garbage_rate:
+            answers.append((delay / 2, b"\x00#garbage#\n"))
+        answers.append((delay, body))
+        return answers
+
+    def stream_sample(self):
+        # Always 'S D': the controller decides stability itself
+        return f"S D     {self.reading():.4f} g\n".encode()
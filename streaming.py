@@ -0,0 +1,120 @@
+import math
+import time
+from array import array
+
+class RingBuffer:
+    """
+    Fixed-size (timestamp, value) sample store backed by two array('d').
+    Keeps a running sum and sum of squares over the newest `window` samples
+    so the rolling mean/stddev are O(1) per append. Memory never grows.
+    """
+    def __init__(self, capacity, window):
+        if window > capacity:
+            raise ValueError("window must not exceed capacity")
+        self.capacity = capacity
+        self.window = window
+        self.ts = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.head = 0       # next slot to write
+        self.count = 0      # samples stored, up to capacity
+        self._ref = 0.0     # shift applied to the sums to keep them well conditioned
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._since_resum = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self._ref = self._sum = self._sumsq = 0.0
+        self._since_resum = 0
+
+    def append(self, ts, value):
+        cap = self.capacity
+        if self.count >= self.window:
+            old = self.values[(self.head - self.window) % cap] - self._ref
+            self._sum -= old
+            self._sumsq -= old * old
+        elif self.count == 0:
+            self._ref = value
+        self.ts[self.head] = ts
+        self.values[self.head] = value
+        self.head = (self.head + 1) % cap
+        if self.count < cap:
+            self.count += 1
+        d = value - self._ref
+        self._sum += d
+        self._sumsq += d * d
+        self._since_resum += 1
+        if self._since_resum >= cap:
+            self._resum()
+
+    def _resum(self):
+        """Recompute the window sums from scratch to shed accumulated rounding error."""
+        n = min(self.count, self.window)
+        self._ref = self.values[(self.head - 1) % self.capacity]
+        self._sum = self._sumsq = 0.0
+        for i in range(1, n + 1):
+            d = self.values[(self.head - i) % self.capacity] - self._ref
+            self._sum += d
+            self._sumsq += d * d
+        self._since_resum = 0
+
+    def window_count(self):
+        return min(self.count, self.window)
+
+    def mean(self):
+        n = self.window_count()
+        return self._ref + self._sum / n if n else float("nan")
+
+    def stddev(self):
+        n = self.window_count()
+        if n < 2:
+            return float("nan")
+        m = self._sum / n
+        return math.sqrt(max(0.0, (self._sumsq - n * m * m) / (n - 1)))
+
+    def latest(self):
+        if not self.count:
+            return None
+        i = (self.head - 1) % self.capacity
+        return self.ts[i], self.values[i]
+
+    def samples(self):
+        """Oldest-to-newest (ts, value) pairs; allocates, meant for diagnostics and export."""
+        start = (self.head - self.count) % self.capacity
+        return [(self.ts[(start + i) % self.capacity], self.values[(start + i) % self.capacity])
+                for i in range(self.count)]
+
+class StabilityDetector:
+    """
+    Feeds samples into a RingBuffer and reports a settled reading once per
+    settle: when a full window has stddev <= threshold. It re-arms as soon
+    as the window becomes unstable again.
+    """
+    def __init__(self, capacity, window, threshold):
+        self.ring = RingBuffer(capacity, window)
+        self.threshold = threshold
+        self.stable = False
+
+    def add(self, value, ts=None):
+        """Add a sample; returns (mean, stddev) on the unstable->stable edge, else None."""
+        ring = self.ring
+        ring.append(time.time() if ts is None else ts, value)
+        if ring.count < ring.window:
+            return None
+        sd = ring.stddev()
+        if sd <= self.threshold:
+            if not self.stable:
+                self.stable = True
+                return ring.mean(), sd
+        else:
+            self.stable = False
+        return None
+
+    def reset(self):
+        """Forget all samples: the next settle needs a full window of new ones."""
+        self.ring.clear()
+        self.stable = False
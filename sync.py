@@ -0,0 +1,203 @@
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import DBFILE, HTTP_ENDPOINT, UPLOAD_TIMEOUT_S, SYNC_BATCH_ROWS, SYNC_SKIP_COMMANDS
+from db import DB_WRITE_LOCK, LOG_COLUMNS, decode_result, flush_logs
+from metrics import METRICS
+from tracing import span
+
+UPSERT_WATERMARK_SQL = """
+    INSERT INTO sync_watermarks (endpoint, last_log_id, updated) VALUES (?, ?, ?)
+    ON CONFLICT(endpoint) DO UPDATE SET last_log_id = excluded.last_log_id, updated = excluded.updated,
+        pending_to_id = NULL, pending_key = NULL, pending_snapshots = NULL
+"""
+UPSERT_PENDING_SQL = """
+    INSERT INTO sync_watermarks (endpoint, last_log_id, updated, pending_to_id, pending_key, pending_snapshots)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(endpoint) DO UPDATE SET pending_to_id = excluded.pending_to_id,
+        pending_key = excluded.pending_key, pending_snapshots = excluded.pending_snapshots
+"""
+UPSERT_SNAPSHOT_SQL = """
+    INSERT INTO sync_snapshots (endpoint, device, hash, sent_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(endpoint, device) DO UPDATE SET hash = excluded.hash, sent_at = excluded.sent_at
+"""
+
+def content_hash(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class SyncReport:
+    """What one DeltaSync.sync() call sent."""
+    def __init__(self):
+        self.rows = 0
+        self.batches = 0
+        self.bytes = 0
+        self.snapshots = 0
+        self.unchanged = 0
+        self.status = None
+        self.error = None
+        self.watermark = None
+
+class DeltaSync:
+    """
+    Incremental sync of measurements to one endpoint. The highest logs.id
+    the server has acknowledged is kept in sync_watermarks; each sync
+    posts only the rows after it, in gzip batches of SYNC_BATCH_ROWS,
+    and moves the watermark after every 2xx. Each batch's range, key and
+    snapshots are stored with the watermark before it is posted, so a
+    batch that was not acknowledged is sent again exactly, under the same
+    Idempotency-Key, even if more rows arrived meanwhile. Device snapshots
+    are only sent when their content hash differs from the last acknowledged one.
+    """
+    def __init__(self, endpoint=HTTP_ENDPOINT, path=DBFILE, batch_rows=SYNC_BATCH_ROWS,
+                 skip_commands=SYNC_SKIP_COMMANDS, timeout=UPLOAD_TIMEOUT_S):
+        self.endpoint = endpoint
+        self.path = path
+        self.batch_rows = batch_rows
+        self.skip_commands = tuple(skip_commands)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.post_hist = METRICS.histogram("gold_http_upload_seconds", "HTTP upload time per batch")
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def watermark(self, conn):
+        row = conn.execute("SELECT last_log_id FROM sync_watermarks WHERE endpoint = ?", (self.endpoint,)).fetchone()
+        return row[0] if row else 0
+
+    def _pending(self, conn):
+        """(to_id, key, {device: (result, hash)}) of a batch posted but not acknowledged, or None."""
+        row = conn.execute("SELECT pending_to_id, pending_key, pending_snapshots FROM sync_watermarks"
+                           " WHERE endpoint = ?", (self.endpoint,)).fetchone()
+        if not row or row[1] is None:
+            return None
+        return row[0], row[1], {device: tuple(v) for device, v in json.loads(row[2]).items()}
+
+    def _changed_snapshots(self, conn, snapshots):
+        """{device: (result, hash)} for snapshots the server does not have yet."""
+        sent = dict(conn.execute("SELECT device, hash FROM sync_snapshots WHERE endpoint = ?", (self.endpoint,)))
+        changed = {}
+        for device, result in snapshots.items():
+            h = content_hash(result)
+            if sent.get(device) != h:
+                changed[device] = (result, h)
+        return changed
+
+    def _rows_after(self, conn, last_id, to_id=None):
+        sql = f"SELECT {', '.join(LOG_COLUMNS)} FROM logs WHERE id > ?"
+        params = [last_id]
+        if to_id is not None:
+            sql += " AND id <= ?"
+            params.append(to_id)
+        if self.skip_commands:
+            sql += f" AND command NOT IN ({', '.join('?' * len(self.skip_commands))})"
+            params.extend(self.skip_commands)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(self.batch_rows)
+        rows = []
+        for r in conn.execute(sql, params):
+            d = dict(zip(LOG_COLUMNS, r))
+            d["result"] = decode_result(d["result"])
+            rows.append(d)
+        return rows
+
+    def _post(self, body, key):
+        data = gzip.compress(json.dumps(body, default=str).encode("utf-8"))
+        t0 = time.perf_counter()
+        try:
+            with span("http.post", "http", endpoint="sync", rows=len(body["rows"]), bytes=len(data)):
+                resp = self.session.post(self.endpoint, data=data, timeout=self.timeout,
+                                         headers={"Idempotency-Key": key})
+        except Exception as e:
+            return None, str(e), len(data)
+        finally:
+            self.post_hist.observe(time.perf_counter() - t0)
+        if 200 <= resp.status_code < 300:
+            return resp.status_code, None, len(data)
+        return resp.status_code, f"HTTP {resp.status_code}", len(data)
+
+    def sync(self, snapshots=None, progress=None):
+        """
+        Send everything the endpoint has not acknowledged yet, plus changed
+        `snapshots` ({device: result}). progress(report) runs after each batch.
+        Returns a SyncReport; report.error is set if a batch was not accepted.
+        """
+        report = SyncReport()
+        if not self.lock.acquire(blocking=False):
+            report.error = "sync already running"
+            return report
+        conn = self._connect()
+        try:
+            # Rows still queued in the LogWriter belong in this sync
+            flush_logs()
+            last_id = self.watermark(conn)
+            pending = self._pending(conn)
+            changed = self._changed_snapshots(conn, snapshots or {})
+            report.unchanged = len(snapshots or {}) - len(changed)
+            while True:
+                if pending:
+                    # Not acknowledged last time: same range, snapshots and key
+                    to_id, key, sent = pending
+                    rows = self._rows_after(conn, last_id, to_id)
+                else:
+                    rows = self._rows_after(conn, last_id)
+                    if not rows and not changed:
+                        break
+                    to_id = rows[-1]["id"] if rows else last_id
+                    sent = changed
+                    key = content_hash([self.endpoint, last_id, to_id,
+                                        {device: result for device, (result, _) in sent.items()}])
+                    with DB_WRITE_LOCK:
+                        conn.execute(UPSERT_PENDING_SQL, (self.endpoint, last_id, time.time(), to_id, key,
+                                                          json.dumps(sent, default=str)))
+                        conn.commit()
+                body = {"type": "delta", "from_id": last_id, "to_id": to_id, "rows": rows,
+                        "snapshots": {device: result for device, (result, _) in sent.items()}}
+                status, err, size = self._post(body, key)
+                report.batches += 1
+                report.bytes += size
+                report.status, report.error = status, err
+                if err is not None:
+                    break
+                now = time.time()
+                with DB_WRITE_LOCK:
+                    conn.execute(UPSERT_WATERMARK_SQL, (self.endpoint, to_id, now))
+                    conn.executemany(UPSERT_SNAPSHOT_SQL, [(self.endpoint, device, h, now)
+                                                           for device, (_, h) in sent.items()])
+                    conn.commit()
+                report.rows += len(rows)
+                report.snapshots += len(sent)
+                last_id = to_id
+                if progress:
+                    progress(report)
+                if pending:
+                    pending = None
+                    changed = {device: v for device, v in changed.items() if sent.get(device, (None, None))[1] != v[1]}
+                    continue
+                changed = {}
+                if len(rows) < self.batch_rows:
+                    break
+            report.watermark = last_id
+            return report
+        finally:
+            conn.close()
+            self.lock.release()
+
+_delta_sync = None
+
+def get_delta_sync():
+    global _delta_sync
+    if _delta_sync is None:
+        _delta_sync = DeltaSync()
+    return _delta_sync
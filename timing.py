@@ -0,0 +1,114 @@
+import json
+import time
+import sqlite3
+from collections import deque
+
+from config import (HEARTBEAT_READ_TIMEOUT_S, TIMING_ADAPTIVE, TIMING_PERCENTILE, TIMING_FACTOR, TIMING_MARGIN_S,
+                    TIMING_MIN_S, TIMING_MAX_S, TIMING_WINDOW, TIMING_MIN_SAMPLES, TIMING_SAVE_S, TIMING_PROFILES)
+from db import get_writer, get_read_conn
+
+UPSERT_TIMING_SQL = """
+    INSERT INTO timing_profiles (device, command, samples, budget, updated) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(device, command) DO UPDATE SET
+        samples = excluded.samples, budget = excluded.budget, updated = excluded.updated
+"""
+TIMED_COMMANDS = ("B", "S", "P")
+MAX_DOUBLINGS = 6
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class TimingProfile:
+    """
+    Learned answer budgets for one device. observe() records how long each
+    answered B/S/P took; once a command has TIMING_MIN_SAMPLES, its budget
+    is the TIMING_PERCENTILE of the recent window x FACTOR + MARGIN_S. Before
+    that the `defaults` (overridden by TIMING_PROFILES[device]) apply. Every
+    expiry in a row doubles a budget, so a device that slowed down is not
+    cut off for good. Samples persist in the timing_profiles table.
+    """
+    def __init__(self, device, defaults, adaptive=TIMING_ADAPTIVE):
+        self.device = device
+        configured = TIMING_PROFILES.get(device, {})
+        self.defaults = dict(defaults, **configured)
+        self.background_default = configured.get("B", HEARTBEAT_READ_TIMEOUT_S)
+        self.adaptive = adaptive
+        self.samples = {cmd: deque(maxlen=TIMING_WINDOW) for cmd in TIMED_COMMANDS}
+        self.learned = {}           # cmd -> budget fitted from samples
+        self.misses = dict.fromkeys(TIMED_COMMANDS, 0)
+        self.dirty = set()
+        self.saved_at = time.monotonic()
+
+    @staticmethod
+    def _fit(window):
+        return min(TIMING_MAX_S, max(TIMING_MIN_S, percentile(window, TIMING_PERCENTILE) * TIMING_FACTOR + TIMING_MARGIN_S))
+
+    def budget(self, cmd, background=False):
+        """Seconds to wait for the complete answer to `cmd`."""
+        base = self.learned.get(cmd)
+        if base is None:
+            if background and cmd == "B":
+                base = self.background_default
+            else:
+                base = self.defaults.get(cmd, max(self.defaults.values()))
+        misses = min(self.misses.get(cmd, 0), MAX_DOUBLINGS)
+        if misses:
+            base = min(max(base, TIMING_MAX_S), base * 2 ** misses)
+        return base
+
+    def deadline(self, cmd):
+        """How long a caller should wait for a queued `cmd`: one command ahead of it, then its own answer."""
+        return max(self.budget(c) for c in TIMED_COMMANDS) + self.budget(cmd)
+
+    def observe(self, cmd, seconds):
+        """`cmd` was answered `seconds` after its answer became due."""
+        if cmd not in self.samples:
+            return
+        self.misses[cmd] = 0
+        if not self.adaptive:
+            return
+        window = self.samples[cmd]
+        window.append(seconds)
+        self.dirty.add(cmd)
+        if len(window) >= TIMING_MIN_SAMPLES:
+            self.learned[cmd] = self._fit(window)
+        if time.monotonic() - self.saved_at >= TIMING_SAVE_S:
+            self.save()
+
+    def expired(self, cmd):
+        if self.adaptive and cmd in self.misses:
+            self.misses[cmd] += 1
+
+    def load(self):
+        """Pick up the samples saved by the previous run, if any."""
+        if not self.adaptive:
+            return
+        try:
+            rows = get_read_conn().execute(
+                "SELECT command, samples FROM timing_profiles WHERE device = ?", (self.device,)).fetchall()
+        except sqlite3.Error:
+            return      # no database or table yet: start from the defaults
+        for cmd, text in rows:
+            if cmd not in self.samples:
+                continue
+            try:
+                self.samples[cmd].extend(float(s) for s in json.loads(text))
+            except (TypeError, ValueError):
+                continue
+            if len(self.samples[cmd]) >= TIMING_MIN_SAMPLES:
+                self.learned[cmd] = self._fit(self.samples[cmd])
+
+    def save(self):
+        """Queue the changed windows on the LogWriter."""
+        dirty, self.dirty = self.dirty, set()
+        self.saved_at = time.monotonic()
+        now = time.time()
+        for cmd in dirty:
+            samples = json.dumps([round(s, 4) for s in list(self.samples[cmd])])
+            get_writer().enqueue((self.device, cmd, samples, self.learned.get(cmd), now), sql=UPSERT_TIMING_SQL)
+
+    def summary(self):
+        """e.g. "B 200 ms  S 260 ms  P 1000 ms*" (* = not learned yet)."""
+        return "  ".join(f"{cmd} {self.budget(cmd) * 1000:.0f} ms{'' if cmd in self.learned else '*'}"
+                         for cmd in TIMED_COMMANDS)
@@ -0,0 +1,315 @@
+"""
+Opt-in tracing of the serial, database, HTTP and UI paths, written as
+Chrome trace JSON (open in chrome://tracing or https://ui.perfetto.dev).
+
+    GOLD_TRACE=1 python main.py          trace from startup, file written on exit
+    GOLD_TRACE=profile python main.py    the same plus a sampling profiler
+    python tracing.py trace.json         summary of a captured file
+
+or press "Capture trace" in the Diagnostics panel during a slowdown.
+
+Spans are appended to a bounded per-thread deque with no lock on the hot
+path. While tracing is off, span() returns a shared no-op object, so
+instrumented code pays one call and a flag test.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import datetime
+import threading
+from collections import deque, defaultdict
+
+from config import (TRACE_ENABLED, TRACE_PROFILE, TRACE_DIR, TRACE_CAPTURE_S, TRACE_BUFFER_EVENTS,
+                    TRACE_SAMPLE_INTERVAL_S, TRACE_MAX_SAMPLES)
+
+SPAN_PID = 1
+SAMPLE_PID = 2
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("buf", "name", "cat", "args", "t0")
+
+    def __init__(self, buf, name, cat, args):
+        self.buf = buf
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter_ns()
+        self.buf.append((self.name, self.cat, self.t0, t1 - self.t0, self.args))
+        return False
+
+class SamplingProfiler(threading.Thread):
+    """Records every other thread's Python stack each `interval_s`."""
+    def __init__(self, interval_s=TRACE_SAMPLE_INTERVAL_S, max_samples=TRACE_MAX_SAMPLES):
+        super().__init__(daemon=True, name="TraceProfiler")
+        self.interval_s = interval_s
+        self.samples = deque(maxlen=max_samples)    # (perf_counter_ns, thread ident, stack outermost first)
+        self.names = {}
+        self.labels = {}                            # code object -> "func (file:line)"
+        self.running = True
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def run(self):
+        me = threading.get_ident()
+        while self.running:
+            t = time.perf_counter_ns()
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.append((t, tid, tuple(stack)))
+            if len(self.names) != threading.active_count():
+                self.names.update((th.ident, th.name) for th in threading.enumerate())
+            time.sleep(self.interval_s)
+
+    def stop(self):
+        self.running = False
+
+    def events(self, base_ns):
+        """Consecutive samples merged into nested "X" events, one track per thread."""
+        by_thread = defaultdict(list)
+        for t, tid, stack in list(self.samples):
+            by_thread[tid].append((t, stack))
+        step = self.interval_s * 1e9
+        events = []
+        for tid, seq in by_thread.items():
+            events.append({"ph": "M", "name": "thread_name", "pid": SAMPLE_PID, "tid": tid,
+                           "args": {"name": self.names.get(tid, str(tid))}})
+            open_frames = []    # [(label, start_ns)]
+            for t, stack in seq:
+                n = 0
+                while n < len(open_frames) and n < len(stack) and open_frames[n][0] == stack[n]:
+                    n += 1
+                for label, start in reversed(open_frames[n:]):
+                    events.append(_complete(label, "sample", SAMPLE_PID, tid, start - base_ns, t - start))
+                del open_frames[n:]
+                open_frames.extend((label, t) for label in stack[n:])
+            end = seq[-1][0] + step
+            for label, start in reversed(open_frames):
+                events.append(_complete(label, "sample", SAMPLE_PID, tid, start - base_ns, end - start))
+        return events
+
+def _complete(name, cat, pid, tid, start_ns, dur_ns, args=None):
+    event = {"name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+             "ts": start_ns / 1000, "dur": dur_ns / 1000}
+    if args:
+        event["args"] = args
+    return event
+
+class Tracer:
+    """
+    Process-wide span recorder. start()/stop() may be called at any time;
+    dump() writes whatever the per-thread buffers hold.
+    """
+    def __init__(self, buffer_events=TRACE_BUFFER_EVENTS):
+        self.buffer_events = buffer_events
+        self.active = False
+        self.local = threading.local()
+        self.buffers = []           # (thread ident, thread name, deque of spans)
+        self.lock = threading.Lock()
+        self.profiler = None
+        self.started_ns = None
+        self.capturing = False
+
+    def buffer(self):
+        """This thread's span deque, registered on first use."""
+        buf = getattr(self.local, "buf", None)
+        if buf is None:
+            buf = self.local.buf = deque(maxlen=self.buffer_events)
+            t = threading.current_thread()
+            with self.lock:
+                self.buffers.append((t.ident, t.name, buf))
+        return buf
+
+    def _prune(self):
+        """Forget the buffers of threads that have exited."""
+        alive = {t.ident for t in threading.enumerate()}
+        with self.lock:
+            self.buffers = [b for b in self.buffers if b[0] in alive]
+
+    def start(self, profile=False):
+        """Clear the buffers and begin recording (plus stack sampling with `profile`)."""
+        self._prune()
+        with self.lock:
+            for _, _, buf in self.buffers:
+                buf.clear()
+        self.started_ns = time.perf_counter_ns()
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.profiler = SamplingProfiler() if profile else None
+        if self.profiler is not None:
+            self.profiler.start()
+        self.active = True
+
+    def stop(self):
+        self.active = False
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.join(1.0)
+
+    def events(self):
+        base = self.started_ns or 0
+        events = [{"ph": "M", "name": "process_name", "pid": SPAN_PID, "args": {"name": "GoldController"}}]
+        with self.lock:
+            buffers = list(self.buffers)
+        for tid, thread_name, buf in buffers:
+            spans = buf.copy()
+            if not spans:
+                continue
+            events.append({"ph": "M", "name": "thread_name", "pid": SPAN_PID, "tid": tid, "args": {"name": thread_name}})
+            for name, cat, t0, dur, args in spans:
+                events.append(_complete(name, cat, SPAN_PID, tid, t0 - base, dur, args))
+        if self.profiler is not None:
+            events.append({"ph": "M", "name": "process_name", "pid": SAMPLE_PID, "args": {"name": "sampled stacks"}})
+            events.extend(self.profiler.events(base))
+        return events
+
+    def dump(self, path=None):
+        """Write the recorded spans (and samples) as Chrome trace JSON; returns the path."""
+        if path is None:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            path = os.path.join(TRACE_DIR, f"trace-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+        trace = {"traceEvents": self.events(), "displayTimeUnit": "ms",
+                 "otherData": {"written": datetime.datetime.now().isoformat(), "pid": os.getpid()}}
+        tmp = path + ".part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(trace, f, default=str)
+        os.replace(tmp, path)
+        # Spans of exited threads are in the file now
+        self._prune()
+        return path
+
+    def capture(self, seconds=TRACE_CAPTURE_S, profile=TRACE_PROFILE, on_done=None):
+        """
+        Record for `seconds` in a background thread, then dump; on_done(path or
+        error string) runs on that thread. If tracing is already on it keeps
+        running and the file holds everything still buffered.
+        """
+        if self.capturing:
+            return None
+
+        def work():
+            was_active = self.active
+            try:
+                if not was_active:
+                    self.start(profile)
+                time.sleep(seconds)
+                if not was_active:
+                    self.stop()
+                result = self.dump()
+            except Exception as e:
+                print(f"[TRACE] Capture failed: {e}")
+                result = f"error: {e}"
+            finally:
+                self.capturing = False
+            if on_done:
+                on_done(result)
+
+        self.capturing = True
+        worker = threading.Thread(target=work, daemon=True, name="TraceCapture")
+        worker.start()
+        return worker
+
+TRACER = Tracer()
+
+def span(name, cat="app", **args):
+    """Context manager timing one block; a shared no-op while tracing is off."""
+    if not TRACER.active:
+        return NULL_SPAN
+    return _Span(TRACER.buffer(), name, cat, args)
+
+def traced(name, cat="app"):
+    """Decorator form of span() for whole functions."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*a, **kw):
+            if not TRACER.active:
+                return fn(*a, **kw)
+            with _Span(TRACER.buffer(), name, cat, None):
+                return fn(*a, **kw)
+        return inner
+    return wrap
+
+def trace_mode():
+    """(enabled, profile) from GOLD_TRACE ("1"/"profile"/"0") or else TRACE_ENABLED/TRACE_PROFILE."""
+    env = os.environ.get("GOLD_TRACE", "").strip().lower()
+    if not env:
+        return TRACE_ENABLED, TRACE_ENABLED and TRACE_PROFILE
+    if env in ("0", "off", "false", "no"):
+        return False, False
+    return True, env == "profile"
+
+def start_from_env():
+    """Start tracing if GOLD_TRACE or the config asks for it; returns whether it did."""
+    enabled, profile = trace_mode()
+    if enabled:
+        TRACER.start(profile)
+        print(f"[TRACE] Tracing on{' with sampling profiler' if profile else ''}; written to {TRACE_DIR}/ on exit")
+    return enabled
+
+def stop_tracing():
+    """Stop tracing and write the file if it was on; returns the path or None."""
+    if not TRACER.active:
+        return None
+    TRACER.stop()
+    try:
+        path = TRACER.dump()
+    except OSError as e:
+        print(f"[TRACE] Could not write trace: {e}")
+        return None
+    print(f"[TRACE] Wrote {path}")
+    return path
+
+def summarize(path, top=20):
+    """Per-span-name count, total and max duration (ms) of a trace file, longest total first."""
+    with open(path, encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    stats = defaultdict(lambda: [0, 0.0, 0.0])
+    for e in events:
+        if e.get("ph") == "X" and e.get("pid") == SPAN_PID:
+            s = stats[(e["cat"], e["name"])]
+            s[0] += 1
+            s[1] += e["dur"] / 1000
+            s[2] = max(s[2], e["dur"] / 1000)
+    return sorted(((cat, name, n, total, worst) for (cat, name), (n, total, worst) in stats.items()),
+                  key=lambda r: -r[3])[:top]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a GoldController trace file.")
+    parser.add_argument("path")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+    print(f"{'cat':8} {'span':28} {'count':>8} {'total ms':>10} {'max ms':>9}")
+    for cat, name, n, total, worst in summarize(args.path, args.top):
+        print(f"{cat:8} {name:28} {n:8d} {total:10.1f} {worst:9.2f}")
+
+if __name__ == "__main__":
+    main()
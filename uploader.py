@@ -0,0 +1,204 @@
+import gzip
+import json
+import time
+import uuid
+import random
+import sqlite3
+import hashlib
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (DBFILE, HTTP_ENDPOINT, UPLOAD_BATCH_SIZE, UPLOAD_POLL_S, UPLOAD_TIMEOUT_S,
+                    UPLOAD_BACKOFF_BASE_S, UPLOAD_BACKOFF_MAX_S, UPLOAD_ENQUEUE_TIMEOUT_S, UPLOAD_MAX_ATTEMPTS)
+from db import DB_WRITE_LOCK, get_writer, flush_logs
+from metrics import METRICS
+from tracing import span
+
+INSERT_OUTBOX_SQL = "INSERT INTO outbox (idem_key, created, payload) VALUES (?, ?, ?)"
+
+def is_permanent(status):
+    """A rejection that retrying the same request cannot fix."""
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+class Uploader(threading.Thread):
+    """
+    Background store-and-forward sender for the outbox table.
+    Payloads are persisted first (through the LogWriter), then posted in
+    gzip-compressed batches over a pooled requests.Session with exponential
+    backoff. Anything unsent when the app stops is picked up on next start.
+    Items the server keeps rejecting are dead-lettered (see UPLOAD_MAX_ATTEMPTS)
+    so they cannot hold up the rest of the outbox.
+    """
+    def __init__(self, endpoint=HTTP_ENDPOINT, path=DBFILE, batch_size=UPLOAD_BATCH_SIZE,
+                 poll_s=UPLOAD_POLL_S, timeout=UPLOAD_TIMEOUT_S, max_attempts=UPLOAD_MAX_ATTEMPTS):
+        super().__init__(daemon=True, name="Uploader")
+        self.endpoint = endpoint
+        self.path = path
+        self.batch_size = batch_size
+        self.limit = batch_size
+        self.max_attempts = max_attempts
+        self.poll_s = poll_s
+        self.timeout = timeout
+        self.running = True
+        self.wakeup = threading.Event()
+        self.callbacks = {}
+        self.last_status = None
+        self.last_error = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.post_hist = METRICS.histogram("gold_http_upload_seconds", "HTTP upload time per batch")
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+    def enqueue(self, payload, on_sent=None):
+        """
+        Persist a payload for upload and return its idempotency key.
+        on_sent(status_code, error) is called after every delivery attempt.
+        Never blocks on the network; waits up to UPLOAD_ENQUEUE_TIMEOUT_S for
+        room in the LogWriter queue and raises RuntimeError if there is none.
+        """
+        key = uuid.uuid4().hex
+        row = (key, time.time(), json.dumps(payload, default=str))
+        if on_sent:
+            self.callbacks[key] = on_sent
+        if not get_writer().enqueue(row, sql=INSERT_OUTBOX_SQL, timeout=UPLOAD_ENQUEUE_TIMEOUT_S):
+            self.callbacks.pop(key, None)
+            raise RuntimeError("Log writer queue full; upload payload not stored")
+        self.wakeup.set()
+        return key
+
+    def stop(self, timeout=2):
+        self.running = False
+        self.wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def pending(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE sent_at IS NULL AND failed_at IS NULL").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _backoff(self):
+        delay = min(UPLOAD_BACKOFF_MAX_S, UPLOAD_BACKOFF_BASE_S * (2 ** (self.failures - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _pending_batch(self, conn):
+        return conn.execute(
+            "SELECT id, idem_key, payload, attempts FROM outbox WHERE sent_at IS NULL AND failed_at IS NULL"
+            " ORDER BY id LIMIT ?",
+            (self.limit,),
+        ).fetchall()
+
+    def _post(self, rows):
+        keys = [row[1] for row in rows]
+        body = {
+            "batch_id": hashlib.sha256("".join(keys).encode()).hexdigest(),
+            "items": [{"idempotency_key": key, "payload": json.loads(payload)} for _, key, payload, _ in rows],
+        }
+        data = gzip.compress(json.dumps(body).encode("utf-8"))
+        t0 = time.perf_counter()
+        try:
+            with span("http.post", "http", endpoint="outbox", items=len(rows), bytes=len(data)):
+                resp = self.session.post(self.endpoint, data=data, timeout=self.timeout,
+                                         headers={"Idempotency-Key": body["batch_id"]})
+        except Exception as e:
+            return None, str(e)
+        finally:
+            self.post_hist.observe(time.perf_counter() - t0)
+        if 200 <= resp.status_code < 300:
+            return resp.status_code, None
+        return resp.status_code, f"HTTP {resp.status_code}"
+
+    def _record(self, conn, rows, status, err):
+        """Store the outcome of one post; returns True if the next batch may go out right away."""
+        permanent = err is not None and is_permanent(status)
+        if permanent and len(rows) > 1:
+            # Halve the batch until the rejected item is alone
+            self.limit = max(1, len(rows) // 2)
+            self.last_status, self.last_error = status, err
+            return True
+        now = time.time()
+        updates, dead = [], set()
+        for row_id, key, _, attempts in rows:
+            # Only answered attempts count towards the cap
+            attempts += status is not None
+            failed = err is not None and (permanent or attempts >= self.max_attempts)
+            if failed:
+                dead.add(key)
+            updates.append((now if err is None else None, now if failed else None, attempts, err, row_id))
+        with DB_WRITE_LOCK:
+            conn.executemany("UPDATE outbox SET sent_at = ?, failed_at = ?, attempts = ?, last_error = ? WHERE id = ?",
+                             updates)
+            conn.commit()
+        if dead:
+            print(f"[UPLOAD] Dead-lettered {len(dead)} item(s) after {err}")
+            self.limit = self.batch_size
+        if err is None:
+            self.failures = 0
+            self.retry_at = 0.0
+            self.limit = min(self.batch_size, self.limit * 2)
+        elif not permanent:
+            # Back off per endpoint, not per row, so retries go out as full batches
+            self.failures += 1
+            self.retry_at = time.time() + self._backoff()
+        self.last_status, self.last_error = status, err
+        for _, key, _, _ in rows:
+            cb = self.callbacks.pop(key, None) if err is None or key in dead else self.callbacks.get(key)
+            if cb:
+                try:
+                    cb(status, err)
+                except Exception as e:
+                    print(f"[UPLOAD] Callback error: {e}")
+        return err is None or permanent
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        try:
+            while self.running:
+                backoff = self.retry_at - time.time()
+                if backoff > 0:
+                    self.wakeup.wait(backoff)
+                    self.wakeup.clear()
+                    continue
+                # Make sure payloads handed to the LogWriter are on disk before we look
+                flush_logs()
+                rows = self._pending_batch(conn)
+                if rows:
+                    status, err = self._post(rows)
+                    if self._record(conn, rows, status, err):
+                        continue
+                else:
+                    self.wakeup.wait(self.poll_s)
+                    self.wakeup.clear()
+        finally:
+            conn.close()
+            self.session.close()
+
+_uploader = None
+_uploader_lock = threading.Lock()
+
+def get_uploader():
+    """Return the process-wide Uploader, starting it on first use."""
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None or not _uploader.is_alive():
+            _uploader = Uploader()
+            _uploader.start()
+        return _uploader
+
+def enqueue_upload(payload, on_sent=None):
+    return get_uploader().enqueue(payload, on_sent)
+
+def stop_uploader(timeout=2):
+    global _uploader
+    with _uploader_lock:
+        uploader, _uploader = _uploader, None
+    if uploader is not None:
+        uploader.stop(timeout)